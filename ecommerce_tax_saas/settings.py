@@ -103,6 +103,30 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Set once SaleTransaction is range-partitioned by month (manage.py partition_sale_transactions)
+SALE_TRANSACTION_PARTITIONED = os.environ.get('SALE_TRANSACTION_PARTITIONED', 'False') == 'True'
+
+# Concurrent Shopee get_order_detail requests per tenant sync
+SHOPEE_DETAIL_CONCURRENCY = int(os.environ.get('SHOPEE_DETAIL_CONCURRENCY', 4))
+
+# Maximum points (buckets x platforms) of the analytics chart when granularity=auto
+ANALYTICS_CHART_MAX_POINTS = int(os.environ.get('ANALYTICS_CHART_MAX_POINTS', 400))
+
+# Cache (Redis in production, per-process memory otherwise)
+if os.environ.get('CACHE_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['CACHE_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
 # Celery Configuration
 CELERY_BROKER_URL = 'redis://localhost:6379/0'
 CELERY_RESULT_BACKEND = 'redis://localhost:6379/0'
@@ -111,15 +135,36 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'UTC'
 
+# Marketplace rate limits per app (requests per second, burst), shared by all workers via Redis
+MARKETPLACE_RATE_LIMIT_URL = os.environ.get('RATE_LIMIT_REDIS_URL', CELERY_BROKER_URL)
+MARKETPLACE_RATE_LIMITS = {
+    'SHOPEE': (float(os.environ.get('SHOPEE_RATE_LIMIT', 10)), 20), # per partner_id
+    'ML': (float(os.environ.get('ML_RATE_LIMIT', 20)), 40), # per client_id
+}
+
+# Per-tenant order collection runs on its own queue so it cannot starve other tasks
+CELERY_TASK_ROUTES = {
+    'finance_core.tasks.fetch_orders_for_tenant': {'queue': 'ingestion'},
+    'finance_core.tasks.run_simulation_job': {'queue': 'simulation'}, # Long-running, kept off the default queue
+}
+
 from celery.schedules import crontab
 
 CELERY_BEAT_SCHEDULE = {
-    'renew-platform-tokens-every-hour': {
-        'task': 'finance_core.tasks.renew_all_platform_tokens',
-        'schedule': crontab(minute=0, hour='*/1'), # Every hour
+    'schedule-token-refreshes': {
+        'task': 'finance_core.tasks.schedule_token_refreshes',
+        'schedule': crontab(minute='*/10'), # Every 10 minutes; each refresh runs at expiry minus the lead time
     },
     'fetch-new-orders-every-30-min': {
         'task': 'finance_core.tasks.fetch_all_new_orders',
         'schedule': crontab(minute='*/30'), # Every 30 minutes
     },
+    'reconcile-daily-profit-summaries-nightly': {
+        'task': 'finance_core.tasks.reconcile_daily_profit_summaries',
+        'schedule': crontab(minute=0, hour=3), # Every night at 03:00
+    },
+    'purge-simulation-jobs-nightly': {
+        'task': 'finance_core.tasks.purge_simulation_jobs',
+        'schedule': crontab(minute=30, hour=3), # Every night at 03:30
+    },
 }
@@ -2,7 +2,7 @@ from django.contrib import admin
 from django.utils.html import format_html
 from django.utils import timezone
 from datetime import timedelta
-from .models import Organization, TaxProfile, LogisticsCostTable, IntegrationErrorLog, IntegrationProfile, SaleTransaction, ProductCost
+from .models import Organization, TaxProfile, LogisticsCostTable, IntegrationErrorLog, IntegrationProfile, SaleTransaction, SaleItem, ProductCost, SyncCursor, CollectionRun, SimulationJob
 
 class IntegrationProfileInline(admin.StackedInline):
     model = IntegrationProfile
@@ -55,7 +55,7 @@ class TaxProfileAdmin(admin.ModelAdmin):
     
     fieldsets = (
         ('Basic Info', {
-            'fields': ('organization', 'regime')
+            'fields': ('organization', 'regime', 'origin_uf')
         }),
         ('Fiscal Benefits (Minas Gerais / TTS)', {
             'classes': ('collapse',),
@@ -98,5 +98,22 @@ class IntegrationErrorLogAdmin(admin.ModelAdmin):
     short_error.short_description = 'Error Message'
 
 # Register other models simply
-admin.site.register(SaleTransaction)
+class SaleItemInline(admin.TabularInline):
+    model = SaleItem
+    extra = 0
+
+@admin.register(SaleTransaction)
+class SaleTransactionAdmin(admin.ModelAdmin):
+    list_display = ('external_id', 'platform', 'organization', 'amount', 'cogs_amount', 'net_margin', 'transaction_date')
+    list_filter = ('platform', 'organization')
+    search_fields = ('external_id',)
+    inlines = [SaleItemInline]
+
 admin.site.register(ProductCost)
+admin.site.register(SyncCursor)
+admin.site.register(CollectionRun)
+
+@admin.register(SimulationJob)
+class SimulationJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'organization', 'status', 'processed_count', 'total_count', 'created_at', 'finished_at')
+    list_filter = ('status',)
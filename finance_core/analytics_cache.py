@@ -0,0 +1,47 @@
+"""
+Response cache of the analytics endpoints.
+
+Every organization has a generation counter that is bumped whenever a rewrite of its
+transactions or daily rollups commits (ingestion, margin recalculation, reconcile). Cached responses
+and ETags embed the generation, so a write makes them unreachable at once and nothing
+has to be deleted. Queries without an organization use a global generation bumped on
+every write.
+"""
+import hashlib
+import time
+from django.core.cache import cache
+
+ANALYTICS_CACHE_TIMEOUT = 15 * 60 # Safety net; invalidation is generation driven
+
+ALL_ORGANIZATIONS = 'all'
+
+def _generation_key(organization_id):
+    return f'analytics:{organization_id}:generation'
+
+def get_generation(organization_id=None):
+    """
+    Current generation of an organization (or of the whole dataset when organization_id is None).
+    """
+    key = _generation_key(organization_id or ALL_ORGANIZATIONS)
+    # Seeded with a timestamp, so a counter lost to eviction never restarts at a value already used
+    cache.add(key, time.time_ns(), timeout=None)
+    return cache.get(key)
+
+def bump_generation(organization_id):
+    """
+    Invalidates the cached analytics of an organization and the cross-organization ones.
+    """
+    for key in (_generation_key(organization_id), _generation_key(ALL_ORGANIZATIONS)):
+        try:
+            cache.incr(key)
+        except ValueError: # Not set yet (or evicted): any new value is unseen
+            cache.set(key, time.time_ns(), timeout=None)
+
+def analytics_cache_key(endpoint, organization_id, params):
+    """
+    Returns (cache key, ETag) for a response of an endpoint for the current generation.
+    params is a tuple of the request filters that shape the response.
+    """
+    generation = get_generation(organization_id)
+    digest = hashlib.md5(repr((endpoint, organization_id, params)).encode()).hexdigest()
+    return f'analytics:{organization_id or ALL_ORGANIZATIONS}:{generation}:{digest}', f'"{generation}-{digest}"'
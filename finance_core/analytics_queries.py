@@ -0,0 +1,155 @@
+"""
+Single-scan aggregation for the net margin analytics.
+
+The KPIs (grand total), the per-platform totals and the daily chart (day x platform) come
+from one query. On PostgreSQL it is a GROUP BY GROUPING SETS ((day, platform), (platform), ());
+other backends group by (day, platform) and the coarser levels are summed from those rows
+in Python, which is still a single scan of the filtered set.
+
+The chart is bucketed in SQL by day, week or month; 'auto' picks the finest bucket that keeps
+the number of points under ANALYTICS_CHART_MAX_POINTS.
+"""
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+from django.db import connections
+from django.conf import settings
+from django.db.models import Sum, F, DateField
+from django.db.models.functions import Trunc, TruncDate
+
+# Response measure -> aggregated column (the revenue column depends on the source table)
+MEASURES = {
+    'revenue': None,
+    'net_margin': 'net_margin',
+    'taxes': 'tax_amount',
+    'commissions': 'commission_amount',
+    'cogs': 'cogs_amount',
+    'logistics': 'total_logistics',
+}
+
+ZERO = Decimal(0)
+
+GRANULARITIES = ('day', 'week', 'month')
+
+def bucket_count(start, end, granularity):
+    """
+    Number of calendar buckets (days, ISO weeks or months) between two dates, both included.
+    """
+    end = max(start, end)
+    if granularity == 'day':
+        return (end - start).days + 1
+    if granularity == 'week':
+        return ((end - timedelta(days=end.weekday())) - (start - timedelta(days=start.weekday()))).days // 7 + 1
+    return (end.year - start.year) * 12 + end.month - start.month + 1
+
+def choose_granularity(granularity, date_range, series):
+    """
+    Resolves 'auto' to the finest granularity whose points (buckets x series) fit the budget.
+    date_range is the (start, end) dates of the filter; an open range (None) is bucketed by month.
+    """
+    if granularity != 'auto':
+        return granularity
+    if date_range is None:
+        return 'month'
+    for candidate in GRANULARITIES:
+        if bucket_count(*date_range, candidate) * series <= settings.ANALYTICS_CHART_MAX_POINTS:
+            return candidate
+    return 'month'
+
+def bucket_expression(field, granularity):
+    """
+    Start date of the bucket of a DateField or DateTimeField column.
+    """
+    if granularity == 'day':
+        return TruncDate(field) if field == 'transaction_date' else F(field)
+    return Trunc(field, granularity, output_field=DateField())
+
+def columnar_chart(points, granularity):
+    """
+    Pivots [{date, platform, revenue, net_margin}] into parallel arrays:
+    {granularity, dates: [...], series: {platform: {revenue: [...], net_margin: [...]}}}.
+    Buckets without sales for a platform are 0.
+    """
+    dates = sorted({point['date'] for point in points})
+    position = {date: i for i, date in enumerate(dates)}
+    series = {}
+    for point in points:
+        columns = series.setdefault(point['platform'], {'revenue': [ZERO] * len(dates), 'net_margin': [ZERO] * len(dates)})
+        columns['revenue'][position[point['date']]] = point['revenue']
+        columns['net_margin'][position[point['date']]] = point['net_margin']
+    return {'granularity': granularity, 'dates': dates, 'series': series}
+
+def _columns(revenue_field):
+    return {measure: column or revenue_field for measure, column in MEASURES.items()}
+
+def _grouping_sets(queryset, revenue_field, day_expression):
+    """
+    PostgreSQL: one GROUPING SETS query over the filtered rows. Yields (level, day, platform, measures).
+    """
+    columns = _columns(revenue_field)
+    inner = queryset.order_by().annotate(_day=day_expression).values(
+        '_day', 'platform', **{f'_{measure}': F(column) for measure, column in columns.items()}
+    )
+    inner_sql, params = inner.query.get_compiler(using=queryset.db).as_sql()
+    sums = ', '.join(f'SUM(_{measure})' for measure in columns)
+    sql = (
+        f'SELECT GROUPING(_day, platform), CAST(CAST(_day AS date) AS text), platform, {sums} '
+        f'FROM ({inner_sql}) AS filtered '
+        'GROUP BY GROUPING SETS ((_day, platform), (platform), ())'
+    )
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(sql, params)
+        for grouping, day, platform, *values in cursor.fetchall():
+            # GROUPING() bitmask: 0 = (day, platform), 2 = (platform), 3 = ()
+            yield grouping, day, platform, dict(zip(columns, values))
+
+def _grouped_rows(queryset, revenue_field, day_expression):
+    """
+    Fallback: one (day, platform) GROUP BY, the platform and grand totals are summed in Python.
+    """
+    columns = _columns(revenue_field)
+    rows = queryset.annotate(_day=day_expression).values('_day', 'platform').annotate(
+        **{f'_{measure}': Sum(column) for measure, column in columns.items()}
+    ).order_by()
+
+    platforms = defaultdict(lambda: dict.fromkeys(columns, ZERO))
+    total = dict.fromkeys(columns, ZERO)
+    for row in rows:
+        measures = {measure: row[f'_{measure}'] for measure in columns}
+        yield 0, row['_day'].isoformat(), row['platform'], measures
+        for measure, value in measures.items():
+            platforms[row['platform']][measure] += value or ZERO
+            total[measure] += value or ZERO
+
+    for platform, measures in platforms.items():
+        yield 2, None, platform, measures
+    yield 3, None, None, total
+
+def aggregate_net_margin(queryset, revenue_field, day_expression):
+    """
+    Aggregates a SaleTransaction or DailyProfitSummary queryset in a single scan.
+    day_expression is the chart bucket (see bucket_expression).
+    Returns (totals, platform_totals, chart): totals and each platform_totals[platform] map every
+    MEASURES key to a Decimal; chart is a list of {date, platform, revenue, net_margin} ordered by bucket.
+    """
+    backend = _grouping_sets if connections[queryset.db].vendor == 'postgresql' else _grouped_rows
+
+    totals = {measure: ZERO for measure in MEASURES}
+    platform_totals = {}
+    chart = []
+    for level, day, platform, measures in backend(queryset, revenue_field, day_expression):
+        measures = {measure: value or ZERO for measure, value in measures.items()}
+        if level == 0:
+            chart.append({
+                "date": day,
+                "platform": platform,
+                "revenue": measures['revenue'],
+                "net_margin": measures['net_margin'],
+            })
+        elif level == 2:
+            platform_totals[platform] = measures
+        else:
+            totals = measures
+
+    chart.sort(key=lambda point: (point['date'], point['platform']))
+    return totals, platform_totals, chart
@@ -1,16 +1,30 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from django.db.models import Sum, F
-from django.db.models.functions import TruncDate
-from .models import SaleTransaction
+from django.db.models import Sum, Count, F, Value, Window, ExpressionWrapper, DecimalField
+from django.db.models.functions import Coalesce, Round
+from django.utils.cache import patch_cache_control
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.http import parse_etags
+from django.core.cache import cache
+from .models import SaleTransaction, DailyProfitSummary, SimulationJob, SimulationResultPage
+from .tax_engine import SIMULATION_REGIMES, NO_TAX
+from .analytics_cache import analytics_cache_key, ANALYTICS_CACHE_TIMEOUT
+from .cubes import query_cube, choose_source, CubeQueryError, DIMENSIONS as CUBE_DIMENSIONS
+from .simulation_jobs import unpack
+from .tasks import submit_simulation_job
+from .simulation import simulation_params, params_scenarios, simulation_queryset, simulate_monthly, filter_date_range
+from .analytics_queries import aggregate_net_margin, choose_granularity, bucket_expression, columnar_chart, GRANULARITIES
 from decimal import Decimal
 from datetime import datetime
 
 class NetMarginAnalyticsView(APIView):
     """
     Endpoint for Profitability Analytics.
-    Returns aggregated KPIs and daily evolution chart data.
+    Returns aggregated KPIs and the margin evolution chart, bucketed by 'granularity'
+    (day, week, month or auto, the default: the finest one under ANALYTICS_CHART_MAX_POINTS points).
+    Responses are cached per (organization, start_date, end_date, platform, granularity) until the organization's
+    data changes, and carry an ETag: a matching If-None-Match gets a 304 without touching the database.
     """
     def get(self, request):
         # Filters
@@ -18,158 +32,331 @@ class NetMarginAnalyticsView(APIView):
         end_date = request.query_params.get('end_date')
         platform = request.query_params.get('platform') # 'ML', 'SHOPEE', or 'ALL' (default)
         organization_id = request.query_params.get('organization_id') # Optional if we want to filter by org
+        granularity = request.query_params.get('granularity', 'auto')
 
-        queryset = SaleTransaction.objects.all()
+        if granularity != 'auto' and granularity not in GRANULARITIES:
+            return Response({"error": f"granularity must be auto, {', '.join(GRANULARITIES)}"}, status=status.HTTP_400_BAD_REQUEST)
+
+        return _cached_response(
+            request, 'net-margin', organization_id, (start_date, end_date, platform or 'ALL', granularity),
+            lambda: self.build(start_date, end_date, platform, organization_id, granularity)
+        )
+
+    def build(self, start_date, end_date, platform, organization_id, granularity):
+        # Whole-day ranges (YYYY-MM-DD) are answered from the precomputed daily rollup.
+        # Ranges with a time component fall back to the raw transactions.
+        start_day = parse_date(start_date) if start_date else None
+        end_day = parse_date(end_date) if end_date else None
+        use_rollup = (not start_date or start_day is not None) and (not end_date or end_day is not None)
+
+        if use_rollup:
+            queryset = DailyProfitSummary.objects.all()
+            if start_day:
+                queryset = queryset.filter(date__gte=start_day)
+            if end_day:
+                queryset = queryset.filter(date__lte=end_day)
+            revenue_field, date_field = 'revenue', 'date'
+        else:
+            queryset = SaleTransaction.objects.all()
+            if start_date:
+                queryset = queryset.filter(transaction_date__gte=start_date)
+            if end_date:
+                queryset = queryset.filter(transaction_date__lte=end_date)
+            revenue_field, date_field = 'amount', 'transaction_date'
 
         if organization_id:
             queryset = queryset.filter(organization_id=organization_id)
-
-        if start_date:
-            queryset = queryset.filter(transaction_date__gte=start_date)
-        if end_date:
-            queryset = queryset.filter(transaction_date__lte=end_date)
         
         if platform and platform != 'ALL':
             queryset = queryset.filter(platform=platform)
 
-        # 1. Aggregated KPIs
-        # We need to sum up Revenue, Taxes, Logistics, Net Margin.
-        # Note: Taxes and Logistics are not single fields in SaleTransaction directly in a simple way 
-        # (we have calculated_fixed_cost and shipping_cost_platform, but taxes are calculated in utils).
-        # Ideally, we should have stored 'tax_cost' and 'total_logistics_cost' in SaleTransaction for easier aggregation.
-        # Since we only have 'net_margin' stored, we can sum that easily.
-        # For Revenue: 'amount'.
-        # For others: We might need to estimate or if we had stored them.
-        # Prompt says: "Retornar... Receita Total, CMV, Total de Impostos... e Margem Líquida".
-        # Since we didn't store 'taxes' and 'cogs' explicitly in SaleTransaction in previous steps (only net_margin),
-        # we will have to derive them or return what we have.
-        # However, for a robust dashboard, let's assume we can calculate them or we stored them.
-        # Given the constraints, I will sum 'amount' and 'net_margin'. 
-        # For Taxes/Logistics/CMV, I will calculate them on the fly or return 0 if not available, 
-        # BUT to satisfy the prompt "Retornar... CMV... Impostos", I'll add a note or try to approximate if possible.
-        # Actually, let's look at the model again. We have 'net_margin'.
-        # Revenue - Net Margin = Total Costs.
-        # We can't easily break down Total Costs without storing components.
-        # I will implement the aggregation for what we have and maybe add placeholders or derived values.
-        
-        # To do this properly as a Senior Engineer, I should have added these fields to the model.
-        # But I can't go back and change the model easily without migrations in this flow (though I could).
-        # Let's stick to what we have: Revenue and Net Margin are the most critical.
-        # I will calculate 'Total Costs' as Revenue - Net Margin.
-        
-        aggregates = queryset.aggregate(
-            total_revenue=Sum('amount'),
-            total_net_margin=Sum('net_margin'),
-            total_platform_shipping=Sum('shipping_cost_platform'),
-            total_fixed_logistics=Sum('calculated_fixed_cost')
+        series = 1 if platform and platform != 'ALL' else len(SaleTransaction.PLATFORM_CHOICES)
+        granularity = choose_granularity(granularity, _date_range(start_date, end_date), series)
+
+        # KPIs, per-platform KPIs and the chart (bucket x platform) in a single scan.
+        # The margin engine persists the cost breakdown (taxes, commissions, CMV, logistics)
+        # on every transaction, so each KPI is a single SUM.
+        totals, platform_totals, chart_data = aggregate_net_margin(
+            queryset, revenue_field, bucket_expression(date_field, granularity)
         )
-        
-        total_revenue = aggregates['total_revenue'] or Decimal(0)
-        total_net_margin = aggregates['total_net_margin'] or Decimal(0)
-        
-        # 2. Daily Chart Data
-        # Group by Date and Platform
-        daily_data = queryset.annotate(
-            date=TruncDate('transaction_date')
-        ).values('date', 'platform').annotate(
-            daily_revenue=Sum('amount'),
-            daily_net_margin=Sum('net_margin')
-        ).order_by('date')
-        
-        # Format for Frontend (Array of objects)
-        chart_data = []
-        for entry in daily_data:
-            chart_data.append({
-                "date": entry['date'].strftime('%Y-%m-%d'),
-                "platform": entry['platform'],
-                "revenue": entry['daily_revenue'],
-                "net_margin": entry['daily_net_margin']
-            })
 
-        return Response({
-            "kpis": {
-                "revenue": total_revenue,
-                "net_margin": total_net_margin,
-                "total_costs": total_revenue - total_net_margin, # Approximation
-                "margin_percentage": (total_net_margin / total_revenue * 100) if total_revenue > 0 else 0
-            },
-            "daily_chart": chart_data
-        })
+        return {
+            "kpis": _kpis(totals),
+            "platform_kpis": {platform: _kpis(measures) for platform, measures in platform_totals.items()},
+            "chart": columnar_chart(chart_data, granularity)
+        }
+
+def _cached_response(request, endpoint, organization_id, params, build):
+    """
+    Serves build() through the analytics cache of the organization, with an ETag.
+    A matching If-None-Match gets a 304 without touching the database.
+    """
+    cache_key, etag = analytics_cache_key(endpoint, organization_id, params)
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        data = cache.get(cache_key)
+        if data is None:
+            data = build()
+            cache.set(cache_key, data, ANALYTICS_CACHE_TIMEOUT)
+        response = Response(data)
+
+    response['ETag'] = etag
+    # Let the browser keep the body but revalidate it on every request
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+def _parse_month(value):
+    if not value:
+        return None
+    month = parse_date(f'{value}-01') # Raises ValueError for an impossible month
+    if month is None:
+        raise ValueError(f"Invalid month '{value}', expected YYYY-MM")
+    return month
+
+def _date_range(start_date, end_date):
+    """
+    (start, end) dates of a start/end filter (dates or datetimes); None when open or unparseable.
+    """
+    bounds = []
+    for value in (start_date, end_date):
+        parsed = value and (parse_date(value) or parse_datetime(value))
+        if not parsed:
+            return None
+        bounds.append(parsed.date() if isinstance(parsed, datetime) else parsed)
+    return tuple(bounds)
+
+def _kpis(totals):
+    total_revenue = totals['revenue']
+    total_net_margin = totals['net_margin']
+    return {
+        "revenue": total_revenue,
+        "net_margin": total_net_margin,
+        "taxes": totals['taxes'],
+        "commissions": totals['commissions'],
+        "cogs": totals['cogs'],
+        "logistics": totals['logistics'],
+        "total_costs": totals['taxes'] + totals['commissions'] + totals['cogs'] + totals['logistics'],
+        "margin_percentage": (total_net_margin / total_revenue * 100) if total_revenue > 0 else 0
+    }
+
+class ProfitCubeView(APIView):
+    """
+    Endpoint for slicing margins by any combination of dimensions.
+    Answered from the materialized monthly cubes when they cover the request, otherwise
+    aggregated on the fly from the transactions (or line items, for 'sku').
+
+    Query params:
+        organization_id (required)
+        dimensions: comma separated, among month, platform, transaction_shipping_method, is_fixed_cost_applied, sku
+        measures: comma separated (default revenue,net_margin), among order_count, quantity, revenue,
+                  net_margin, taxes, commissions, cogs, logistics (availability depends on the dimensions)
+        platform, start_month, end_month (YYYY-MM, inclusive): optional filters
+    Returns the rows as parallel arrays under 'columns', ordered by the dimensions.
+    """
+    def get(self, request):
+        organization_id = request.query_params.get('organization_id')
+        dimensions = [name for name in request.query_params.get('dimensions', '').split(',') if name]
+        measures = [name for name in request.query_params.get('measures', 'revenue,net_margin').split(',') if name]
+        platform = request.query_params.get('platform')
+        platform = None if platform == 'ALL' else platform
+        start_month = request.query_params.get('start_month')
+        end_month = request.query_params.get('end_month')
+
+        if not organization_id:
+            return Response({"error": "organization_id is required"}, status=status.HTTP_400_BAD_REQUEST)
+        unknown = set(dimensions) - set(CUBE_DIMENSIONS)
+        if unknown:
+            return Response({"error": f"Unknown dimensions: {', '.join(sorted(unknown))}"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            source = choose_source(dimensions, measures)
+            months = [_parse_month(start_month), _parse_month(end_month)]
+        except (CubeQueryError, ValueError) as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return _cached_response(
+            request, 'cube', organization_id, (tuple(dimensions), tuple(measures), platform, start_month, end_month),
+            lambda: self.build(organization_id, dimensions, measures, platform, *months, source)
+        )
+
+    def build(self, organization_id, dimensions, measures, platform, start_month, end_month, source):
+        source, rows = query_cube(organization_id, dimensions, measures, platform, start_month, end_month, source)
+        columns = {name: [row[name] for row in rows] for name in (*dimensions, *measures)}
+        if 'month' in columns:
+            columns['month'] = [month.strftime('%Y-%m') for month in columns['month']]
+        return {
+            "source": source.name,
+            "dimensions": dimensions,
+            "measures": measures,
+            "columns": columns,
+        }
+
+MONEY = DecimalField(max_digits=14, decimal_places=2)
+RATE = DecimalField(max_digits=9, decimal_places=6)
 
 class TaxSimulationView(APIView):
     """
     Endpoint to simulate different tax regimes on transactions.
+    The simulation runs in the database: one query returns the per-transaction results
+    and the totals (window SUM), or only the totals when 'aggregate_only' is set.
+
+    Body:
+        simulated_regime: 'SIMPLES', 'PADRAO' or 'EFETIVA_1'
+        transaction_ids: list of ids, or
+        organization_id + optional start_date/end_date/platform to simulate a whole range
+        aggregate_only: return only the totals
+
+    mode 'monthly': every regime x rate scenario at once over the organization's history, per month
+    (NumPy, integer centavos; see simulation.py).
+        organization_id, regimes (default: all), rate_scenarios ({regime: [rates]}, optional),
+        months (default 24, ending in the current month) or start_date/end_date, platform
     """
     def post(self, request):
+        if request.data.get('mode') == 'monthly':
+            return self.monthly(request)
+
         transaction_ids = request.data.get('transaction_ids', [])
         simulated_regime = request.data.get('simulated_regime') # 'SIMPLES', 'PADRAO', 'EFETIVA_1'
+        organization_id = request.data.get('organization_id')
+        aggregate_only = bool(request.data.get('aggregate_only', False))
         
-        if not transaction_ids or not simulated_regime:
+        if not (transaction_ids or organization_id) or not simulated_regime:
             return Response({"error": "Missing params"}, status=status.HTTP_400_BAD_REQUEST)
-            
-        transactions = SaleTransaction.objects.filter(id__in=transaction_ids)
+
+        queryset = SaleTransaction.objects.filter(net_margin__isnull=False)
+        if transaction_ids:
+            queryset = queryset.filter(id__in=transaction_ids)
+        if organization_id:
+            queryset = queryset.filter(organization_id=organization_id)
+        queryset = filter_date_range(queryset, request.data.get('start_date'), request.data.get('end_date'))
+        platform = request.data.get('platform')
+        if platform and platform != 'ALL':
+            queryset = queryset.filter(platform=platform)
+
+        # New Margin = (Net Margin + Old Taxes) - New Taxes
+        # Old Taxes are persisted by the margin engine (tax_amount).
+        rate = SIMULATION_REGIMES.get(simulated_regime, NO_TAX).total # Unknown regime: no tax
+        # Rounded to the cent in SQL (half away from zero, like the margin engine)
+        simulated_tax = ExpressionWrapper(F('amount') * Value(rate, output_field=RATE), output_field=MONEY)
+        simulated_margin = Round(
+            F('net_margin') + Coalesce(F('tax_amount'), Value(Decimal(0), output_field=MONEY)) - simulated_tax,
+            2,
+            output_field=MONEY
+        )
+        queryset = queryset.annotate(simulated_tax=simulated_tax, simulated_margin=simulated_margin)
+
+        if aggregate_only:
+            totals = queryset.aggregate(
+                total_count=Count('id'),
+                total_revenue=Sum('amount'),
+                total_current_margin=Sum('net_margin'),
+                total_simulated_tax=Sum('simulated_tax'),
+                total_simulated_margin=Sum('simulated_margin'),
+            )
+            return Response({"simulated_regime": simulated_regime, "totals": _simulation_totals(totals)})
+
+        window = {'partition_by': [], 'order_by': []}
+        rows = queryset.annotate(
+            total_count=Window(Count('id'), **window),
+            total_revenue=Window(Sum('amount'), **window),
+            total_current_margin=Window(Sum('net_margin'), **window),
+            total_simulated_tax=Window(Sum('simulated_tax'), **window),
+            total_simulated_margin=Window(Sum('simulated_margin'), **window),
+        ).order_by('id').values(
+            'id', 'external_id', 'amount', 'net_margin', 'simulated_margin',
+            'total_count', 'total_revenue', 'total_current_margin', 'total_simulated_tax', 'total_simulated_margin'
+        )
+
         results = []
-        
-        for transaction in transactions:
-            revenue = transaction.amount
-            
-            # Recalculate Tax based on regime
-            simulated_tax = Decimal(0)
-            
-            if simulated_regime == 'SIMPLES':
-                # Simplified 6%
-                simulated_tax = revenue * Decimal('0.06')
-            elif simulated_regime == 'PADRAO':
-                # Standard 27.25% (18% ICMS + 9.25% PIS/COFINS)
-                simulated_tax = revenue * Decimal('0.2725')
-            elif simulated_regime == 'EFETIVA_1':
-                # Effective 1% ICMS + 9.25% PIS/COFINS = 10.25%
-                simulated_tax = revenue * Decimal('0.1025')
-            else:
-                simulated_tax = Decimal(0) # Unknown
-            
-            # Get other costs (We need to reverse engineer or assume them since we didn't store them explicitly)
-            # Net Margin = Revenue - Costs - Taxes
-            # Costs = Revenue - Net Margin - Taxes(Original)
-            # But we don't have Taxes(Original) stored easily.
-            # Let's approximate: Costs = Revenue - Net Margin (assuming current margin includes everything)
-            # Wait, Net Margin = Revenue - (ProductCost + Logistics + Commissions + Taxes)
-            # We want: New Margin = Revenue - (ProductCost + Logistics + Commissions) - New Taxes
-            # New Margin = (Revenue - (ProductCost + Logistics + Commissions)) - New Taxes
-            # New Margin = (Net Margin + Old Taxes) - New Taxes
-            
-            # We need Old Taxes to do this accurately.
-            # Let's re-calculate Old Taxes using the same logic as utils.py
-            # This is a bit redundant but necessary without storage.
-            
-            organization = transaction.organization
-            tax_profile = getattr(organization, 'tax_profile', None)
-            old_taxes = Decimal(0)
-            
-            # Re-run tax logic from utils.py (Simplified copy)
-            if tax_profile:
-                if tax_profile.icms_benefit_flag:
-                    old_taxes += revenue * (tax_profile.effective_tax_rate / 100)
-                    old_taxes += revenue * Decimal('0.0925')
-                else:
-                    standard_rate = Decimal('0.18') + Decimal('0.0925')
-                    old_taxes = revenue * standard_rate
-                    # We ignore credits here for simplicity or assume they are part of the net calculation
-                    # Ideally we should subtract credits.
-            
-            # Base Profit before Tax
-            profit_pre_tax = transaction.net_margin + old_taxes
-            
-            simulated_net_margin = profit_pre_tax - simulated_tax
-            
+        totals = {}
+        for row in rows:
             results.append({
-                "transaction_id": transaction.id,
-                "external_id": transaction.external_id,
-                "revenue": revenue,
-                "current_margin": transaction.net_margin,
-                "simulated_margin": simulated_net_margin,
-                "diff": simulated_net_margin - transaction.net_margin,
+                "transaction_id": row['id'],
+                "external_id": row['external_id'],
+                "revenue": row['amount'],
+                "current_margin": row['net_margin'],
+                "simulated_margin": row['simulated_margin'],
+                "diff": row['simulated_margin'] - row['net_margin'],
                 "simulated_regime": simulated_regime
             })
+            totals = row
             
-        return Response(results)
+        return Response({
+            "simulated_regime": simulated_regime,
+            "totals": _simulation_totals(totals),
+            "transactions": results
+        })
+
+    def monthly(self, request):
+        try:
+            params = simulation_params(request.data)
+        except (ValueError, ArithmeticError) as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        scenarios = params_scenarios(params)
+        result = simulate_monthly(simulation_queryset(params), scenarios)
+        return Response({"scenarios": _scenarios(params), **result})
+
+class SimulationJobView(APIView):
+    """
+    Asynchronous monthly simulation for large ranges. POST takes the body of TaxSimulationView's
+    'monthly' mode and returns the job (202 when created, 200 when an identical job is reused).
+    """
+    def post(self, request):
+        try:
+            params = simulation_params(request.data)
+        except (ValueError, ArithmeticError) as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        job, created = submit_simulation_job(params)
+        return Response(_job(job), status=status.HTTP_202_ACCEPTED if created else status.HTTP_200_OK)
+
+class SimulationJobDetailView(APIView):
+    """
+    Status and progress of a simulation job, with the monthly totals once it is done.
+    ?page=N adds the N-th page (1-based) of per-transaction results, available as they are computed.
+    """
+    def get(self, request, job_id):
+        job = SimulationJob.objects.filter(id=job_id).first()
+        if not job:
+            return Response({"error": "Simulation job not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        data = _job(job)
+        if job.status == 'DONE':
+            data["result"] = unpack(job.result)
+        page_number = request.query_params.get('page')
+        if page_number:
+            page = SimulationResultPage.objects.filter(job=job, number=page_number if page_number.isdigit() else 0).first()
+            if not page:
+                return Response({"error": f"Page {page_number} not available"}, status=status.HTTP_404_NOT_FOUND)
+            data["page"] = page.number
+            data["transactions"] = unpack(page.data)
+        return Response(data)
+
+def _job(job):
+    return {
+        "id": job.id,
+        "status": job.status,
+        "scenarios": _scenarios(job.params),
+        "processed_count": job.processed_count,
+        "total_count": job.total_count,
+        "page_count": job.page_count,
+        "error": job.error,
+        "created_at": job.created_at,
+        "finished_at": job.finished_at,
+    }
+
+def _scenarios(params):
+    return [{"regime": regime, "rate": Decimal(rate)} for regime, rate in params['scenarios']]
+
+def _simulation_totals(totals):
+    current_margin = totals.get('total_current_margin') or Decimal(0)
+    simulated_margin = totals.get('total_simulated_margin') or Decimal(0)
+    return {
+        "transaction_count": totals.get('total_count') or 0,
+        "revenue": totals.get('total_revenue') or Decimal(0),
+        "simulated_tax": totals.get('total_simulated_tax') or Decimal(0),
+        "current_margin": current_margin,
+        "simulated_margin": simulated_margin,
+        "diff": simulated_margin - current_margin,
+    }
@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class FinanceCoreConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'finance_core'
+
+    def ready(self):
+        from . import signals, checks  # noqa: F401
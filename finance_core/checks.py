@@ -0,0 +1,17 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+from .utils import cache_is_shared
+
+@register(Tags.caches, deploy=True)
+def shared_cache_check(app_configs, **kwargs):
+    """
+    Recalculation scopes, analytics generations and task de-duplication live in the default cache
+    and must be visible to every web and worker process.
+    """
+    if settings.DEBUG or cache_is_shared():
+        return []
+    return [Error(
+        'The default cache is per-process memory (LocMemCache).',
+        hint='Set CACHE_URL to a Redis instance shared by the web and Celery workers.',
+        id='finance_core.E001',
+    )]
@@ -0,0 +1,291 @@
+"""
+Profitability cube: sums of margin measures sliced by any combination of dimensions.
+
+Two monthly cubes are materialized and refreshed together with DailyProfitSummary:
+    ProfitCube     month x platform x transaction_shipping_method x is_fixed_cost_applied
+    SkuProfitCube  month x platform x sku (line items)
+Cube cells are recomputed from the fact tables for whole months; a sync run defers this
+(deferred_cube_refresh) so its months are re-aggregated once instead of once per batch.
+A query is answered by summing the cube whose dimensions cover the requested ones.
+Combinations no cube covers (sku with shipping method or fixed cost) are aggregated on
+the fly from SaleTransaction / SaleItem with the same expressions used to build the cubes.
+"""
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, time
+from decimal import Decimal
+from django.db import transaction as db_transaction
+from django.db.models import Sum, Count, F, Value, DecimalField, DateField, CharField
+from django.db.models.functions import Coalesce, NullIf, TruncMonth
+from django.utils import timezone
+from .models import SaleTransaction, SaleItem, ProfitCube, SkuProfitCube
+from .analytics_cache import bump_generation
+
+MONEY = DecimalField(max_digits=14, decimal_places=2)
+CENTS = Decimal('0.01')
+ZERO = Decimal('0.00')
+
+COUNTS = ('order_count', 'quantity') # Integer measures, the others are money
+
+DIMENSIONS = ('month', 'platform', 'transaction_shipping_method', 'is_fixed_cost_applied', 'sku')
+
+@dataclass(frozen=True)
+class CubeSource:
+    """
+    A fact table or a materialized cube: the expressions to group by, sum and filter on.
+    date_field is compared against month boundaries (local midnights for the fact tables' datetime,
+    so the column stays usable by its index and by partition pruning); platform filters use the
+    'platform' dimension.
+    """
+    name: str
+    model: type
+    dimensions: dict
+    measures: dict
+    organization_field: str
+    date_field: str
+    fact: 'CubeSource' = None # Materialized cubes: the source they are built from
+    fields: dict = None # Materialized cubes: measure -> cube column
+
+def _month(field):
+    return TruncMonth(field, output_field=DateField())
+
+def _shipping_method(field):
+    # Cubes store orders without a shipping method under '' (NULLs would defeat the upsert key)
+    return Coalesce(field, Value(''), output_field=CharField())
+
+def _line_revenue():
+    return F('quantity') * F('unit_price')
+
+def _allocated(field):
+    # Order measure allocated to the line item by its share of the order amount
+    return F(f'transaction__{field}') * _line_revenue() / NullIf(F('transaction__amount'), Value(ZERO))
+
+TRANSACTIONS = CubeSource(
+    name='transactions',
+    model=SaleTransaction,
+    dimensions={
+        'month': _month('transaction_date'),
+        'platform': F('platform'),
+        'transaction_shipping_method': _shipping_method('transaction_shipping_method'),
+        'is_fixed_cost_applied': F('is_fixed_cost_applied'),
+    },
+    measures={
+        'order_count': Count('id'),
+        'revenue': Sum('amount'),
+        'net_margin': Sum('net_margin'),
+        'taxes': Sum('tax_amount'),
+        'commissions': Sum('commission_amount'),
+        'cogs': Sum('cogs_amount'),
+        'logistics': Sum('total_logistics'),
+    },
+    organization_field='organization_id',
+    date_field='transaction_date',
+)
+
+ITEMS = CubeSource(
+    name='items',
+    model=SaleItem,
+    dimensions={
+        'month': _month('transaction__transaction_date'),
+        'platform': F('transaction__platform'),
+        'transaction_shipping_method': _shipping_method('transaction__transaction_shipping_method'),
+        'is_fixed_cost_applied': F('transaction__is_fixed_cost_applied'),
+        'sku': F('sku'),
+    },
+    measures={
+        'quantity': Sum('quantity'),
+        'revenue': Sum(_line_revenue(), output_field=MONEY),
+        'cogs': Sum(F('quantity') * F('unit_cost'), output_field=MONEY),
+        'net_margin': Sum(_allocated('net_margin'), output_field=MONEY),
+    },
+    organization_field='transaction__organization_id',
+    date_field='transaction__transaction_date',
+)
+
+PROFIT_CUBE_FIELDS = {
+    'order_count': 'order_count',
+    'revenue': 'revenue',
+    'net_margin': 'net_margin',
+    'taxes': 'tax_amount',
+    'commissions': 'commission_amount',
+    'cogs': 'cogs_amount',
+    'logistics': 'total_logistics',
+}
+
+PROFIT_CUBE = CubeSource(
+    name='profit_cube',
+    model=ProfitCube,
+    dimensions={name: F(name) for name in ('month', 'platform', 'transaction_shipping_method', 'is_fixed_cost_applied')},
+    measures={name: Sum(field) for name, field in PROFIT_CUBE_FIELDS.items()},
+    organization_field='organization_id',
+    date_field='month',
+    fact=TRANSACTIONS,
+    fields=PROFIT_CUBE_FIELDS,
+)
+
+SKU_CUBE_FIELDS = {
+    'quantity': 'quantity',
+    'revenue': 'revenue',
+    'cogs': 'cogs_amount',
+    'net_margin': 'net_margin',
+}
+
+SKU_CUBE = CubeSource(
+    name='sku_cube',
+    model=SkuProfitCube,
+    dimensions={name: F(name) for name in ('month', 'platform', 'sku')},
+    measures={name: Sum(field) for name, field in SKU_CUBE_FIELDS.items()},
+    organization_field='organization_id',
+    date_field='month',
+    fact=ITEMS,
+    fields=SKU_CUBE_FIELDS,
+)
+
+MATERIALIZED = (PROFIT_CUBE, SKU_CUBE)
+
+# Tried in order: materialized cubes first, then the fact tables
+SOURCES = (PROFIT_CUBE, SKU_CUBE, TRANSACTIONS, ITEMS)
+
+def day_start(day):
+    """
+    Local midnight of a date (the day TruncDate/TruncMonth group a transaction into), timezone-aware.
+    """
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+def _boundary(source, day):
+    return day if source.fact else day_start(day)
+
+def _cents(value):
+    # SQLite sums decimals as floats
+    return (value or ZERO).quantize(CENTS)
+
+class CubeQueryError(ValueError):
+    pass
+
+def choose_source(dimensions, measures):
+    """
+    First source (cubes before fact tables) that has every requested dimension and measure.
+    """
+    for source in SOURCES:
+        if set(dimensions) <= source.dimensions.keys() and set(measures) <= source.measures.keys():
+            return source
+    raise CubeQueryError(f"No source provides dimensions {sorted(dimensions)} with measures {sorted(measures)}")
+
+def query_cube(organization_id, dimensions, measures, platform=None, start_month=None, end_month=None, source=None):
+    """
+    Sums the measures grouped by the dimensions. start_month/end_month are first days of months (inclusive).
+    Returns (source, rows) where rows are dicts of dimension and measure values ordered by the dimensions.
+    """
+    source = source or choose_source(dimensions, measures)
+    queryset = source.model.objects.filter(**{source.organization_field: organization_id})
+    if start_month:
+        queryset = queryset.filter(**{f'{source.date_field}__gte': _boundary(source, start_month)})
+    if end_month:
+        following = end_month.replace(year=end_month.year + end_month.month // 12, month=end_month.month % 12 + 1)
+        queryset = queryset.filter(**{f'{source.date_field}__lt': _boundary(source, following)})
+    if platform:
+        queryset = queryset.alias(_platform=source.dimensions['platform']).filter(_platform=platform)
+
+    # Underscore aliases avoid collisions with the model's own field names
+    sums = {f'_{name}': source.measures[name] for name in measures}
+    if dimensions:
+        rows = queryset.values(**{f'_{name}': source.dimensions[name] for name in dimensions}).annotate(
+            **sums
+        ).order_by(*(f'_{name}' for name in dimensions))
+    else:
+        rows = [queryset.aggregate(**sums)]
+
+    return source, [
+        {
+            **{name: row[f'_{name}'] for name in dimensions},
+            **{name: row[f'_{name}'] or 0 if name in COUNTS else _cents(row[f'_{name}']) for name in measures},
+        }
+        for row in rows
+    ]
+
+# --- Maintenance ---
+
+_deferred = threading.local()
+
+@contextmanager
+def deferred_cube_refresh():
+    """
+    Collects the months passed to refresh_cubes inside the block and refreshes each of them once
+    on exit (also after a failure: cells are recomputed from the committed fact rows).
+    """
+    if getattr(_deferred, 'months', None) is not None: # Nested: the outermost block refreshes
+        yield
+        return
+    _deferred.months = defaultdict(set)
+    try:
+        yield
+    finally:
+        touched, _deferred.months = _deferred.months, None
+        for (organization_id, platform), months in touched.items():
+            with db_transaction.atomic():
+                refresh_cubes(organization_id, platform, months)
+                # Analytics cached since the batches committed were read from the previous cells
+                db_transaction.on_commit(lambda organization_id=organization_id: bump_generation(organization_id))
+
+def refresh_cubes(organization_id, platform, months):
+    """
+    Recomputes the materialized cubes for the given months (first days) of an organization and
+    platform from their fact tables, and drops the combinations that no longer have sales.
+    Inside deferred_cube_refresh the months are only recorded.
+    """
+    months = set(months)
+    if not months:
+        return
+    deferred = getattr(_deferred, 'months', None)
+    if deferred is not None:
+        deferred[(organization_id, platform)].update(months)
+        return
+    for cube in MATERIALIZED:
+        _refresh(cube, organization_id, platform, sorted(months))
+
+def _refresh(cube, organization_id, platform, months):
+    key = list(cube.dimensions)
+    rows = []
+    for month in months:
+        _, month_rows = query_cube(organization_id, key, list(cube.fields), platform=platform,
+                                   start_month=month, end_month=month, source=cube.fact)
+        rows.extend(month_rows)
+
+    cube.model.objects.bulk_create(
+        [
+            cube.model(
+                organization_id=organization_id,
+                **{name: row[name] for name in key},
+                **{field: row[name] for name, field in cube.fields.items()},
+            )
+            for row in rows
+        ],
+        batch_size=500,
+        update_conflicts=True,
+        unique_fields=['organization', *key],
+        update_fields=list(cube.fields.values()),
+    )
+
+    keep = {tuple(row[name] for name in key) for row in rows}
+    stale = [
+        row['id'] for row in cube.model.objects.filter(
+            organization_id=organization_id, platform=platform, month__in=months
+        ).values('id', *key)
+        if tuple(row[name] for name in key) not in keep
+    ]
+    if stale:
+        cube.model.objects.filter(id__in=stale).delete()
+
+def rebuild_cubes(organization_id):
+    """
+    Rebuilds every cube row of an organization (nightly reconcile).
+    """
+    for platform, _ in SaleTransaction.PLATFORM_CHOICES:
+        months = set(SaleTransaction.objects.filter(organization_id=organization_id, platform=platform).annotate(
+            _month=_month('transaction_date')
+        ).order_by().values_list('_month', flat=True).distinct())
+        for cube in MATERIALIZED: # Months left in a cube without sales are emptied
+            months.update(cube.model.objects.filter(organization_id=organization_id, platform=platform).values_list('month', flat=True))
+        refresh_cubes(organization_id, platform, months)
@@ -0,0 +1,55 @@
+"""
+Per-organization cache of LogisticsCostTable rules.
+
+A tenant has a handful of rules, so the whole {(platform, shipping_method): fixed_cost_value}
+map is cached under one key. The key embeds a version stamp that LogisticsCostTable
+save/delete signals replace, so every process sees a change on its next lookup.
+"""
+import time
+from collections import Counter
+from django.core.cache import cache
+from .models import LogisticsCostTable
+
+LOGISTICS_RULES_TIMEOUT = 60 * 60 # Safety net; invalidation is signal driven
+
+_stats = Counter()
+
+def _version_key(organization_id):
+    return f'logistics_rules:{organization_id}:version'
+
+def _rules_key(organization_id, version):
+    return f'logistics_rules:{organization_id}:{version}'
+
+def get_logistics_rules(organization_id):
+    """
+    Returns {(platform, shipping_method): fixed_cost_value} for an organization.
+    """
+    version = cache.get_or_set(_version_key(organization_id), time.time_ns, timeout=None)
+    key = _rules_key(organization_id, version)
+
+    rules = cache.get(key)
+    if rules is not None:
+        _stats['hits'] += 1
+        return rules
+
+    _stats['misses'] += 1
+    rules = {
+        (platform, shipping_method): fixed_cost_value
+        for platform, shipping_method, fixed_cost_value in LogisticsCostTable.objects.filter(
+            organization_id=organization_id
+        ).values_list('platform', 'shipping_method', 'fixed_cost_value')
+    }
+    cache.set(key, rules, LOGISTICS_RULES_TIMEOUT)
+    return rules
+
+def invalidate_logistics_rules(organization_id):
+    """
+    Moves the organization to a new version; the previous entry simply expires.
+    """
+    cache.set(_version_key(organization_id), time.time_ns(), timeout=None)
+
+def logistics_cache_stats():
+    """
+    Hit/miss counters of this process.
+    """
+    return {'hits': _stats['hits'], 'misses': _stats['misses']}
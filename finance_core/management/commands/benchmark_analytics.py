@@ -0,0 +1,99 @@
+import time
+from datetime import timedelta
+from decimal import Decimal
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction as db_transaction
+from django.db.models import Sum
+from django.db.models.functions import TruncDate
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from finance_core.analytics_queries import aggregate_net_margin
+from finance_core.models import Organization, SaleTransaction
+from finance_core.utils import CENTS
+
+class _Rollback(Exception):
+    pass
+
+class Command(BaseCommand):
+    help = ('Benchmarks the net margin analytics aggregation: separate KPI aggregate + daily group-by '
+            'against the single-scan aggregate_net_margin (data is rolled back)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', nargs='+', type=int, default=[10000, 100000])
+        parser.add_argument('--days', type=int, default=365)
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per path; the best one is reported')
+
+    def handle(self, *args, **options):
+        for rows in options['rows']:
+            try:
+                with db_transaction.atomic():
+                    results = self._run(rows, options['days'], options['repeat'])
+                    raise _Rollback()
+            except _Rollback:
+                pass
+
+            (legacy, legacy_queries), (single, single_queries) = results
+            self.stdout.write(
+                f"{rows:>7} rows | two scans: {legacy:.3f}s ({legacy_queries} queries) | "
+                f"single scan ({connection.vendor}): {single:.3f}s ({single_queries} query) | speed-up: {legacy / single:.1f}x"
+            )
+
+    def _run(self, rows, days, repeat):
+        owner = User.objects.create(username=f'benchmark-analytics-{rows}')
+        organization = Organization.objects.create(name='Benchmark', cnpj=str(rows).zfill(14), owner=owner)
+
+        start = timezone.now() - timedelta(days=days)
+        SaleTransaction.objects.bulk_create([
+            SaleTransaction(
+                organization=organization,
+                external_id=f'BENCH-{i}',
+                platform='SHOPEE' if i % 2 else 'ML',
+                amount=Decimal(100 + i % 900) + Decimal('0.99'),
+                transaction_date=start + timedelta(days=i % days, seconds=i % 86400),
+                net_margin=Decimal(20 + i % 50),
+                tax_amount=Decimal('9.25'),
+                commission_amount=Decimal('14.00'),
+                cogs_amount=Decimal('30.00'),
+                total_logistics=Decimal('12.50'),
+            )
+            for i in range(rows)
+        ], batch_size=1000)
+        queryset = SaleTransaction.objects.filter(organization=organization)
+        day = TruncDate('transaction_date')
+
+        legacy = self._best(repeat, lambda: self._two_scans(queryset, day))
+        single = self._best(repeat, lambda: aggregate_net_margin(queryset, 'amount', day))
+
+        if legacy[1] != single[1]:
+            raise AssertionError('aggregate_net_margin diverged from the two-scan aggregation')
+        return (legacy[0], legacy[2]), (single[0], single[2])
+
+    def _best(self, repeat, run):
+        best = None
+        for _ in range(repeat):
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                result = run()
+                elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        totals, _, chart = result
+        # Compared to the cent: SQLite sums decimals as floats
+        cents = lambda value: value.quantize(CENTS)
+        summary = (cents(totals['revenue']), cents(totals['net_margin']),
+                   [(point['date'], point['platform'], cents(point['revenue'])) for point in chart])
+        return best, summary, len(queries)
+
+    def _two_scans(self, queryset, day):
+        """
+        The previous NetMarginAnalyticsView aggregation.
+        """
+        totals = queryset.aggregate(revenue=Sum('amount'), net_margin=Sum('net_margin'), taxes=Sum('tax_amount'),
+                                    commissions=Sum('commission_amount'), cogs=Sum('cogs_amount'),
+                                    logistics=Sum('total_logistics'))
+        rows = queryset.annotate(day=day).values('day', 'platform').annotate(
+            daily_revenue=Sum('amount'), daily_net_margin=Sum('net_margin')
+        ).order_by('day', 'platform')
+        chart = [{"date": row['day'].strftime('%Y-%m-%d'), "platform": row['platform'],
+                  "revenue": row['daily_revenue'], "net_margin": row['daily_net_margin']} for row in rows]
+        return totals, None, chart
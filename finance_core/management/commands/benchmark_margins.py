@@ -0,0 +1,72 @@
+import time
+from decimal import Decimal
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction as db_transaction
+from django.utils import timezone
+from finance_core.models import Organization, TaxProfile, SaleTransaction
+from finance_core.utils import calculate_net_margin, compute_margins
+
+class _Rollback(Exception):
+    pass
+
+class Command(BaseCommand):
+    help = 'Benchmarks per-row calculate_net_margin against the batch compute_margins engine (data is rolled back)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', nargs='+', type=int, default=[1000, 10000, 100000])
+        parser.add_argument('--skip-legacy-above', type=int, default=None,
+                            help='Skip the per-row path for row counts above this value')
+
+    def handle(self, *args, **options):
+        for rows in options['rows']:
+            run_legacy = options['skip_legacy_above'] is None or rows <= options['skip_legacy_above']
+            try:
+                with db_transaction.atomic():
+                    legacy, batch = self._run(rows, run_legacy)
+                    raise _Rollback()
+            except _Rollback:
+                pass
+
+            if legacy is None:
+                self.stdout.write(f"{rows:>7} rows | per-row: skipped | batch: {batch:.3f}s")
+            else:
+                self.stdout.write(f"{rows:>7} rows | per-row: {legacy:.3f}s | batch: {batch:.3f}s | speed-up: {legacy / batch:.1f}x")
+
+    def _run(self, rows, run_legacy):
+        owner = User.objects.create(username=f'benchmark-margins-{rows}')
+        organization = Organization.objects.create(name='Benchmark', cnpj=str(rows).zfill(14), owner=owner)
+        TaxProfile.objects.create(organization=organization, icms_benefit_flag=True, effective_tax_rate=Decimal('1.30'))
+
+        now = timezone.now()
+        SaleTransaction.objects.bulk_create([
+            SaleTransaction(
+                organization=organization,
+                external_id=f'BENCH-{i}',
+                platform='SHOPEE' if i % 2 else 'ML',
+                amount=Decimal(100 + i % 900) + Decimal('0.99'),
+                transaction_date=now,
+                shipping_cost_platform=Decimal('12.50'),
+                calculated_fixed_cost=Decimal('8.00') if i % 3 == 0 else Decimal('0.00'),
+                is_fixed_cost_applied=i % 3 == 0,
+            )
+            for i in range(rows)
+        ], batch_size=1000)
+        queryset = SaleTransaction.objects.filter(organization=organization)
+
+        legacy = None
+        if run_legacy:
+            start = time.perf_counter()
+            for transaction in queryset:
+                calculate_net_margin(transaction)
+            legacy = time.perf_counter() - start
+            expected = dict(queryset.values_list('id', 'net_margin'))
+            queryset.update(net_margin=None)
+
+        start = time.perf_counter()
+        compute_margins(queryset)
+        batch = time.perf_counter() - start
+
+        if run_legacy and dict(queryset.values_list('id', 'net_margin')) != expected:
+            raise AssertionError('compute_margins diverged from calculate_net_margin')
+        return legacy, batch
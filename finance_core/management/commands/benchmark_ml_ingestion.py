@@ -0,0 +1,83 @@
+import time
+from decimal import Decimal
+from unittest import mock
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction as db_transaction
+from finance_core.ml_api import MLClient
+from finance_core.ml_fixtures import RecordedMLApi
+from finance_core.models import Organization, TaxProfile, IntegrationProfile, LogisticsCostTable, SaleTransaction
+from finance_core.pipeline import sync_ml_orders, normalize_ml_order
+from finance_core.utils import calculate_net_margin
+
+class _Rollback(Exception):
+    pass
+
+class Command(BaseCommand):
+    help = ('Benchmarks Mercado Livre ingestion over recorded API responses: per-order get_or_create '
+            'against the paged, set-based sync_ml_orders (data is rolled back)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', nargs='+', type=int, default=[10000])
+        parser.add_argument('--skip-legacy', action='store_true', help='Only run the set-based path')
+
+    def handle(self, *args, **options):
+        for orders in options['orders']:
+            api = RecordedMLApi(orders)
+            with mock.patch.object(MLClient, '_get', side_effect=api), \
+                 mock.patch('finance_core.utils.refresh_ml_token'):
+                legacy = None if options['skip_legacy'] else self._timed(orders, self._legacy)
+                batch = self._timed(orders, sync_ml_orders)
+
+            if legacy is None:
+                self.stdout.write(f"{orders:>7} orders | per-order: skipped | batch: {batch:.3f}s")
+            else:
+                self.stdout.write(f"{orders:>7} orders | per-order: {legacy:.3f}s | batch: {batch:.3f}s | speed-up: {legacy / batch:.1f}x")
+
+    def _timed(self, orders, sync):
+        try:
+            with db_transaction.atomic():
+                profile = self._profile(orders)
+                start = time.perf_counter()
+                sync(profile)
+                elapsed = time.perf_counter() - start
+                if SaleTransaction.objects.filter(organization=profile.organization).count() != orders:
+                    raise AssertionError('not every order was ingested')
+                raise _Rollback()
+        except _Rollback:
+            return elapsed
+
+    def _profile(self, orders):
+        owner = User.objects.create(username=f'benchmark-ml-{orders}')
+        organization = Organization.objects.create(name='Benchmark ML', cnpj=str(orders).zfill(14), owner=owner)
+        TaxProfile.objects.create(organization=organization, origin_uf='MG')
+        LogisticsCostTable.objects.create(organization=organization, platform='ML',
+                                          shipping_method='drop_off', fixed_cost_value=Decimal('9.90'))
+        return IntegrationProfile.objects.create(organization=organization, ml_client_id='app',
+                                                 ml_client_secret='secret', ml_access_token='token')
+
+    def _legacy(self, profile):
+        """
+        The previous shape of the path: one lookup, one write and one margin save per order.
+        """
+        client = MLClient(profile.ml_access_token, '123456789', app_id=profile.ml_client_id)
+        for order, shipment in client.iter_orders('2023-01-01T00:00:00.000-00:00'):
+            data = normalize_ml_order(order, shipment)
+            rule = LogisticsCostTable.objects.filter(organization=profile.organization, platform='ML',
+                                                     shipping_method=data['shipping_method']).first()
+            fixed_cost = rule.fixed_cost_value if rule else Decimal('0.00')
+            transaction, _ = SaleTransaction.objects.get_or_create(
+                organization=profile.organization,
+                external_id=data['external_id'],
+                platform='ML',
+                defaults={
+                    'amount': data['amount'],
+                    'transaction_date': data['transaction_date'],
+                    'transaction_shipping_method': data['shipping_method'],
+                    'destination_uf': data['destination_uf'],
+                    'shipping_cost_platform': data['shipping_cost_platform'],
+                    'calculated_fixed_cost': fixed_cost,
+                    'is_fixed_cost_applied': fixed_cost > 0,
+                }
+            )
+            calculate_net_margin(transaction)
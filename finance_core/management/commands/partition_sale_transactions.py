@@ -0,0 +1,155 @@
+from datetime import date
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction as db_transaction
+from django.utils import timezone
+from finance_core.models import SaleTransaction
+
+TABLE = SaleTransaction._meta.db_table
+OLD_TABLE = f'{TABLE}_unpartitioned'
+DEFAULT_PARTITION = f'{TABLE}_default'
+
+# Recreated on the partitioned parent (propagated to every partition)
+INDEXES = [
+    f'CREATE INDEX sale_org_date_platform_idx ON {TABLE} (organization_id, transaction_date, platform)',
+    f'CREATE INDEX sale_org_platform_date_cover_idx ON {TABLE} (organization_id, platform, transaction_date) '
+    f'INCLUDE (amount, net_margin, tax_amount, commission_amount, cogs_amount, total_logistics, '
+    f'shipping_cost_platform, calculated_fixed_cost)',
+]
+
+def _add_months(day, months):
+    month = day.month - 1 + months
+    return date(day.year + month // 12, month % 12 + 1, 1)
+
+def _months(first_month, last_month):
+    months = [first_month]
+    while months[-1] < last_month:
+        months.append(_add_months(months[-1], 1))
+    return months
+
+def _partition_name(month):
+    return f'{TABLE}_p{month:%Y%m}'
+
+def _bound(month):
+    return f'{month.isoformat()} 00:00:00+00'
+
+class Command(BaseCommand):
+    help = (
+        'PostgreSQL only. Converts SaleTransaction into a table range-partitioned by month on '
+        'transaction_date (--convert) and creates the partitions of the current and upcoming months. '
+        'Run monthly once converted. Rows that landed in the DEFAULT partition for a month that gets '
+        'its own partition are moved into it (the default partition is detached meanwhile).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--convert', action='store_true',
+                            help='Rebuild the table as a partitioned table (takes an exclusive lock while copying)')
+        parser.add_argument('--months-ahead', type=int, default=3, help='Future monthly partitions to keep ready (default: 3)')
+        parser.add_argument('--dry-run', action='store_true', help='Print the SQL instead of running it')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Partitioning is only supported on PostgreSQL.')
+
+        partitioned = self._is_partitioned()
+        if not partitioned and not options['convert']:
+            raise CommandError(f'{TABLE} is not partitioned. Run with --convert to rebuild it.')
+        if options['convert'] and not partitioned and not settings.SALE_TRANSACTION_PARTITIONED:
+            raise CommandError(
+                'Set SALE_TRANSACTION_PARTITIONED=True before converting: the upsert conflict key '
+                'must include transaction_date once the table is partitioned.'
+            )
+
+        this_month = timezone.now().date().replace(day=1)
+        last_month = _add_months(this_month, options['months_ahead'])
+
+        if partitioned:
+            statements = self._add_partitions(this_month, last_month)
+        else:
+            statements = self._convert(this_month, last_month)
+
+        if options['dry_run']:
+            for statement in statements:
+                self.stdout.write(f'{statement};')
+            return
+
+        with db_transaction.atomic(), connection.cursor() as cursor:
+            for statement in statements:
+                cursor.execute(statement)
+
+        self.stdout.write(self.style.SUCCESS(f'{TABLE} partitions ready until {last_month:%Y-%m}.'))
+
+    def _is_partitioned(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid WHERE c.relname = %s',
+                [TABLE]
+            )
+            return cursor.fetchone() is not None
+
+    def _existing_partitions(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid '
+                'JOIN pg_class p ON p.oid = i.inhparent WHERE p.relname = %s',
+                [TABLE]
+            )
+            return {row[0] for row in cursor.fetchall()}
+
+    def _partitions(self, months):
+        return [
+            f"CREATE TABLE {_partition_name(month)} PARTITION OF {TABLE} FOR VALUES FROM ('{_bound(month)}') "
+            f"TO ('{_bound(_add_months(month, 1))}')"
+            for month in months
+        ]
+
+    def _add_partitions(self, first_month, last_month):
+        """
+        Creates the missing monthly partitions. Postgres refuses a partition whose range already
+        has rows in the DEFAULT partition, so the default partition is detached, its rows of the
+        new months are moved into their partitions, and it is attached again.
+        """
+        existing = self._existing_partitions()
+        months = [month for month in _months(first_month, last_month) if _partition_name(month) not in existing]
+        if not months or DEFAULT_PARTITION not in existing:
+            return self._partitions(months)
+
+        statements = [f'ALTER TABLE {TABLE} DETACH PARTITION {DEFAULT_PARTITION}']
+        for month, create in zip(months, self._partitions(months)):
+            condition = f"transaction_date >= '{_bound(month)}' AND transaction_date < '{_bound(_add_months(month, 1))}'"
+            statements += [
+                create,
+                f'INSERT INTO {TABLE} SELECT * FROM {DEFAULT_PARTITION} WHERE {condition}',
+                f'DELETE FROM {DEFAULT_PARTITION} WHERE {condition}',
+            ]
+        statements.append(f'ALTER TABLE {TABLE} ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT')
+        return statements
+
+    def _convert(self, this_month, last_month):
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT MIN(transaction_date) FROM {TABLE}')
+            oldest = cursor.fetchone()[0]
+        first_month = oldest.date().replace(day=1) if oldest else this_month
+
+        # Constraints and indexes are added after the old table (and its index names) is gone.
+        # Every unique constraint of a partitioned table must contain the partition key.
+        return [
+            f'LOCK TABLE {TABLE} IN ACCESS EXCLUSIVE MODE',
+            f'ALTER TABLE {TABLE} RENAME TO {OLD_TABLE}',
+            f'CREATE TABLE {TABLE} (LIKE {OLD_TABLE} INCLUDING DEFAULTS INCLUDING IDENTITY) '
+            f'PARTITION BY RANGE (transaction_date)',
+            *self._partitions(_months(first_month, last_month)),
+            f'CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {TABLE} DEFAULT',
+            f'INSERT INTO {TABLE} SELECT * FROM {OLD_TABLE}',
+            f"SELECT setval(pg_get_serial_sequence('{TABLE}', 'id'), COALESCE((SELECT MAX(id) FROM {TABLE}), 1))",
+            # CASCADE only drops the foreign keys pointing at the old table (SaleItem.transaction):
+            # a partitioned table cannot be referenced by id alone, so SaleItem keeps a plain column.
+            f'DROP TABLE {OLD_TABLE} CASCADE',
+            f'ALTER TABLE {TABLE} ADD PRIMARY KEY (id, transaction_date)',
+            f'ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_org_external_platform_date_uniq '
+            f'UNIQUE (organization_id, external_id, platform, transaction_date)',
+            f'ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_organization_id_fk FOREIGN KEY (organization_id) '
+            f'REFERENCES {SaleTransaction._meta.get_field("organization").related_model._meta.db_table} (id) '
+            f'DEFERRABLE INITIALLY DEFERRED',
+            *INDEXES,
+        ]
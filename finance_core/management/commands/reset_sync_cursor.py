@@ -0,0 +1,39 @@
+from datetime import datetime, timezone as dt_timezone
+from django.core.management.base import BaseCommand, CommandError
+from finance_core.models import Organization, SyncCursor
+
+class Command(BaseCommand):
+    help = 'Resets or backfills the incremental sync cursor per organization/platform'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--organization', type=int, help='Organization id (default: all)')
+        parser.add_argument('--platform', choices=['ML', 'SHOPEE'], help='Platform (default: all)')
+        parser.add_argument('--since', help='Backfill start date (YYYY-MM-DD). Without it the cursor is cleared and the default lookback applies.')
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = datetime.strptime(options['since'], '%Y-%m-%d').replace(tzinfo=dt_timezone.utc)
+            except ValueError:
+                raise CommandError("--since must be in YYYY-MM-DD format")
+
+        organizations = Organization.objects.all()
+        if options['organization']:
+            organizations = organizations.filter(id=options['organization'])
+        platforms = [options['platform']] if options['platform'] else ['ML', 'SHOPEE']
+
+        for organization in organizations:
+            for platform in platforms:
+                if since is None:
+                    SyncCursor.objects.filter(organization=organization, platform=platform).delete()
+                    self.stdout.write(f"{organization.name} / {platform}: cursor cleared")
+                else:
+                    SyncCursor.objects.update_or_create(
+                        organization=organization,
+                        platform=platform,
+                        defaults={'last_synced_at': since}
+                    )
+                    self.stdout.write(f"{organization.name} / {platform}: backfill from {since.date()}")
+
+        self.stdout.write(self.style.SUCCESS("Sync cursors updated."))
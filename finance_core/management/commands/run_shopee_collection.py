@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from finance_core.pipeline import fetch_and_process_shopee_orders
+
+class Command(BaseCommand):
+    help = 'Fetches sales data from Shopee for all tenants'
+
+    def handle(self, *args, **options):
+        self.stdout.write("Starting Shopee Sales Collection...")
+        metrics = fetch_and_process_shopee_orders()
+        self.stdout.write(str(metrics))
+        self.stdout.write(self.style.SUCCESS("Shopee Sales Collection Completed."))
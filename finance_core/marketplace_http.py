@@ -0,0 +1,93 @@
+"""
+Shared HTTP layer for the marketplace clients (Mercado Livre and Shopee).
+
+One pooled requests.Session per process (keep-alive instead of a TCP+TLS handshake per
+call), default connect/read timeouts, retries with exponential backoff + jitter that honour
+Retry-After, and a cap on concurrent requests per host.
+"""
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DEFAULT_TIMEOUT = (5, 30) # (connect, read) seconds
+MAX_RETRIES = 4
+BACKOFF_FACTOR = 0.5 # 0.5s, 1s, 2s, 4s ...
+BACKOFF_JITTER = 0.5 # + up to 0.5s random, so workers do not retry in lockstep
+BACKOFF_MAX = 30
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+MAX_CONCURRENCY_PER_HOST = 8
+
+# POST is not retried on a response: token refreshes are not idempotent (a refresh
+# token is single use), only connection failures that never reached the server are retried.
+RETRY = Retry(
+    total=MAX_RETRIES,
+    connect=MAX_RETRIES,
+    backoff_factor=BACKOFF_FACTOR,
+    backoff_jitter=BACKOFF_JITTER,
+    backoff_max=BACKOFF_MAX,
+    status_forcelist=RETRY_STATUSES,
+    allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+    respect_retry_after_header=True,
+    raise_on_status=False, # Hand the last response back so raise_for_status() reports it
+)
+
+def backoff_delay(retry_number, retry_after=None):
+    """
+    Seconds to wait before retry retry_number (0-based) under the RETRY policy, for clients that
+    do not go through the requests session (the async Shopee fetcher): the Retry-After header
+    (seconds or HTTP date) when the server sent one, otherwise exponential backoff with jitter.
+    """
+    if retry_after:
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+    return min(BACKOFF_MAX, BACKOFF_FACTOR * 2 ** retry_number) + random.uniform(0, BACKOFF_JITTER)
+
+class MarketplaceAdapter(HTTPAdapter):
+    """
+    HTTPAdapter with a default timeout and a per-host concurrency limit.
+    """
+    def __init__(self, max_per_host=MAX_CONCURRENCY_PER_HOST, **kwargs):
+        self.max_per_host = max_per_host
+        self._semaphores = {}
+        self._semaphores_lock = threading.Lock()
+        super().__init__(pool_maxsize=max_per_host, max_retries=RETRY, **kwargs)
+
+    def _semaphore(self, host):
+        with self._semaphores_lock:
+            if host not in self._semaphores:
+                self._semaphores[host] = threading.BoundedSemaphore(self.max_per_host)
+            return self._semaphores[host]
+
+    def send(self, request, timeout=None, **kwargs):
+        with self._semaphore(urlsplit(request.url).netloc):
+            return super().send(request, timeout=timeout or DEFAULT_TIMEOUT, **kwargs)
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+def get_session():
+    """
+    Returns the process-wide marketplace session. A forked worker gets its own session
+    instead of sharing the parent's sockets.
+    """
+    global _session, _session_pid
+    with _session_lock:
+        if _session is None or _session_pid != os.getpid():
+            session = requests.Session()
+            adapter = MarketplaceAdapter()
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _session, _session_pid = session, os.getpid()
+        return _session
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance_core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncCursor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('platform', models.CharField(choices=[('ML', 'Mercado Livre'), ('SHOPEE', 'Shopee')], max_length=20)),
+                ('last_synced_at', models.DateTimeField(blank=True, help_text='Último update_time/date_last_updated processado com sucesso.', null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('organization', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sync_cursors', to='finance_core.organization')),
+            ],
+            options={
+                'unique_together': {('organization', 'platform')},
+            },
+        ),
+    ]
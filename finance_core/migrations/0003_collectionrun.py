@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance_core', '0002_synccursor'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CollectionRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('duration_seconds', models.FloatField(blank=True, null=True)),
+                ('tenant_count', models.PositiveIntegerField(default=0)),
+                ('failed_count', models.PositiveIntegerField(default=0)),
+                ('results', models.JSONField(blank=True, default=list)),
+            ],
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance_core', '0003_collectionrun'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyProfitSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('platform', models.CharField(choices=[('ML', 'Mercado Livre'), ('SHOPEE', 'Shopee')], max_length=20)),
+                ('date', models.DateField()),
+                ('order_count', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0.0, max_digits=14)),
+                ('net_margin', models.DecimalField(decimal_places=2, default=0.0, max_digits=14)),
+                ('shipping_cost_platform', models.DecimalField(decimal_places=2, default=0.0, max_digits=14)),
+                ('calculated_fixed_cost', models.DecimalField(decimal_places=2, default=0.0, max_digits=14)),
+                ('organization', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_profit_summaries', to='finance_core.organization')),
+            ],
+            options={
+                'unique_together': {('organization', 'platform', 'date')},
+            },
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance_core', '0004_dailyprofitsummary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dailyprofitsummary',
+            name='cogs_amount',
+            field=models.DecimalField(decimal_places=2, default=0.0, max_digits=14),
+        ),
+        migrations.AddField(
+            model_name='dailyprofitsummary',
+            name='commission_amount',
+            field=models.DecimalField(decimal_places=2, default=0.0, max_digits=14),
+        ),
+        migrations.AddField(
+            model_name='dailyprofitsummary',
+            name='tax_amount',
+            field=models.DecimalField(decimal_places=2, default=0.0, max_digits=14),
+        ),
+        migrations.AddField(
+            model_name='dailyprofitsummary',
+            name='total_logistics',
+            field=models.DecimalField(decimal_places=2, default=0.0, max_digits=14),
+        ),
+        migrations.AddField(
+            model_name='saletransaction',
+            name='cogs_amount',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='saletransaction',
+            name='commission_amount',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='saletransaction',
+            name='tax_amount',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='saletransaction',
+            name='total_logistics',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True),
+        ),
+    ]
@@ -0,0 +1,98 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:33
+
+from decimal import Decimal, ROUND_HALF_UP
+from django.db import migrations
+from django.db.models import Sum
+from django.db.models.functions import TruncDate
+
+CHUNK_SIZE = 2000
+CENTS = Decimal('0.01')
+
+# Frozen copy of the margin engine rules at the time of this migration
+PIS_COFINS_RATE = Decimal('0.0925')
+STANDARD_ICMS_RATE = Decimal('0.18')
+COMMISSION_RATES = {'SHOPEE': Decimal('0.14')}
+DEFAULT_COMMISSION_RATE = Decimal('0.16')
+
+BREAKDOWN_FIELDS = ['tax_amount', 'commission_amount', 'cogs_amount', 'total_logistics']
+
+
+def _tax_rate(tax_profile):
+    # (rate over revenue, whether the standard regime clamps negative taxes to zero)
+    if not tax_profile:
+        return Decimal('0.00'), False
+    if tax_profile.icms_benefit_flag:
+        return (tax_profile.effective_tax_rate / 100) + PIS_COFINS_RATE, False
+    return STANDARD_ICMS_RATE + PIS_COFINS_RATE, True
+
+
+def backfill_breakdown(apps, schema_editor):
+    """
+    Fills the breakdown columns of existing transactions in keyset-paginated chunks.
+    """
+    SaleTransaction = apps.get_model('finance_core', 'SaleTransaction')
+    TaxProfile = apps.get_model('finance_core', 'TaxProfile')
+
+    tax_rates = {profile.organization_id: _tax_rate(profile) for profile in TaxProfile.objects.all()}
+
+    last_id = 0
+    while True:
+        chunk = list(
+            SaleTransaction.objects.filter(id__gt=last_id, tax_amount__isnull=True).order_by('id')[:CHUNK_SIZE]
+        )
+        if not chunk:
+            break
+
+        for transaction in chunk:
+            revenue = transaction.amount
+            rate, clamps = tax_rates.get(transaction.organization_id, (Decimal('0.00'), False))
+            taxes = revenue * rate
+            if clamps and taxes < 0:
+                taxes = Decimal('0.00')
+            commission = revenue * COMMISSION_RATES.get(transaction.platform, DEFAULT_COMMISSION_RATE)
+
+            transaction.tax_amount = taxes.quantize(CENTS, rounding=ROUND_HALF_UP)
+            transaction.commission_amount = commission.quantize(CENTS, rounding=ROUND_HALF_UP)
+            transaction.cogs_amount = Decimal('0.00')
+            if transaction.is_fixed_cost_applied:
+                transaction.total_logistics = transaction.calculated_fixed_cost
+            else:
+                transaction.total_logistics = transaction.shipping_cost_platform + transaction.calculated_fixed_cost
+
+        SaleTransaction.objects.bulk_update(chunk, BREAKDOWN_FIELDS)
+        last_id = chunk[-1].id
+
+
+def backfill_summaries(apps, schema_editor):
+    """
+    Fills the new breakdown sums of the daily rollup from the backfilled transactions.
+    """
+    SaleTransaction = apps.get_model('finance_core', 'SaleTransaction')
+    DailyProfitSummary = apps.get_model('finance_core', 'DailyProfitSummary')
+
+    for organization_id in DailyProfitSummary.objects.values_list('organization_id', flat=True).distinct():
+        rows = SaleTransaction.objects.filter(organization_id=organization_id).annotate(
+            day=TruncDate('transaction_date')
+        ).values('platform', 'day').annotate(
+            **{field: Sum(field) for field in BREAKDOWN_FIELDS}
+        ).order_by()
+        sums = {(row['platform'], row['day']): row for row in rows}
+
+        summaries = list(DailyProfitSummary.objects.filter(organization_id=organization_id))
+        for summary in summaries:
+            row = sums.get((summary.platform, summary.date), {})
+            for field in BREAKDOWN_FIELDS:
+                setattr(summary, field, row.get(field) or Decimal('0.00'))
+        DailyProfitSummary.objects.bulk_update(summaries, BREAKDOWN_FIELDS, batch_size=CHUNK_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance_core', '0005_margin_breakdown'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_breakdown, migrations.RunPython.noop),
+        migrations.RunPython(backfill_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance_core', '0006_backfill_margin_breakdown'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='saletransaction',
+            name='destination_uf',
+            field=models.CharField(blank=True, max_length=2, null=True),
+        ),
+        migrations.AddField(
+            model_name='taxprofile',
+            name='effective_rate_interstate',
+            field=models.DecimalField(blank=True, decimal_places=2, help_text='Alíquota efetiva de ICMS nas vendas interestaduais com benefício (vazio = mesma da interna).', max_digits=5, null=True),
+        ),
+        migrations.AddField(
+            model_name='taxprofile',
+            name='origin_uf',
+            field=models.CharField(blank=True, help_text='UF de origem das vendas (ex: MG)', max_length=2, null=True),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:38
+
+from django.db import migrations, models
+
+# PostgreSQL only: INCLUDE (non-key columns) lets the analytics and rollup aggregates
+# over an organization/platform/date range be answered by an index-only scan.
+COVERING_INDEX = 'sale_org_platform_date_cover_idx'
+COVERING_COLUMNS = (
+    'amount', 'net_margin', 'tax_amount', 'commission_amount', 'cogs_amount',
+    'total_logistics', 'shipping_cost_platform', 'calculated_fixed_cost',
+)
+
+
+def create_covering_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {COVERING_INDEX} '
+        f'ON finance_core_saletransaction (organization_id, platform, transaction_date) '
+        f'INCLUDE ({", ".join(COVERING_COLUMNS)})'
+    )
+
+
+def drop_covering_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {COVERING_INDEX}')
+
+
+class Migration(migrations.Migration):
+    atomic = False # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+
+    dependencies = [
+        ('finance_core', '0007_tax_engine_fields'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='saletransaction',
+            index=models.Index(fields=['organization', 'transaction_date', 'platform'], name='sale_org_date_platform_idx'),
+        ),
+        migrations.RunPython(create_covering_index, drop_covering_index),
+    ]
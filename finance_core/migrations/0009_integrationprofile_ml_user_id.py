@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance_core', '0008_analytics_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='integrationprofile',
+            name='ml_user_id',
+            field=models.CharField(blank=True, max_length=50, null=True),
+        ),
+    ]
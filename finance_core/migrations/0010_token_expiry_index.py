@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance_core', '0009_integrationprofile_ml_user_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='integrationprofile',
+            name='shopee_token_expiry_date',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='integrationprofile',
+            name='ml_token_expiry_date',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
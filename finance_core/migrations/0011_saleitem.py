@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance_core', '0010_token_expiry_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SaleItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sku', models.CharField(blank=True, max_length=100)),
+                ('external_item_id', models.CharField(blank=True, max_length=100, null=True)),
+                ('quantity', models.PositiveIntegerField(default=1)),
+                ('unit_price', models.DecimalField(decimal_places=2, default=0.0, max_digits=12)),
+                ('unit_cost', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('transaction', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='finance_core.saletransaction')),
+            ],
+        ),
+    ]
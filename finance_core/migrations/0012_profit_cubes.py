@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance_core', '0011_saleitem'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProfitCube',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('platform', models.CharField(choices=[('ML', 'Mercado Livre'), ('SHOPEE', 'Shopee')], max_length=20)),
+                ('transaction_shipping_method', models.CharField(blank=True, default='', max_length=50)),
+                ('is_fixed_cost_applied', models.BooleanField(default=False)),
+                ('order_count', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0.0, max_digits=14)),
+                ('net_margin', models.DecimalField(decimal_places=2, default=0.0, max_digits=14)),
+                ('tax_amount', models.DecimalField(decimal_places=2, default=0.0, max_digits=14)),
+                ('commission_amount', models.DecimalField(decimal_places=2, default=0.0, max_digits=14)),
+                ('cogs_amount', models.DecimalField(decimal_places=2, default=0.0, max_digits=14)),
+                ('total_logistics', models.DecimalField(decimal_places=2, default=0.0, max_digits=14)),
+                ('organization', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='profit_cubes', to='finance_core.organization')),
+            ],
+            options={
+                'unique_together': {('organization', 'month', 'platform', 'transaction_shipping_method', 'is_fixed_cost_applied')},
+            },
+        ),
+        migrations.CreateModel(
+            name='SkuProfitCube',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('platform', models.CharField(choices=[('ML', 'Mercado Livre'), ('SHOPEE', 'Shopee')], max_length=20)),
+                ('sku', models.CharField(blank=True, max_length=100)),
+                ('quantity', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0.0, max_digits=14)),
+                ('cogs_amount', models.DecimalField(decimal_places=2, default=0.0, max_digits=14)),
+                ('net_margin', models.DecimalField(decimal_places=2, default=0.0, max_digits=14)),
+                ('organization', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sku_profit_cubes', to='finance_core.organization')),
+            ],
+            options={
+                'unique_together': {('organization', 'month', 'platform', 'sku')},
+            },
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance_core', '0012_profit_cubes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimulationJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('request_key', models.CharField(max_length=64)),
+                ('params', models.JSONField(default=dict)),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('RUNNING', 'Running'), ('DONE', 'Done'), ('FAILED', 'Failed')], default='PENDING', max_length=10)),
+                ('total_count', models.PositiveIntegerField(default=0)),
+                ('processed_count', models.PositiveIntegerField(default=0)),
+                ('page_count', models.PositiveIntegerField(default=0)),
+                ('result', models.BinaryField(blank=True, null=True)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('organization', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='simulation_jobs', to='finance_core.organization')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SimulationResultPage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveIntegerField()),
+                ('row_count', models.PositiveIntegerField(default=0)),
+                ('data', models.BinaryField()),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pages', to='finance_core.simulationjob')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='simulationjob',
+            index=models.Index(fields=['organization', 'request_key'], name='simjob_org_key_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='simulationjob',
+            index=models.Index(fields=['created_at'], name='simjob_created_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='simulationresultpage',
+            unique_together={('job', 'number')},
+        ),
+    ]
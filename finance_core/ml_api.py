@@ -0,0 +1,88 @@
+"""
+Mercado Livre API client: paged order search and shipment cost lookups.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from .marketplace_http import get_session
+from .rate_limit import acquire
+
+ML_API_BASE = "https://api.mercadolibre.com"
+
+# API limits
+ORDERS_SEARCH_MAX_LIMIT = 51
+SHIPMENT_LOOKUP_CONCURRENCY = 8
+
+class MLClient:
+    def __init__(self, access_token, seller_id, app_id=None, base_url=ML_API_BASE):
+        self.access_token = access_token
+        self.seller_id = seller_id
+        self.app_id = app_id # Rate limit bucket (ml_client_id)
+        self.base_url = base_url
+
+    def _get(self, path, params=None):
+        acquire('ML', self.app_id)
+        response = get_session().get(
+            f"{self.base_url}{path}",
+            params=params,
+            headers={'Authorization': f'Bearer {self.access_token}'}
+        )
+        response.raise_for_status()
+        return response.json()
+
+    def get_me(self):
+        """
+        Wraps /users/me (resolves the seller id of the token).
+        """
+        return self._get("/users/me")
+
+    def search_orders(self, date_from, offset=0, limit=ORDERS_SEARCH_MAX_LIMIT, date_to=None):
+        """
+        Wraps /orders/search filtered by last update (date_to is optional).
+        """
+        params = {
+            "seller": self.seller_id,
+            "order.date_last_updated.from": date_from,
+            "sort": "date_asc",
+            "offset": offset,
+            "limit": limit,
+        }
+        if date_to:
+            params["order.date_last_updated.to"] = date_to
+        return self._get("/orders/search", params)
+
+    def iter_order_pages(self, date_from, limit=ORDERS_SEARCH_MAX_LIMIT, date_to=None):
+        """
+        Yields each page of search results, following offset until paging.total is reached.
+        """
+        offset = 0
+        while True:
+            data = self.search_orders(date_from, offset=offset, limit=limit, date_to=date_to)
+            results = data.get('results', [])
+            if results:
+                yield results
+
+            offset += len(results)
+            if not results or offset >= data.get('paging', {}).get('total', 0):
+                return
+
+    def get_shipments(self, shipment_ids):
+        """
+        Returns {shipment_id: shipment} for a page of orders.
+        /shipments has no multi-get, so one page of lookups runs concurrently over the pooled session.
+        """
+        shipment_ids = list(dict.fromkeys(shipment_ids))
+        if not shipment_ids:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(SHIPMENT_LOOKUP_CONCURRENCY, len(shipment_ids))) as pool:
+            shipments = pool.map(lambda shipment_id: self._get(f"/shipments/{shipment_id}"), shipment_ids)
+            return dict(zip(shipment_ids, shipments))
+
+    def iter_orders(self, date_from, date_to=None):
+        """
+        Yields (order, shipment or None) for every order updated since date_from (until date_to).
+        """
+        for results in self.iter_order_pages(date_from, date_to=date_to):
+            shipments = self.get_shipments(
+                order['shipping']['id'] for order in results if (order.get('shipping') or {}).get('id')
+            )
+            for order in results:
+                yield order, shipments.get((order.get('shipping') or {}).get('id'))
@@ -0,0 +1,56 @@
+"""
+Replays recorded Mercado Livre responses (orders/search pages and shipments) without network
+access, scaled to any number of orders. Used by the ML ingestion tests and benchmark.
+"""
+import copy
+import json
+import os
+from datetime import datetime
+from urllib.parse import urlsplit
+
+FIXTURE_PATH = os.path.join(os.path.dirname(__file__), 'tests', 'fixtures', 'ml_orders.json')
+
+class RecordedMLApi:
+    """
+    Callable replacing MLClient._get: serves /users/me, /orders/search (offset/limit) and
+    /shipments/{id} from the recorded fixture, repeated to `orders` distinct orders.
+    """
+    def __init__(self, orders, path=FIXTURE_PATH, seller_id=123456789):
+        with open(path) as fixture:
+            recorded = json.load(fixture)
+        self.seller_id = seller_id
+        self.shipments = {}
+        self.orders = []
+        self.calls = []
+        self.searches = [] # Number of results of every /orders/search call
+        for i in range(orders):
+            order = copy.deepcopy(recorded['orders'][i % len(recorded['orders'])])
+            order['id'] = order['id'] * 100000 + i
+            shipment_id = order['shipping'].get('id')
+            if shipment_id:
+                shipment = copy.deepcopy(recorded['shipments'][str(shipment_id)])
+                shipment['id'] = order['shipping']['id'] = shipment_id * 100000 + i
+                self.shipments[str(shipment['id'])] = shipment
+            self.orders.append(order)
+
+    @staticmethod
+    def _updated_between(order, date_from, date_to):
+        updated = datetime.fromisoformat(order['date_last_updated'])
+        return datetime.fromisoformat(date_from) <= updated and (not date_to or updated <= datetime.fromisoformat(date_to))
+
+    def __call__(self, path, params=None):
+        path = urlsplit(path).path
+        self.calls.append(path)
+        if path == '/users/me':
+            return {'id': self.seller_id}
+        if path == '/orders/search':
+            offset, limit = int(params['offset']), int(params['limit'])
+            orders = [order for order in self.orders if self._updated_between(
+                order, params['order.date_last_updated.from'], params.get('order.date_last_updated.to')
+            )]
+            self.searches.append(len(orders[offset:offset + limit]))
+            return {
+                'results': orders[offset:offset + limit],
+                'paging': {'total': len(orders), 'offset': offset, 'limit': limit},
+            }
+        return self.shipments[path.rsplit('/', 1)[-1]]
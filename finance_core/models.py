@@ -37,6 +37,14 @@ class TaxProfile(models.Model):
         default=0.00,
         help_text="Alíquota efetiva de ICMS na saída caso tenha benefício fiscal."
     )
+    effective_rate_interstate = models.DecimalField(
+        max_digits=5,
+        decimal_places=2,
+        blank=True,
+        null=True,
+        help_text="Alíquota efetiva de ICMS nas vendas interestaduais com benefício (vazio = mesma da interna)."
+    )
+    origin_uf = models.CharField(max_length=2, blank=True, null=True, help_text="UF de origem das vendas (ex: MG)")
 
     def __str__(self):
         return f"Tax Profile for {self.organization.name}"
@@ -90,6 +98,7 @@ class SaleTransaction(models.Model):
     
     # Logistics Data
     transaction_shipping_method = models.CharField(max_length=50, blank=True, null=True)
+    destination_uf = models.CharField(max_length=2, blank=True, null=True)
     shipping_cost_platform = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
     calculated_fixed_cost = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
     is_fixed_cost_applied = models.BooleanField(default=False, help_text="Se True, ignora o custo da plataforma e usa apenas o fixo.")
@@ -97,12 +106,111 @@ class SaleTransaction(models.Model):
     # Profitability
     net_margin = models.DecimalField(max_digits=12, decimal_places=2, blank=True, null=True)
 
+    # Margin Breakdown (persisted by the margin engine)
+    tax_amount = models.DecimalField(max_digits=12, decimal_places=2, blank=True, null=True)
+    commission_amount = models.DecimalField(max_digits=12, decimal_places=2, blank=True, null=True)
+    cogs_amount = models.DecimalField(max_digits=12, decimal_places=2, blank=True, null=True)
+    total_logistics = models.DecimalField(max_digits=12, decimal_places=2, blank=True, null=True)
+
     class Meta:
         unique_together = ('organization', 'external_id', 'platform')
+        indexes = [
+            # Analytics filters: organization + date range (+ platform).
+            # On PostgreSQL migration 0008 also adds a covering index for index-only aggregation.
+            models.Index(fields=['organization', 'transaction_date', 'platform'], name='sale_org_date_platform_idx'),
+        ]
 
     def __str__(self):
         return f"{self.platform} {self.external_id} - {self.amount}"
 
+class SaleItem(models.Model):
+    """
+    Line item of a SaleTransaction. unit_cost is the ProductCost.net_cost matched by SKU
+    at ingestion (null when the SKU has no registered cost).
+    """
+    transaction = models.ForeignKey(SaleTransaction, on_delete=models.CASCADE, related_name='items')
+    sku = models.CharField(max_length=100, blank=True)
+    external_item_id = models.CharField(max_length=100, blank=True, null=True)
+    quantity = models.PositiveIntegerField(default=1)
+    unit_price = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
+    unit_cost = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
+
+    def __str__(self):
+        return f"{self.sku} x{self.quantity}"
+
+class DailyProfitSummary(models.Model):
+    """
+    Materialized daily rollup of SaleTransaction per organization and platform.
+    Kept up to date by ingestion and rebuilt nightly; read by the analytics dashboard.
+    """
+    organization = models.ForeignKey(Organization, on_delete=models.CASCADE, related_name='daily_profit_summaries')
+    platform = models.CharField(max_length=20, choices=SaleTransaction.PLATFORM_CHOICES)
+    date = models.DateField()
+
+    order_count = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0.00)
+    net_margin = models.DecimalField(max_digits=14, decimal_places=2, default=0.00)
+    shipping_cost_platform = models.DecimalField(max_digits=14, decimal_places=2, default=0.00)
+    calculated_fixed_cost = models.DecimalField(max_digits=14, decimal_places=2, default=0.00)
+    tax_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0.00)
+    commission_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0.00)
+    cogs_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0.00)
+    total_logistics = models.DecimalField(max_digits=14, decimal_places=2, default=0.00)
+
+    class Meta:
+        unique_together = ('organization', 'platform', 'date')
+
+    def __str__(self):
+        return f"{self.organization.name} {self.platform} {self.date}: {self.net_margin}"
+
+class ProfitCube(models.Model):
+    """
+    Materialized monthly cube of SaleTransaction per organization over
+    (platform, transaction_shipping_method, is_fixed_cost_applied).
+    Orders without a shipping method are stored with an empty one.
+    Refreshed per (organization, platform, month) with DailyProfitSummary; read by the cube endpoint.
+    """
+    organization = models.ForeignKey(Organization, on_delete=models.CASCADE, related_name='profit_cubes')
+    month = models.DateField() # First day of the month
+    platform = models.CharField(max_length=20, choices=SaleTransaction.PLATFORM_CHOICES)
+    transaction_shipping_method = models.CharField(max_length=50, blank=True, default='')
+    is_fixed_cost_applied = models.BooleanField(default=False)
+
+    order_count = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0.00)
+    net_margin = models.DecimalField(max_digits=14, decimal_places=2, default=0.00)
+    tax_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0.00)
+    commission_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0.00)
+    cogs_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0.00)
+    total_logistics = models.DecimalField(max_digits=14, decimal_places=2, default=0.00)
+
+    class Meta:
+        unique_together = ('organization', 'month', 'platform', 'transaction_shipping_method', 'is_fixed_cost_applied')
+
+    def __str__(self):
+        return f"{self.organization.name} {self.platform} {self.month:%Y-%m} {self.transaction_shipping_method}: {self.net_margin}"
+
+class SkuProfitCube(models.Model):
+    """
+    Materialized monthly cube of SaleItem per organization over (platform, sku).
+    net_margin is the order margin allocated to the item by its share of the order amount.
+    """
+    organization = models.ForeignKey(Organization, on_delete=models.CASCADE, related_name='sku_profit_cubes')
+    month = models.DateField() # First day of the month
+    platform = models.CharField(max_length=20, choices=SaleTransaction.PLATFORM_CHOICES)
+    sku = models.CharField(max_length=100, blank=True)
+
+    quantity = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0.00)
+    cogs_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0.00)
+    net_margin = models.DecimalField(max_digits=14, decimal_places=2, default=0.00)
+
+    class Meta:
+        unique_together = ('organization', 'month', 'platform', 'sku')
+
+    def __str__(self):
+        return f"{self.organization.name} {self.platform} {self.month:%Y-%m} {self.sku}: {self.net_margin}"
+
 class IntegrationProfile(models.Model):
     """
     Stores credentials for external integrations (Mercado Livre).
@@ -116,18 +224,101 @@ class IntegrationProfile(models.Model):
     # Tokens
     ml_access_token = models.TextField(blank=True, null=True)
     ml_refresh_token = models.TextField(blank=True, null=True)
-    ml_token_expiry_date = models.DateTimeField(blank=True, null=True)
+    ml_token_expiry_date = models.DateTimeField(blank=True, null=True, db_index=True)
+    ml_user_id = models.CharField(max_length=50, blank=True, null=True) # Seller id (returned with the token)
     
     # Shopee Credentials
     shopee_partner_id = models.CharField(max_length=255, blank=True, null=True)
     shopee_partner_key = models.CharField(max_length=255, blank=True, null=True)
     shopee_access_token = models.TextField(blank=True, null=True)
     shopee_refresh_token = models.TextField(blank=True, null=True)
+    shopee_token_expiry_date = models.DateTimeField(blank=True, null=True, db_index=True)
     shopee_shop_id = models.CharField(max_length=255, blank=True, null=True)
 
     def __str__(self):
         return f"Integration Profile for {self.organization.name}"
 
+class SyncCursor(models.Model):
+    """
+    Incremental sync watermark per organization and platform.
+    Stores the last successfully committed update time, so collection runs only fetch deltas.
+    """
+    PLATFORM_CHOICES = [
+        ('ML', 'Mercado Livre'),
+        ('SHOPEE', 'Shopee'),
+    ]
+
+    organization = models.ForeignKey(Organization, on_delete=models.CASCADE, related_name='sync_cursors')
+    platform = models.CharField(max_length=20, choices=PLATFORM_CHOICES)
+    last_synced_at = models.DateTimeField(blank=True, null=True, help_text="Último update_time/date_last_updated processado com sucesso.")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('organization', 'platform')
+
+    def __str__(self):
+        return f"{self.platform} cursor for {self.organization.name}: {self.last_synced_at}"
+
+class CollectionRun(models.Model):
+    """
+    One execution of the order collection fan-out (fetch_all_new_orders).
+    Stores total duration and the outcome reported by each (organization, platform) sub-task.
+    """
+    started_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+    duration_seconds = models.FloatField(blank=True, null=True)
+    tenant_count = models.PositiveIntegerField(default=0)
+    failed_count = models.PositiveIntegerField(default=0)
+    results = models.JSONField(default=list, blank=True)
+
+    def __str__(self):
+        return f"Collection run {self.id} at {self.started_at} ({self.tenant_count} tenants, {self.failed_count} failed)"
+
+class SimulationJob(models.Model):
+    """
+    Asynchronous monthly tax simulation (run_simulation_job). request_key identifies the request
+    and the data generation it ran on, so identical requests reuse the job and its stored result.
+    """
+    STATUS_CHOICES = [
+        ('PENDING', 'Pending'),
+        ('RUNNING', 'Running'),
+        ('DONE', 'Done'),
+        ('FAILED', 'Failed'),
+    ]
+
+    organization = models.ForeignKey(Organization, on_delete=models.CASCADE, related_name='simulation_jobs')
+    request_key = models.CharField(max_length=64)
+    params = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    total_count = models.PositiveIntegerField(default=0)
+    processed_count = models.PositiveIntegerField(default=0)
+    page_count = models.PositiveIntegerField(default=0)
+    result = models.BinaryField(blank=True, null=True) # zlib-compressed JSON of the monthly totals
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['organization', 'request_key'], name='simjob_org_key_idx'),
+            models.Index(fields=['created_at'], name='simjob_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"Simulation job {self.id} ({self.status}, {self.processed_count}/{self.total_count})"
+
+class SimulationResultPage(models.Model):
+    """
+    One chunk of the per-transaction results of a SimulationJob, stored as zlib-compressed JSON.
+    """
+    job = models.ForeignKey(SimulationJob, on_delete=models.CASCADE, related_name='pages')
+    number = models.PositiveIntegerField()
+    row_count = models.PositiveIntegerField(default=0)
+    data = models.BinaryField()
+
+    class Meta:
+        unique_together = ('job', 'number')
+
 class IntegrationErrorLog(models.Model):
     organization = models.ForeignKey(Organization, on_delete=models.CASCADE)
     platform = models.CharField(max_length=50) # 'ML', 'SHOPEE'
@@ -0,0 +1,408 @@
+"""
+Order ingestion pipeline shared by every platform, used by the Celery tasks and the
+management commands.
+
+    fetch -> normalize -> enrich -> margin -> upsert -> rollup
+
+fetch pulls raw orders from a platform client, normalize maps them to a platform-neutral
+dict, enrich resolves the logistics rules and existing rows, margin runs the batch margin
+engine in memory (so each row is written once), upsert is a single INSERT ... ON CONFLICT
+per batch and rollup refreshes DailyProfitSummary for the touched days.
+Time spent in every stage is accumulated in a PipelineMetrics.
+"""
+import logging
+import time
+from contextlib import contextmanager
+from decimal import Decimal
+from datetime import timezone as dt_timezone
+from django.conf import settings
+from django.db import transaction as db_transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .models import IntegrationProfile, SaleTransaction, SaleItem, ProductCost
+from .ml_api import MLClient
+from .shopee_api import ShopeeAPIError, iter_time_windows
+from .shopee_async import AsyncShopeeClient
+from .rollups import refresh_daily_summaries
+from .cubes import deferred_cube_refresh
+from .tax_engine import normalize_uf
+from .logistics_cache import get_logistics_rules
+from .utils import (
+    compute_margins, ensure_fresh_token, get_sync_since, advance_sync_cursor, log_integration_error,
+    MARGIN_FIELDS, CENTS, ML_INITIAL_SYNC_FROM, ML_SYNC_WINDOW, SHOPEE_INITIAL_LOOKBACK,
+)
+
+logger = logging.getLogger(__name__)
+
+STAGES = ('fetch', 'normalize', 'enrich', 'margin', 'upsert', 'rollup')
+
+INGESTION_BATCH_SIZE = 500
+
+UPSERT_FIELDS = [
+    'amount', 'transaction_date', 'transaction_shipping_method', 'destination_uf',
+    'shipping_cost_platform', 'calculated_fixed_cost', 'is_fixed_cost_applied',
+    *MARGIN_FIELDS,
+]
+
+ZERO = Decimal('0.00')
+
+class PipelineMetrics:
+    """
+    Accumulates wall time per stage and created/updated counts across batches.
+    """
+    def __init__(self):
+        self.seconds = dict.fromkeys(STAGES, 0.0)
+        self.created = 0
+        self.updated = 0
+        self.unmatched_skus = 0 # Line items without a ProductCost (no COGS)
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] += time.perf_counter() - start
+
+    @property
+    def orders(self):
+        return self.created + self.updated
+
+    def as_dict(self):
+        return {
+            'created': self.created,
+            'updated': self.updated,
+            'unmatched_skus': self.unmatched_skus,
+            'stages': {name: round(seconds, 3) for name, seconds in self.seconds.items()},
+        }
+
+    def __str__(self):
+        stages = ' | '.join(f"{name} {seconds:.3f}s" for name, seconds in self.seconds.items())
+        return f"{self.created} created, {self.updated} updated, {self.unmatched_skus} unmatched SKUs | {stages}"
+
+# --- Normalize ---
+
+def _to_decimal(value):
+    # JSON numbers arrive as floats; go through str() to avoid binary expansion
+    return Decimal(str(value or 0)).quantize(CENTS)
+
+def normalize_shopee_order(order_data):
+    """
+    Maps a Shopee order detail into the platform-neutral shape consumed by ingest_orders.
+    """
+    return {
+        'external_id': order_data['order_sn'],
+        'amount': _to_decimal(order_data['total_amount']),
+        'transaction_date': timezone.datetime.fromtimestamp(order_data['create_time'], tz=dt_timezone.utc),
+        'shipping_method': order_data.get('shipping_carrier', 'Standard'),
+        'shipping_cost_platform': _to_decimal(order_data.get('actual_shipping_fee', 0)),
+        'destination_uf': normalize_uf((order_data.get('recipient_address') or {}).get('state')),
+        'items': [
+            {
+                'sku': item.get('model_sku') or item.get('item_sku') or '',
+                'external_item_id': str(item['item_id']) if item.get('item_id') else None,
+                'quantity': item.get('model_quantity_purchased') or 1,
+                'unit_price': _to_decimal(item.get('model_discounted_price', item.get('model_original_price'))),
+            }
+            for item in order_data.get('item_list') or []
+        ],
+    }
+
+def normalize_ml_order(order, shipment=None):
+    """
+    Maps a Mercado Livre /orders/search result (and its /shipments detail, when resolved)
+    into the platform-neutral shape consumed by ingest_orders.
+    """
+    shipping = order.get('shipping') or {}
+    shipment = shipment or {}
+    receiver_address = shipment.get('receiver_address') or shipping.get('receiver_address') or {}
+    return {
+        'external_id': str(order['id']),
+        'amount': _to_decimal(order.get('total_amount')),
+        'transaction_date': parse_datetime(order['date_created']),
+        'shipping_method': (shipment.get('logistic_type') or shipping.get('logistic_type')
+                            or shipment.get('mode') or shipping.get('shipping_mode')),
+        # base_cost: what the shipment costs the seller (free shipping subsidy included)
+        'shipping_cost_platform': _to_decimal(shipment.get('base_cost', shipping.get('cost', 0))),
+        'destination_uf': normalize_uf((receiver_address.get('state') or {}).get('id')),
+        'items': [
+            {
+                'sku': (line.get('item') or {}).get('seller_sku') or (line.get('item') or {}).get('seller_custom_field') or '',
+                'external_item_id': (line.get('item') or {}).get('id'),
+                'quantity': line.get('quantity') or 1,
+                'unit_price': _to_decimal(line.get('unit_price')),
+            }
+            for line in order.get('order_items') or []
+        ],
+    }
+
+# --- Enrich / margin / upsert / rollup ---
+
+def _upsert_unique_fields():
+    # A partitioned table only enforces uniqueness together with the partition key.
+    # The order date comes from the platform creation time, so it is stable for an order.
+    if settings.SALE_TRANSACTION_PARTITIONED:
+        return ['organization', 'external_id', 'platform', 'transaction_date']
+    return ['organization', 'external_id', 'platform']
+
+def ingest_orders(organization, platform, orders, metrics=None):
+    """
+    Upserts a batch of normalized orders into SaleTransaction with a constant number of queries:
+    1 for the logistics rules (none when cached), 1 for the existing keys, 1 for tax profiles (margins are computed
+    in memory) and a single bulk_create(update_conflicts=True) on the unique_together key.
+    Orders with line items add 1 query for the SKU costs and 3 to replace their SaleItem rows.
+    The DailyProfitSummary rows of the touched days are refreshed afterwards.
+    Returns {'created': n, 'updated': n}.
+    """
+    metrics = metrics or PipelineMetrics()
+
+    with metrics.stage('enrich'):
+        # Last occurrence wins if the platform repeats an order inside the batch
+        orders = list({order['external_id']: order for order in orders}.values())
+        if not orders:
+            return {'created': 0, 'updated': 0}
+
+        fixed_costs = get_logistics_rules(organization.id)
+        existing = dict(
+            SaleTransaction.objects.filter(
+                organization=organization,
+                platform=platform,
+                external_id__in=[order['external_id'] for order in orders]
+            ).values_list('external_id', 'transaction_date')
+        )
+
+        # SKU -> net cost for every SKU of the batch, in one query
+        skus = {item['sku'] for order in orders for item in order.get('items', ()) if item['sku']}
+        unit_costs = dict(
+            ProductCost.objects.filter(organization=organization, sku__in=skus).values_list('sku', 'net_cost')
+        ) if skus else {}
+
+        transactions = []
+        for order in orders:
+            cogs = ZERO
+            for item in order.get('items', ()):
+                item['unit_cost'] = unit_costs.get(item['sku'])
+                if item['unit_cost'] is None:
+                    metrics.unmatched_skus += 1
+                else:
+                    cogs += item['unit_cost'] * item['quantity']
+
+            # Logic: Check Fixed Cost. A positive fixed cost replaces the platform shipping cost.
+            fixed_cost = fixed_costs.get((platform, order['shipping_method']), Decimal('0.00'))
+            transactions.append(SaleTransaction(
+                organization=organization,
+                external_id=order['external_id'],
+                platform=platform,
+                amount=order['amount'],
+                transaction_date=order['transaction_date'],
+                transaction_shipping_method=order['shipping_method'],
+                destination_uf=order.get('destination_uf'),
+                shipping_cost_platform=order['shipping_cost_platform'],
+                calculated_fixed_cost=fixed_cost,
+                is_fixed_cost_applied=fixed_cost > 0,
+                cogs_amount=cogs,
+            ))
+
+    with metrics.stage('margin'):
+        compute_margins(transactions, save=False)
+
+    with metrics.stage('upsert'):
+        SaleTransaction.objects.bulk_create(
+            transactions,
+            batch_size=INGESTION_BATCH_SIZE,
+            update_conflicts=True,
+            unique_fields=_upsert_unique_fields(),
+            update_fields=UPSERT_FIELDS,
+        )
+        _replace_items(organization, platform, orders)
+
+    with metrics.stage('rollup'):
+        # Keep the daily rollup in sync for every day touched (including the previous day of moved orders)
+        touched_days = {timezone.localdate(order['transaction_date']) for order in orders}
+        touched_days.update(timezone.localdate(date) for date in existing.values())
+        refresh_daily_summaries(organization.id, platform, touched_days)
+
+    result = {'created': len(orders) - len(existing), 'updated': len(existing)}
+    metrics.created += result['created']
+    metrics.updated += result['updated']
+    return result
+
+def _replace_items(organization, platform, orders):
+    """
+    Rewrites the SaleItem rows of the orders that carry line items.
+    """
+    with_items = {order['external_id']: order['items'] for order in orders if order.get('items')}
+    if not with_items:
+        return
+
+    transaction_ids = dict(
+        SaleTransaction.objects.filter(
+            organization=organization, platform=platform, external_id__in=list(with_items)
+        ).values_list('external_id', 'id')
+    )
+    SaleItem.objects.filter(transaction_id__in=transaction_ids.values()).delete()
+    SaleItem.objects.bulk_create([
+        SaleItem(
+            transaction_id=transaction_ids[external_id],
+            sku=item['sku'],
+            external_item_id=item['external_item_id'],
+            quantity=item['quantity'],
+            unit_price=item['unit_price'],
+            unit_cost=item['unit_cost'],
+        )
+        for external_id, items in with_items.items()
+        for item in items
+    ], batch_size=INGESTION_BATCH_SIZE)
+
+# --- Pipeline ---
+
+_END = object()
+
+def run_order_pipeline(organization, platform, raw_orders, normalize, metrics=None, batch_size=INGESTION_BATCH_SIZE):
+    """
+    Pulls raw orders from any iterable (a platform client stream), normalizes them and
+    ingests them in bounded batches, each in its own transaction (the upsert is idempotent,
+    so a failure only loses the current batch). Returns the number of orders processed.
+    """
+    metrics = metrics or PipelineMetrics()
+    raw_orders = iter(raw_orders)
+    processed = 0
+    batch = []
+
+    while True:
+        with metrics.stage('fetch'):
+            raw = next(raw_orders, _END)
+        if raw is _END:
+            break
+        with metrics.stage('normalize'):
+            batch.append(normalize(raw))
+        if len(batch) == batch_size:
+            with db_transaction.atomic():
+                ingest_orders(organization, platform, batch, metrics)
+            processed += len(batch)
+            batch = []
+
+    if batch:
+        with db_transaction.atomic():
+            ingest_orders(organization, platform, batch, metrics)
+        processed += len(batch)
+    return processed
+
+def sync_ml_orders(profile: IntegrationProfile, metrics=None):
+    """
+    Fetches and processes Mercado Livre orders for a single profile.
+    Pages through every order updated since the last committed sync, resolving shipment
+    costs per page, and upserts them in bounded batches. The range is split into ML_SYNC_WINDOW
+    windows and the watermark moves after each one, so a long first sync that hits the task
+    time limit resumes from the last completed window.
+    Raises on failure; returns the number of orders processed.
+    """
+    ensure_fresh_token(profile, 'ML')
+
+    client = MLClient(profile.ml_access_token, profile.ml_user_id, app_id=profile.ml_client_id)
+    if not profile.ml_user_id:
+        profile.ml_user_id = client.seller_id = str(client.get_me()['id'])
+        profile.save(update_fields=['ml_user_id'])
+
+    synced_at = timezone.now()
+    since = get_sync_since(profile.organization, 'ML', ML_INITIAL_SYNC_FROM)
+
+    processed = 0
+    windows = iter_time_windows(int(since.timestamp()), int(synced_at.timestamp()), max_window=int(ML_SYNC_WINDOW.total_seconds()))
+    # The profit cubes of the touched months are refreshed once, when the run ends
+    with deferred_cube_refresh():
+        for window_from, window_to in windows:
+            processed += run_order_pipeline(
+                profile.organization, 'ML', client.iter_orders(_ml_date(window_from), _ml_date(window_to)),
+                lambda pair: normalize_ml_order(*pair), metrics,
+            )
+            # Every page of the window was read and committed: a later failure resumes from here
+            advance_sync_cursor(profile.organization, 'ML', timezone.datetime.fromtimestamp(window_to, tz=dt_timezone.utc))
+    return processed
+
+def _ml_date(timestamp):
+    return timezone.datetime.fromtimestamp(timestamp, tz=dt_timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.000-00:00')
+
+def sync_shopee_orders(tenant_profile: IntegrationProfile, metrics=None):
+    """
+    Fetches and processes Shopee orders for a specific tenant.
+    Raises on failure; returns the number of orders processed.
+    """
+    if not tenant_profile.shopee_access_token or not tenant_profile.shopee_shop_id:
+        logger.warning(f"Shopee credentials missing for {tenant_profile.organization.name}")
+        return 0
+
+    ensure_fresh_token(tenant_profile, 'SHOPEE')
+
+    client = AsyncShopeeClient(
+        partner_id=tenant_profile.shopee_partner_id,
+        partner_key=tenant_profile.shopee_partner_key,
+        access_token=tenant_profile.shopee_access_token,
+        shop_id=tenant_profile.shopee_shop_id,
+        concurrency=settings.SHOPEE_DETAIL_CONCURRENCY,
+    )
+
+    # Time range: orders updated since the last committed sync (first run: last 15 days)
+    organization = tenant_profile.organization
+    now = timezone.now()
+    since = get_sync_since(organization, 'SHOPEE', now - SHOPEE_INITIAL_LOOKBACK)
+    time_to = int(now.timestamp())
+    time_from = int(since.timestamp())
+
+    processed = 0
+    # The profit cubes of the touched months are refreshed once, when the run ends
+    with deferred_cube_refresh():
+        for window_from, window_to in iter_time_windows(time_from, time_to):
+            # Orders are streamed: the client follows the list cursor and fetches details in chunks of 50
+            # (several chunks in flight), and are upserted in bounded batches, each committed on its own
+            processed += run_order_pipeline(
+                organization, 'SHOPEE',
+                client.iter_orders(window_from, window_to, time_range_field='update_time'),
+                normalize_shopee_order, metrics,
+            )
+
+            # Every batch of the window was committed: a failure in the next window resumes from here
+            advance_sync_cursor(organization, 'SHOPEE', timezone.datetime.fromtimestamp(window_to, tz=dt_timezone.utc))
+
+    return processed
+
+def fetch_and_process_orders(platform, profiles=None):
+    """
+    Runs the pipeline for every connected profile of a platform (or the given profiles),
+    logging failures per tenant. Returns the PipelineMetrics of the whole run.
+    """
+    if profiles is None:
+        if platform == 'ML':
+            profiles = IntegrationProfile.objects.filter(ml_access_token__isnull=False)
+        else:
+            profiles = IntegrationProfile.objects.filter(shopee_access_token__isnull=False, shopee_shop_id__isnull=False)
+        profiles = profiles.select_related('organization')
+
+    sync = sync_ml_orders if platform == 'ML' else sync_shopee_orders
+    task_name = f'fetch_and_process_{platform.lower()}_orders'
+    metrics = PipelineMetrics()
+
+    for profile in profiles:
+        try:
+            sync(profile, metrics)
+        except ShopeeAPIError as e:
+            log_integration_error(profile.organization, platform, task_name, f"Shopee API Error: {e.message}")
+        except Exception as e:
+            log_integration_error(profile.organization, platform, task_name, f"Error fetching {platform} orders: {e}")
+
+    if metrics.unmatched_skus:
+        logger.warning(f"{platform} collection: {metrics.unmatched_skus} line items without ProductCost (COGS not applied)")
+    logger.info(f"{platform} collection: {metrics}")
+    return metrics
+
+def fetch_and_process_ml_orders():
+    """
+    Fetches orders from Mercado Livre for all active profiles and processes them.
+    """
+    return fetch_and_process_orders('ML')
+
+def fetch_and_process_shopee_orders(tenant_profile: IntegrationProfile = None):
+    """
+    Fetches and processes Shopee orders for one tenant (default: all connected tenants), logging failures.
+    """
+    return fetch_and_process_orders('SHOPEE', [tenant_profile] if tenant_profile else None)
@@ -0,0 +1,147 @@
+"""
+Token-bucket rate limiter shared by every worker calling the same marketplace app.
+
+Buckets are keyed by platform + app credential (shopee_partner_id / ml_client_id) and live in
+Redis (the Celery broker by default), so all workers draw from the same budget. Callers
+reserve a token and sleep for the returned delay, which queues them fairly instead of making
+them all back off at once. Without Redis (tests, local runs) a per-process bucket is used;
+when Redis is configured but unreachable, the per-process bucket is used until
+REDIS_RETRY_AFTER has passed and Redis is tried again.
+"""
+import asyncio
+import logging
+import threading
+import time
+from collections import defaultdict
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+REDIS_RETRY_AFTER = 30 # seconds on the per-process bucket before reconnecting to Redis
+
+# Atomic refill + reservation. Tokens may go negative: the deficit is the caller's wait.
+# Uses the Redis clock so workers on different hosts agree on elapsed time.
+RESERVE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) + tonumber(now_parts[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or burst
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate) - 1
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil((burst - tokens) / rate) + 1)
+if tokens >= 0 then
+    return '0'
+end
+return tostring(-tokens / rate)
+"""
+
+class MemoryTokenBucket:
+    """
+    Per-process buckets with the same reservation semantics as the Redis script.
+    """
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def reserve(self, key, rate, burst):
+        with self._lock:
+            now = time.monotonic()
+            tokens, ts = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - ts) * rate) - 1
+            self._buckets[key] = (tokens, now)
+        return 0.0 if tokens >= 0 else -tokens / rate
+
+class RedisTokenBucket:
+    def __init__(self, client):
+        self._reserve = client.register_script(RESERVE_SCRIPT)
+
+    def reserve(self, key, rate, burst):
+        return float(self._reserve(keys=[f'ratelimit:{key}'], args=[rate, burst]))
+
+_backend = None
+_retry_at = 0.0 # monotonic time of the next Redis attempt while on the fallback
+_backend_lock = threading.Lock()
+_fallback = MemoryTokenBucket()
+
+def _get_backend():
+    global _backend, _retry_at
+    with _backend_lock:
+        url = getattr(settings, 'MARKETPLACE_RATE_LIMIT_URL', None)
+        if _backend is None or (_backend is _fallback and url and time.monotonic() >= _retry_at):
+            _backend = _fallback
+            if url:
+                try:
+                    import redis
+                    client = redis.Redis.from_url(url, socket_connect_timeout=0.5, socket_timeout=1)
+                    client.ping()
+                    _backend = RedisTokenBucket(client)
+                except Exception as e:
+                    _retry_at = time.monotonic() + REDIS_RETRY_AFTER
+                    logger.warning(f"Rate limiter Redis unavailable ({e}); using per-process buckets")
+        return _backend
+
+def _backend_failed(backend):
+    """
+    Moves to the per-process buckets after a Redis error; Redis is retried after REDIS_RETRY_AFTER.
+    """
+    global _backend, _retry_at
+    with _backend_lock:
+        if _backend is backend:
+            _backend = _fallback
+            _retry_at = time.monotonic() + REDIS_RETRY_AFTER
+
+# Metrics: cumulative per platform, per process
+_stats = defaultdict(lambda: {'calls': 0, 'throttled': 0, 'wait_seconds': 0.0})
+_stats_lock = threading.Lock()
+
+def _reserve(platform, app_id):
+    rate, burst = settings.MARKETPLACE_RATE_LIMITS[platform]
+    key = f'{platform}:{app_id}'
+    backend = _get_backend()
+    try:
+        wait = backend.reserve(key, rate, burst)
+    except Exception as e:
+        # Redis hiccup: never block collection on the limiter itself
+        logger.warning(f"Rate limiter error for {key} ({e}); using per-process bucket")
+        _backend_failed(backend)
+        wait = _fallback.reserve(key, rate, burst)
+
+    with _stats_lock:
+        stats = _stats[platform]
+        stats['calls'] += 1
+        if wait > 0:
+            stats['throttled'] += 1
+            stats['wait_seconds'] += wait
+    return wait
+
+def acquire(platform, app_id):
+    """
+    Blocks until a request to the platform is allowed for this app. Returns the time waited.
+    """
+    wait = _reserve(platform, app_id)
+    if wait > 0:
+        time.sleep(wait)
+    return wait
+
+async def acquire_async(platform, app_id):
+    """
+    asyncio version of acquire.
+    """
+    wait = _reserve(platform, app_id)
+    if wait > 0:
+        await asyncio.sleep(wait)
+    return wait
+
+def rate_limit_stats():
+    """
+    {platform: {'calls', 'throttled', 'wait_seconds'}} for this process.
+    """
+    with _stats_lock:
+        return {platform: dict(stats) for platform, stats in _stats.items()}
+
+def rate_limit_wait(platform):
+    with _stats_lock:
+        return _stats[platform]['wait_seconds'] if platform in _stats else 0.0
@@ -0,0 +1,201 @@
+"""
+Recomputes stored margins when the inputs behind them change.
+
+ProductCost, TaxProfile and LogisticsCostTable signals describe what changed (SKUs,
+the whole organization, or (platform, shipping_method) rules). Every job carries the change
+that scheduled it in its arguments. With a cache shared by the web and worker processes,
+changes are also merged into a pending scope per organization and a single delayed Celery
+job consumes it, so a burst of edits (an admin bulk action, a CSV import) becomes one
+recalculation.
+"""
+import logging
+import operator
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from decimal import Decimal
+from functools import reduce
+from django.core.cache import cache
+from django.db import transaction as db_transaction
+from django.db.models import Q
+from django.utils import timezone
+from .models import SaleTransaction, SaleItem, ProductCost
+from .logistics_cache import get_logistics_rules
+from .rollups import refresh_daily_summaries
+from .utils import compute_margins, MARGIN_FIELDS, MARGIN_BULK_UPDATE_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+RECALC_DEBOUNCE = 30 # seconds; edits inside this window share one job
+RECALC_CHUNK_SIZE = 1000
+RECALC_SCOPE_TIMEOUT = 60 * 60 # Safety net if a job is lost
+RECALC_LOCK_TIMEOUT = 10 # seconds
+
+RECALC_FIELDS = ['calculated_fixed_cost', 'is_fixed_cost_applied', *MARGIN_FIELDS]
+
+ZERO = Decimal('0.00')
+
+# --- Pending scope ---
+
+def _scope_key(organization_id):
+    return f'margin_recalc:{organization_id}:scope'
+
+def _scheduled_key(organization_id):
+    return f'margin_recalc:{organization_id}:scheduled'
+
+@contextmanager
+def _scope_lock(organization_id):
+    """
+    Serializes read-modify-write of the scope between the signal handlers and the job.
+    Yields whether the lock was taken within RECALC_LOCK_TIMEOUT; a lock that could not be
+    taken is left to expire, never deleted on behalf of its holder.
+    """
+    key = f'margin_recalc:{organization_id}:lock'
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + RECALC_LOCK_TIMEOUT
+    acquired = cache.add(key, token, RECALC_LOCK_TIMEOUT)
+    while not acquired and time.monotonic() < deadline:
+        time.sleep(0.05)
+        acquired = cache.add(key, token, RECALC_LOCK_TIMEOUT)
+    try:
+        yield acquired
+    finally:
+        if acquired and cache.get(key) == token:
+            cache.delete(key)
+
+def empty_scope():
+    return {'skus': set(), 'shipping_methods': set(), 'everything': False}
+
+def merge_scope(scope, skus=(), shipping_methods=(), everything=False):
+    scope['skus'].update(skus)
+    scope['shipping_methods'].update(tuple(rule) for rule in shipping_methods)
+    scope['everything'] = scope['everything'] or everything
+    return scope
+
+def queue_recalculation(organization_id, skus=(), shipping_methods=(), everything=False):
+    """
+    Merges a change into the organization's pending scope.
+    Returns True when no job is pending yet (or the scope is busy), i.e. the caller must schedule one.
+    The pending marker counts the changes merged for the scheduled job.
+    """
+    with _scope_lock(organization_id) as locked:
+        if not locked:
+            return True # The change still reaches a job through the task arguments
+        scope = cache.get(_scope_key(organization_id)) or empty_scope()
+        cache.set(_scope_key(organization_id), merge_scope(scope, skus, shipping_methods, everything), RECALC_SCOPE_TIMEOUT)
+
+        if cache.add(_scheduled_key(organization_id), 1, RECALC_SCOPE_TIMEOUT):
+            return True
+        try:
+            cache.incr(_scheduled_key(organization_id))
+        except ValueError: # The job released the marker meanwhile
+            return cache.add(_scheduled_key(organization_id), 1, RECALC_SCOPE_TIMEOUT)
+        return False
+
+def release_recalculation(organization_id):
+    """
+    Clears the pending-job marker, so the next change schedules a new job.
+    """
+    cache.delete(_scheduled_key(organization_id))
+
+def pop_recalculation_scope(organization_id):
+    """
+    Takes the pending scope of an organization. Returns (scope, changes): scope is None when it
+    was evicted or already taken; changes is the number of changes merged for this job according
+    to the pending marker (None when the marker is gone).
+    Changes arriving while the job runs go to a new scope and a new job.
+    """
+    with _scope_lock(organization_id) as locked:
+        changes = cache.get(_scheduled_key(organization_id))
+        release_recalculation(organization_id)
+        scope = cache.get(_scope_key(organization_id))
+        if locked: # Otherwise the scope is left for the next job (recalculating twice is harmless)
+            cache.delete(_scope_key(organization_id))
+    return scope, changes
+
+# --- Recalculation ---
+
+def _affected_transactions(organization_id, skus, shipping_methods, everything):
+    queryset = SaleTransaction.objects.filter(organization_id=organization_id)
+    if everything:
+        return queryset
+
+    conditions = [
+        Q(platform=platform, transaction_shipping_method=shipping_method)
+        for platform, shipping_method in shipping_methods
+    ]
+    if skus:
+        conditions.append(Q(pk__in=SaleItem.objects.filter(
+            transaction__organization_id=organization_id, sku__in=list(skus)
+        ).values('transaction_id')))
+    if not conditions:
+        return queryset.none()
+    return queryset.filter(reduce(operator.or_, conditions))
+
+def _resolve_cogs(organization_id, transactions):
+    """
+    Re-matches the line items of the transactions against the current ProductCost rows and
+    sets cogs_amount. Transactions ingested without line items keep their stored COGS.
+    """
+    by_id = {t.pk: t for t in transactions}
+    items = list(SaleItem.objects.filter(transaction_id__in=list(by_id)).only('id', 'transaction_id', 'sku', 'quantity', 'unit_cost'))
+    if not items:
+        return
+
+    unit_costs = dict(ProductCost.objects.filter(
+        organization_id=organization_id, sku__in={item.sku for item in items if item.sku}
+    ).values_list('sku', 'net_cost'))
+
+    cogs = defaultdict(lambda: ZERO)
+    changed = []
+    for item in items:
+        unit_cost = unit_costs.get(item.sku)
+        if unit_cost != item.unit_cost:
+            item.unit_cost = unit_cost
+            changed.append(item)
+        cogs[item.transaction_id] += (unit_cost or ZERO) * item.quantity
+
+    for transaction_id, amount in cogs.items():
+        by_id[transaction_id].cogs_amount = amount
+    if changed:
+        SaleItem.objects.bulk_update(changed, ['unit_cost'], batch_size=MARGIN_BULK_UPDATE_BATCH_SIZE)
+
+def recalculate_margins(organization_id, skus=(), shipping_methods=(), everything=False, chunk_size=RECALC_CHUNK_SIZE):
+    """
+    Recomputes COGS, fixed logistics cost and margins of the transactions affected by a change:
+    those with a line item of one of the SKUs, those shipped with one of the (platform, shipping_method)
+    rules, or every transaction of the organization (tax profile change).
+    Rows are walked in primary key order (keyset pagination) and written with one bulk_update per chunk;
+    the DailyProfitSummary rows of the touched days are refreshed at the end.
+    Returns the number of transactions rewritten.
+    """
+    queryset = _affected_transactions(organization_id, skus, shipping_methods, everything)
+    fixed_costs = get_logistics_rules(organization_id)
+
+    touched_days = defaultdict(set)
+    last_id = 0
+    recalculated = 0
+    while True:
+        chunk = list(queryset.filter(pk__gt=last_id).order_by('pk')[:chunk_size])
+        if not chunk:
+            break
+        last_id = chunk[-1].pk
+
+        with db_transaction.atomic():
+            _resolve_cogs(organization_id, chunk)
+            for transaction in chunk:
+                fixed_cost = fixed_costs.get((transaction.platform, transaction.transaction_shipping_method), ZERO)
+                transaction.calculated_fixed_cost = fixed_cost
+                transaction.is_fixed_cost_applied = fixed_cost > 0
+                touched_days[transaction.platform].add(timezone.localdate(transaction.transaction_date))
+
+            compute_margins(chunk, save=False)
+            SaleTransaction.objects.bulk_update(chunk, RECALC_FIELDS, batch_size=MARGIN_BULK_UPDATE_BATCH_SIZE)
+        recalculated += len(chunk)
+
+    for platform, days in touched_days.items():
+        refresh_daily_summaries(organization_id, platform, days)
+
+    logger.info(f"Recalculated {recalculated} transactions for organization {organization_id}")
+    return recalculated
@@ -0,0 +1,120 @@
+import logging
+import operator
+from datetime import timedelta
+from decimal import Decimal
+from functools import reduce
+from django.db import transaction as db_transaction
+from django.db.models import Q, Sum, Count
+from django.db.models.functions import TruncDate
+from .models import SaleTransaction, DailyProfitSummary
+from .analytics_cache import bump_generation
+from .cubes import refresh_cubes, rebuild_cubes, day_start
+
+logger = logging.getLogger(__name__)
+
+# SaleTransaction column -> DailyProfitSummary column
+SUMMARY_MEASURES = {
+    'amount': 'revenue',
+    'net_margin': 'net_margin',
+    'shipping_cost_platform': 'shipping_cost_platform',
+    'calculated_fixed_cost': 'calculated_fixed_cost',
+    'tax_amount': 'tax_amount',
+    'commission_amount': 'commission_amount',
+    'cogs_amount': 'cogs_amount',
+    'total_logistics': 'total_logistics',
+}
+
+def _aggregate_days(queryset):
+    """
+    Groups a SaleTransaction queryset by (organization, platform, day) into unsaved DailyProfitSummary rows.
+    """
+    rows = queryset.annotate(day=TruncDate('transaction_date')).values(
+        'organization_id', 'platform', 'day'
+    ).annotate(
+        order_count=Count('id'),
+        **{summary_field: Sum(field) for field, summary_field in SUMMARY_MEASURES.items()}
+    ).order_by()
+
+    summaries = []
+    for row in rows:
+        summaries.append(DailyProfitSummary(
+            organization_id=row['organization_id'],
+            platform=row['platform'],
+            date=row['day'],
+            order_count=row['order_count'],
+            **{summary_field: row[summary_field] or Decimal('0.00') for summary_field in SUMMARY_MEASURES.values()}
+        ))
+    return summaries
+
+def _upsert(summaries):
+    DailyProfitSummary.objects.bulk_create(
+        summaries,
+        batch_size=500,
+        update_conflicts=True,
+        unique_fields=['organization', 'platform', 'date'],
+        update_fields=['order_count', *SUMMARY_MEASURES.values()],
+    )
+
+def _days_filter(dates):
+    """
+    Half-open transaction_date ranges covering the days, consecutive days merged into one range.
+    The raw datetime is compared (not its date), so the index and partition pruning apply.
+    """
+    ranges = []
+    for day in sorted(dates):
+        if ranges and ranges[-1][1] == day:
+            ranges[-1][1] = day + timedelta(days=1)
+        else:
+            ranges.append([day, day + timedelta(days=1)])
+    return reduce(operator.or_, (
+        Q(transaction_date__gte=day_start(start), transaction_date__lt=day_start(end)) for start, end in ranges
+    ))
+
+def _invalidate_analytics(organization_id):
+    # Bumped before COMMIT, a request could still read the old rows and cache them under the new generation
+    db_transaction.on_commit(lambda: bump_generation(organization_id))
+
+def refresh_daily_summaries(organization_id, platform, dates):
+    """
+    Recomputes the rollup rows for the given days from SaleTransaction (incremental update after ingestion).
+    Days that no longer have transactions are removed.
+    Called after every write of an organization's transactions, so it also refreshes the profit cubes
+    of the touched months (once per sync run, see deferred_cube_refresh) and invalidates the
+    organization's cached analytics once the write commits.
+    """
+    dates = set(dates)
+    if not dates:
+        return
+
+    summaries = _aggregate_days(SaleTransaction.objects.filter(
+        _days_filter(dates),
+        organization_id=organization_id,
+        platform=platform,
+    ))
+    _upsert(summaries)
+
+    empty_days = dates - {summary.date for summary in summaries}
+    if empty_days:
+        DailyProfitSummary.objects.filter(organization_id=organization_id, platform=platform, date__in=empty_days).delete()
+
+    refresh_cubes(organization_id, platform, {day.replace(day=1) for day in dates})
+    _invalidate_analytics(organization_id)
+
+def reconcile_daily_summaries(organization_id):
+    """
+    Rebuilds every rollup and cube row of an organization from SaleTransaction and drops stale ones.
+    """
+    summaries = _aggregate_days(SaleTransaction.objects.filter(organization_id=organization_id))
+    _upsert(summaries)
+
+    keep = {(summary.platform, summary.date) for summary in summaries}
+    stale = [
+        summary.id for summary in DailyProfitSummary.objects.filter(organization_id=organization_id).only('id', 'platform', 'date')
+        if (summary.platform, summary.date) not in keep
+    ]
+    if stale:
+        DailyProfitSummary.objects.filter(id__in=stale).delete()
+    rebuild_cubes(organization_id)
+
+    _invalidate_analytics(organization_id)
+    return len(summaries)
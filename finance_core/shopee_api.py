@@ -1,11 +1,26 @@
 import hmac
 import hashlib
 import time
-import requests
 import json
+from .marketplace_http import get_session
+from .rate_limit import acquire
 
 SHOPEE_API_URL = "https://partner.shopeemobile.com/api/v2"
 
+# API limits
+ORDER_LIST_MAX_PAGE_SIZE = 100
+ORDER_DETAIL_MAX_SNS = 50
+ORDER_LIST_MAX_WINDOW = 15 * 24 * 3600 # get_order_list accepts at most 15 days per request
+
+class ShopeeAPIError(Exception):
+    """
+    Raised when Shopee answers with an 'error' field in the response body.
+    """
+    def __init__(self, error, message=None):
+        self.error = error
+        self.message = message
+        super().__init__(f"{error}: {message}")
+
 class ShopeeClient:
     def __init__(self, partner_id, partner_key, access_token=None, shop_id=None):
         self.partner_id = int(partner_id)
@@ -57,7 +72,8 @@ class ShopeeClient:
         # Merge specific params
         query_params.update(params)
         
-        response = requests.get(url, params=query_params)
+        acquire('SHOPEE', self.partner_id)
+        response = get_session().get(url, params=query_params)
         response.raise_for_status()
         return response.json()
 
@@ -69,16 +85,17 @@ class ShopeeClient:
         path = "/shop/get_shop_info"
         return self._make_request(path)
 
-    def get_order_list(self, time_from, time_to, page_size=20):
+    def get_order_list(self, time_from, time_to, page_size=20, cursor="", time_range_field="create_time"):
         """
         Wraps /order/get_order_list
         """
         path = "/order/get_order_list"
         params = {
-            "time_range_field": "create_time",
+            "time_range_field": time_range_field,
             "time_from": time_from,
             "time_to": time_to,
-            "page_size": page_size
+            "page_size": page_size,
+            "cursor": cursor
         }
         return self._make_request(path, params)
 
@@ -89,6 +106,56 @@ class ShopeeClient:
         path = "/order/get_order_detail"
         params = {
             "order_sn_list": ",".join(order_sn_list),
-            "response_optional_fields": "total_amount,shipping_carrier,actual_shipping_fee,create_time,item_list"
+            "response_optional_fields": "total_amount,shipping_carrier,actual_shipping_fee,create_time,item_list,recipient_address"
         }
         return self._make_request(path, params)
+
+    def iter_order_sns(self, time_from, time_to, page_size=ORDER_LIST_MAX_PAGE_SIZE, time_range_field="create_time"):
+        """
+        Yields every order_sn in the time range, following 'more'/'next_cursor'.
+        """
+        cursor = ""
+        while True:
+            resp = self.get_order_list(time_from, time_to, page_size=page_size, cursor=cursor, time_range_field=time_range_field)
+            if resp.get('error'):
+                raise ShopeeAPIError(resp['error'], resp.get('message'))
+
+            data = resp.get('response', {})
+            for order in data.get('order_list', []):
+                yield order['order_sn']
+
+            cursor = data.get('next_cursor')
+            if not data.get('more') or not cursor:
+                return
+
+    def iter_orders(self, time_from, time_to, time_range_field="create_time"):
+        """
+        Yields order detail dicts for the time range as they arrive.
+        Detail calls are chunked to the API limit of 50 order_sns per request,
+        so at most one page of details is held in memory at a time.
+        """
+        batch = []
+        for order_sn in self.iter_order_sns(time_from, time_to, time_range_field=time_range_field):
+            batch.append(order_sn)
+            if len(batch) == ORDER_DETAIL_MAX_SNS:
+                yield from self._iter_order_details(batch)
+                batch = []
+
+        if batch:
+            yield from self._iter_order_details(batch)
+
+    def _iter_order_details(self, order_sn_list):
+        resp = self.get_order_detail(order_sn_list)
+        if resp.get('error'):
+            raise ShopeeAPIError(resp['error'], resp.get('message'))
+        yield from resp.get('response', {}).get('order_list', [])
+
+
+def iter_time_windows(time_from, time_to, max_window=ORDER_LIST_MAX_WINDOW):
+    """
+    Splits [time_from, time_to] (unix timestamps) into consecutive windows accepted by get_order_list.
+    """
+    while time_from < time_to:
+        window_to = min(time_from + max_window, time_to)
+        yield time_from, window_to
+        time_from = window_to
@@ -0,0 +1,177 @@
+"""
+Concurrent Shopee order detail fetcher.
+
+get_order_list is a cursor, so listing stays sequential, but each page of up to 50 order_sns
+is fetched with get_order_detail concurrently (bounded by a semaphore) on an asyncio loop
+running in a background thread. Detail pages are handed to the caller through a bounded
+queue, so ingestion (Django ORM, transactions) stays in the calling thread.
+
+Memory is bounded end to end: a detail task holds its semaphore slot until its page is in the
+queue, and the list cursor only advances while fewer than `concurrency` detail tasks are
+pending, so a slow consumer pauses both detail and list requests. Requests follow the retry
+policy of marketplace_http (429/5xx and connection errors, backoff with jitter, Retry-After).
+"""
+import asyncio
+import queue
+import threading
+import httpx
+from .marketplace_http import backoff_delay, MAX_RETRIES, RETRY_STATUSES
+from .rate_limit import acquire_async
+from .shopee_api import (
+    ShopeeClient, ShopeeAPIError, SHOPEE_API_URL, ORDER_LIST_MAX_PAGE_SIZE, ORDER_DETAIL_MAX_SNS,
+)
+
+DEFAULT_DETAIL_CONCURRENCY = 4
+REQUEST_TIMEOUT = httpx.Timeout(30, connect=5)
+CONNECT_RETRIES = 3
+
+ORDER_DETAIL_FIELDS = "total_amount,shipping_carrier,actual_shipping_fee,create_time,item_list,recipient_address"
+
+_DONE = object()
+
+class _Stopped(Exception):
+    """
+    The consumer stopped reading; the fetcher winds down.
+    """
+
+class AsyncShopeeClient(ShopeeClient):
+    """
+    ShopeeClient whose iter_orders fetches detail pages concurrently.
+    Signing is inherited from ShopeeClient._generate_signature.
+    """
+    def __init__(self, partner_id, partner_key, access_token=None, shop_id=None,
+                 concurrency=DEFAULT_DETAIL_CONCURRENCY, base_url=SHOPEE_API_URL):
+        super().__init__(partner_id, partner_key, access_token=access_token, shop_id=shop_id)
+        self.concurrency = concurrency
+        self.base_url = base_url
+
+    async def _get(self, http, path, params):
+        for retry in range(MAX_RETRIES + 1):
+            # Signed per attempt: the signature embeds the timestamp
+            sign, timestamp = self._generate_signature(path, self.access_token, self.shop_id)
+            query_params = {
+                "partner_id": self.partner_id,
+                "timestamp": timestamp,
+                "sign": sign,
+                "access_token": self.access_token,
+                "shop_id": self.shop_id,
+                **params,
+            }
+            await acquire_async('SHOPEE', self.partner_id)
+            try:
+                response = await http.get(f"{self.base_url}{path}", params=query_params)
+            except httpx.TransportError:
+                if retry == MAX_RETRIES:
+                    raise
+                await asyncio.sleep(backoff_delay(retry))
+                continue
+            if response.status_code in RETRY_STATUSES and retry < MAX_RETRIES:
+                await asyncio.sleep(backoff_delay(retry, response.headers.get('Retry-After')))
+                continue
+            response.raise_for_status()
+            data = response.json()
+            if data.get('error'):
+                raise ShopeeAPIError(data['error'], data.get('message'))
+            return data.get('response', {})
+
+    async def fetch_orders(self, time_from, time_to, emit, time_range_field="create_time", stop=None):
+        """
+        Pages the order list and fetches details concurrently, awaiting emit(orders) per detail page.
+        At most `concurrency` detail pages are being fetched or waiting on emit at any time.
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+        transport = httpx.AsyncHTTPTransport(retries=CONNECT_RETRIES)
+        limits = httpx.Limits(max_connections=self.concurrency + 1)
+
+        async with httpx.AsyncClient(transport=transport, limits=limits, timeout=REQUEST_TIMEOUT) as http:
+
+            async def fetch_details(order_sn_list):
+                # The slot is held until the page is handed over, so a full queue stops new fetches
+                async with semaphore:
+                    data = await self._get(http, "/order/get_order_detail", {
+                        "order_sn_list": ",".join(order_sn_list),
+                        "response_optional_fields": ORDER_DETAIL_FIELDS,
+                    })
+                    await emit(data.get('order_list', []))
+
+            pending = set()
+
+            async def wait_below(limit):
+                nonlocal pending
+                while len(pending) > limit:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        task.result() # Raises the first error
+
+            try:
+                cursor = ""
+                while True:
+                    if stop is not None and stop.is_set():
+                        raise _Stopped()
+                    data = await self._get(http, "/order/get_order_list", {
+                        "time_range_field": time_range_field,
+                        "time_from": time_from,
+                        "time_to": time_to,
+                        "page_size": ORDER_LIST_MAX_PAGE_SIZE,
+                        "cursor": cursor,
+                    })
+                    order_sns = [order['order_sn'] for order in data.get('order_list', [])]
+                    for start in range(0, len(order_sns), ORDER_DETAIL_MAX_SNS):
+                        await wait_below(self.concurrency - 1)
+                        pending.add(asyncio.ensure_future(fetch_details(order_sns[start:start + ORDER_DETAIL_MAX_SNS])))
+
+                    cursor = data.get('next_cursor')
+                    if not data.get('more') or not cursor:
+                        break
+
+                await wait_below(0)
+            finally:
+                for task in pending:
+                    task.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+
+    def iter_orders(self, time_from, time_to, time_range_field="create_time"):
+        """
+        Sync wrapper for Celery tasks: yields order detail dicts as detail pages arrive
+        (in completion order). Errors of the fetcher are raised here.
+        """
+        pages = queue.Queue(maxsize=self.concurrency * 2) # Backpressure: fetching pauses while ingestion catches up
+        stop = threading.Event()
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    pages.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    continue
+            raise _Stopped()
+
+        async def emit(orders):
+            await asyncio.to_thread(put, orders)
+
+        def run():
+            try:
+                asyncio.run(self.fetch_orders(time_from, time_to, emit, time_range_field=time_range_field, stop=stop))
+                put(_DONE)
+            except _Stopped:
+                pass
+            except Exception as e:
+                try:
+                    put(e)
+                except _Stopped:
+                    pass
+
+        fetcher = threading.Thread(target=run, name='shopee-order-details', daemon=True)
+        fetcher.start()
+        try:
+            while True:
+                item = pages.get()
+                if item is _DONE:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield from item
+        finally:
+            stop.set()
+            fetcher.join()
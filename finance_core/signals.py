@@ -0,0 +1,51 @@
+from django.db import transaction as db_transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from .models import TaxProfile, LogisticsCostTable, ProductCost
+from .tax_engine import invalidate_tax_profile
+from .logistics_cache import invalidate_logistics_rules
+from .tasks import request_margin_recalculation
+
+def _recalculate_on_commit(organization_id, **scope):
+    # Only once the change is visible to the worker
+    db_transaction.on_commit(lambda: request_margin_recalculation(organization_id, **scope))
+
+@receiver([post_save, post_delete], sender=TaxProfile)
+def invalidate_compiled_tax_profile(sender, instance, **kwargs):
+    invalidate_tax_profile(instance.pk)
+
+@receiver([post_save, post_delete], sender=LogisticsCostTable)
+def invalidate_cached_logistics_rules(sender, instance, **kwargs):
+    # After commit: invalidating earlier lets a concurrent reader cache the old rules again
+    organization_id = instance.organization_id
+    db_transaction.on_commit(lambda: invalidate_logistics_rules(organization_id))
+
+@receiver([post_save, post_delete], sender=TaxProfile)
+def recalculate_after_tax_profile_change(sender, instance, raw=False, **kwargs):
+    if not raw:
+        _recalculate_on_commit(instance.organization_id, everything=True)
+
+@receiver(pre_save, sender=LogisticsCostTable)
+@receiver(pre_save, sender=ProductCost)
+def remember_previous_key(sender, instance, raw=False, **kwargs):
+    # A renamed SKU or rule leaves transactions on the old key: they are recalculated too
+    if raw or instance.pk is None:
+        return
+    fields = ('sku',) if sender is ProductCost else ('platform', 'shipping_method')
+    instance._previous_key = sender.objects.filter(pk=instance.pk).values_list(*fields).first()
+
+@receiver([post_save, post_delete], sender=LogisticsCostTable)
+def recalculate_after_logistics_rule_change(sender, instance, raw=False, **kwargs):
+    if not raw:
+        rules = {(instance.platform, instance.shipping_method)}
+        if getattr(instance, '_previous_key', None):
+            rules.add(instance._previous_key)
+        _recalculate_on_commit(instance.organization_id, shipping_methods=sorted(rules))
+
+@receiver([post_save, post_delete], sender=ProductCost)
+def recalculate_after_product_cost_change(sender, instance, raw=False, **kwargs):
+    if not raw:
+        skus = {instance.sku}
+        if getattr(instance, '_previous_key', None):
+            skus.add(instance._previous_key[0])
+        _recalculate_on_commit(instance.organization_id, skus=sorted(skus))
@@ -0,0 +1,214 @@
+"""
+Vectorized what-if tax simulation over an organization's full history.
+
+Transactions are streamed from the database as integer centavos (amount, net margin + current
+taxes, month) and evaluated for every (regime, rate) scenario at once as an int64 NumPy matrix.
+Rates are fixed point with 6 decimal places (the precision of the SQL simulation), so
+
+    simulated_margin = round_half_up(net_margin + tax_amount - amount * rate, cents)
+
+is computed exactly in integers and matches the Decimal path (simulated_margin_decimal) to the cent.
+Results are summed per month.
+
+A request is normalized by simulation_params into a JSON-able dict (organization, scenarios,
+date range, platform) shared by the synchronous endpoint and the simulation jobs.
+"""
+from dataclasses import dataclass
+from datetime import date
+from decimal import Decimal, ROUND_HALF_UP
+from itertools import islice
+import numpy as np
+from django.db.models import F, Value, BigIntegerField, DecimalField
+from django.db.models.functions import Cast, Coalesce, Round, ExtractYear, ExtractMonth
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from .models import SaleTransaction
+from .tax_engine import SIMULATION_REGIMES, TaxRates
+
+SIMULATION_CHUNK_SIZE = 50000
+SIMULATION_DEFAULT_MONTHS = 24
+
+RATE_SCALE = 10 ** 6 # Rates are simulated with 6 decimal places
+HALF = RATE_SCALE // 2
+CENTS = Decimal('0.01')
+
+@dataclass(frozen=True)
+class Scenario:
+    regime: str
+    rate: Decimal # Total rate over revenue
+
+    @property
+    def scaled_rate(self):
+        scaled = self.rate * RATE_SCALE
+        if scaled != scaled.to_integral_value():
+            raise ValueError(f"Rate {self.rate} has more than 6 decimal places")
+        return int(scaled)
+
+def scenario_rates(regime, rate=None):
+    """
+    TaxRates of a simulation regime with its variable component replaced by rate:
+    the unified rate of single-rate regimes (Simples DAS), otherwise the ICMS rate.
+    """
+    rates = SIMULATION_REGIMES[regime]
+    if rate is None:
+        return rates
+    if rates.unified:
+        return TaxRates(unified=rate)
+    return TaxRates(icms=rate, pis_cofins=rates.pis_cofins, unified=rates.unified)
+
+def build_scenarios(regimes, rate_scenarios=None):
+    """
+    Regimes x rate scenarios. rate_scenarios maps a regime to the variable rates to try
+    (see scenario_rates); regimes without an entry are simulated at their base rates.
+    """
+    rate_scenarios = rate_scenarios or {}
+    scenarios = []
+    for regime in regimes:
+        if regime not in SIMULATION_REGIMES:
+            raise ValueError(f"Unknown regime '{regime}'")
+        for rate in rate_scenarios.get(regime) or [None]:
+            rate = None if rate is None else Decimal(str(rate))
+            scenarios.append(Scenario(regime, scenario_rates(regime, rate).total))
+    return scenarios
+
+def simulation_params(data):
+    """
+    Normalizes a monthly simulation request: organization_id, regimes (default: all),
+    rate_scenarios, months (default 24, ending in the current month) or start_date/end_date, platform.
+    Raises ValueError (or ArithmeticError for malformed rates) on invalid input.
+    """
+    organization_id = data.get('organization_id')
+    if not organization_id:
+        raise ValueError("organization_id is required")
+    scenarios = build_scenarios(data.get('regimes') or list(SIMULATION_REGIMES), data.get('rate_scenarios'))
+    for scenario in scenarios:
+        scenario.scaled_rate # Validates the precision
+
+    start_date, end_date = data.get('start_date'), data.get('end_date')
+    if not (start_date or end_date):
+        # First day of the month, months - 1 months ago
+        months = int(data.get('months', SIMULATION_DEFAULT_MONTHS))
+        today = timezone.localdate()
+        index = today.year * 12 + today.month - months
+        start_date = date(index // 12, index % 12 + 1, 1).isoformat()
+
+    platform = data.get('platform')
+    return {
+        'organization_id': int(organization_id),
+        'scenarios': [[scenario.regime, str(scenario.rate)] for scenario in scenarios],
+        'start_date': start_date,
+        'end_date': end_date,
+        'platform': platform if platform and platform != 'ALL' else None,
+    }
+
+def params_scenarios(params):
+    return [Scenario(regime, Decimal(rate)) for regime, rate in params['scenarios']]
+
+def filter_date_range(queryset, start_date, end_date):
+    """
+    Filters SaleTransaction by date range. Plain dates (YYYY-MM-DD) cover whole days, end day inclusive.
+    """
+    if start_date:
+        start_day = parse_date(start_date)
+        queryset = queryset.filter(transaction_date__date__gte=start_day) if start_day else queryset.filter(transaction_date__gte=start_date)
+    if end_date:
+        end_day = parse_date(end_date)
+        queryset = queryset.filter(transaction_date__date__lte=end_day) if end_day else queryset.filter(transaction_date__lte=end_date)
+    return queryset
+
+def simulation_queryset(params):
+    """
+    Transactions of a normalized request (see simulation_params).
+    """
+    queryset = SaleTransaction.objects.filter(organization_id=params['organization_id'])
+    queryset = filter_date_range(queryset, params['start_date'], params['end_date'])
+    if params['platform']:
+        queryset = queryset.filter(platform=params['platform'])
+    return queryset
+
+def simulated_margin_decimal(amount, net_margin, tax_amount, rate):
+    """
+    Decimal reference of the simulation of one transaction (same rounding as TaxSimulationView).
+    """
+    return (net_margin + tax_amount - amount * rate).quantize(CENTS, rounding=ROUND_HALF_UP)
+
+def simulated_margin_centavos(amount, base, scaled_rates):
+    """
+    amount and base (net margin + current taxes) are int64 centavo vectors, scaled_rates the
+    int64 rates * RATE_SCALE. Returns the (transactions x scenarios) simulated margins in centavos.
+    """
+    exact = base[:, None] * RATE_SCALE - amount[:, None] * scaled_rates[None, :] # In 1e-6 centavos
+    # Half away from zero, like Decimal ROUND_HALF_UP
+    return np.sign(exact) * ((np.abs(exact) + HALF) // RATE_SCALE)
+
+def _centavos(field):
+    # Money columns are exact to the cent; Round guards the float storage of SQLite
+    money = Coalesce(F(field), Value(Decimal(0)), output_field=DecimalField(max_digits=14, decimal_places=2))
+    return Cast(Round(money * 100), BigIntegerField())
+
+def _chunks(iterator, size):
+    while True:
+        rows = list(islice(iterator, size))
+        if not rows:
+            return
+        yield np.array(rows, dtype=np.int64)
+
+def simulate_chunks(queryset, scenarios, chunk_size=SIMULATION_CHUNK_SIZE):
+    """
+    Streams the transactions of the queryset ordered by date and simulates every scenario.
+    Yields (rows, simulated) per chunk: rows is an int64 matrix of (month index, amount, net margin,
+    taxes, id) with money in centavos, simulated the (rows x scenarios) margins in centavos.
+    """
+    scaled_rates = np.array([scenario.scaled_rate for scenario in scenarios], dtype=np.int64)
+    rows = queryset.filter(net_margin__isnull=False).annotate(
+        _month=ExtractYear('transaction_date') * 12 + ExtractMonth('transaction_date') - 1,
+        _amount=_centavos('amount'),
+        _margin=_centavos('net_margin'),
+        _tax=_centavos('tax_amount'),
+    ).order_by('transaction_date', 'id').values_list('_month', '_amount', '_margin', '_tax', 'id').iterator(chunk_size=chunk_size)
+
+    for chunk in _chunks(rows, chunk_size):
+        _, amount, margin, tax, _ = chunk.T
+        yield chunk, simulated_margin_centavos(amount, margin + tax, scaled_rates)
+
+def add_monthly_totals(totals, rows, simulated):
+    """
+    Adds a chunk of simulate_chunks to totals: month index -> int64 [count, revenue, current margin,
+    simulated margin per scenario].
+    """
+    month, amount, margin, _, _ = rows.T
+    columns = np.column_stack([np.ones_like(amount), amount, margin, simulated])
+
+    # Rows are ordered by date, so each month is a contiguous run
+    months, starts = np.unique(month, return_index=True)
+    for key, sums in zip(months.tolist(), np.add.reduceat(columns, starts, axis=0)):
+        totals[key] = totals[key] + sums if key in totals else sums
+
+def to_money(centavos):
+    return Decimal(int(centavos)).scaleb(-2)
+
+def month_label(key):
+    return f'{key // 12}-{key % 12 + 1:02d}'
+
+def monthly_result(totals, scenario_count):
+    """
+    Columnar result of the monthly totals: {'months': ['YYYY-MM', ...], 'transaction_count', 'revenue',
+    'current_margin': [per month], 'simulated_margin': [[per month] per scenario]} with money as Decimal.
+    """
+    keys = sorted(totals)
+    return {
+        'months': [month_label(key) for key in keys],
+        'transaction_count': [int(totals[key][0]) for key in keys],
+        'revenue': [to_money(totals[key][1]) for key in keys],
+        'current_margin': [to_money(totals[key][2]) for key in keys],
+        'simulated_margin': [[to_money(totals[key][3 + i]) for key in keys] for i in range(scenario_count)],
+    }
+
+def simulate_monthly(queryset, scenarios, chunk_size=SIMULATION_CHUNK_SIZE):
+    """
+    Simulates every scenario over the transactions of the queryset, summed per month (see monthly_result).
+    """
+    totals = {}
+    for rows, simulated in simulate_chunks(queryset, scenarios, chunk_size):
+        add_monthly_totals(totals, rows, simulated)
+    return monthly_result(totals, len(scenarios))
@@ -0,0 +1,107 @@
+"""
+Asynchronous monthly tax simulations (SimulationJob).
+
+A job runs the simulation of simulation.py in a Celery task: every chunk of transactions is stored
+as a page of per-transaction results and advances the job's progress; the monthly totals are stored
+on the job when it finishes. Results are zlib-compressed JSON.
+
+Jobs are deduplicated by request_key, a hash of the normalized request and of the organization's
+analytics generation (bumped by every write to its transactions), so a finished job is served
+until the data changes.
+"""
+import hashlib
+import json
+import logging
+import zlib
+from datetime import timedelta
+from decimal import Decimal
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework.utils.encoders import JSONEncoder
+from .analytics_cache import get_generation
+from .models import SimulationJob, SimulationResultPage
+from .simulation import (
+    params_scenarios, simulation_queryset, simulate_chunks, add_monthly_totals, monthly_result, month_label,
+)
+
+logger = logging.getLogger(__name__)
+
+SIMULATION_PAGE_SIZE = 5000 # Transactions per result page
+SIMULATION_JOB_STALE_AFTER = timedelta(hours=1) # Pending/running jobs older than this are not reused
+SIMULATION_JOB_RETENTION = timedelta(days=7)
+
+def pack(data):
+    return zlib.compress(json.dumps(data, cls=JSONEncoder, separators=(',', ':')).encode())
+
+def unpack(data):
+    # Money is written as JSON numbers; parse_float keeps it exact
+    return json.loads(zlib.decompress(data), parse_float=Decimal)
+
+def request_key(params):
+    generation = get_generation(params['organization_id'])
+    return hashlib.sha256(json.dumps([params, generation], sort_keys=True).encode()).hexdigest()
+
+def get_or_create_job(params):
+    """
+    Returns (job, created) for a normalized request (see simulation_params). An identical job is reused
+    when it is done, or still pending/running and younger than SIMULATION_JOB_STALE_AFTER.
+    """
+    key = request_key(params)
+    reusable = Q(status='DONE') | Q(status__in=['PENDING', 'RUNNING'], created_at__gte=timezone.now() - SIMULATION_JOB_STALE_AFTER)
+    job = SimulationJob.objects.filter(
+        organization_id=params['organization_id'], request_key=key
+    ).filter(reusable).order_by('-created_at').first()
+    if job:
+        return job, False
+    return SimulationJob.objects.create(organization_id=params['organization_id'], request_key=key, params=params), True
+
+def fail_job(job_id, error):
+    SimulationJob.objects.filter(id=job_id).update(status='FAILED', error=error, finished_at=timezone.now())
+
+def _page(rows, simulated):
+    month, amount, margin, _, ids = rows.T
+    # centavos / 100 is the double nearest to the exact amount, so its JSON repr is the exact decimal
+    return {
+        'transaction_id': ids.tolist(),
+        'month': [month_label(key) for key in month.tolist()],
+        'revenue': (amount / 100).tolist(),
+        'current_margin': (margin / 100).tolist(),
+        'simulated_margin': (simulated.T / 100).tolist(),
+    }
+
+def run_job(job_id, page_size=SIMULATION_PAGE_SIZE):
+    """
+    Computes a pending job. Returns its final status (None if another worker already claimed it).
+    """
+    if not SimulationJob.objects.filter(id=job_id, status='PENDING').update(status='RUNNING'):
+        return None
+    job = SimulationJob.objects.get(id=job_id)
+    scenarios = params_scenarios(job.params)
+    queryset = simulation_queryset(job.params)
+
+    try:
+        SimulationJob.objects.filter(id=job_id).update(total_count=queryset.filter(net_margin__isnull=False).count())
+        totals = {}
+        processed = pages = 0
+        for rows, simulated in simulate_chunks(queryset, scenarios, page_size):
+            add_monthly_totals(totals, rows, simulated)
+            pages += 1
+            processed += len(rows)
+            SimulationResultPage.objects.create(job_id=job_id, number=pages, row_count=len(rows), data=pack(_page(rows, simulated)))
+            SimulationJob.objects.filter(id=job_id).update(processed_count=processed, page_count=pages)
+    except Exception as e:
+        logger.error(f"Simulation job {job_id} failed: {e}")
+        fail_job(job_id, str(e))
+        return 'FAILED'
+
+    SimulationJob.objects.filter(id=job_id).update(
+        status='DONE', result=pack(monthly_result(totals, len(scenarios))), finished_at=timezone.now()
+    )
+    return 'DONE'
+
+def purge_jobs(retention=SIMULATION_JOB_RETENTION):
+    """
+    Deletes jobs (and their pages) older than the retention.
+    """
+    deleted, _ = SimulationJob.objects.filter(created_at__lt=timezone.now() - retention).delete()
+    return deleted
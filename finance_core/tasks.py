@@ -1,158 +1,243 @@
-from celery import shared_task
-from .models import IntegrationProfile, IntegrationErrorLog
-from .utils import refresh_ml_token, fetch_and_process_ml_orders, fetch_and_process_shopee_orders, send_alert_email
-from .shopee_utils import sign_shopee_request, SHOPEE_API_URL
+from celery import shared_task, chord
+from celery.exceptions import SoftTimeLimitExceeded
+from .models import Organization, IntegrationProfile, CollectionRun
+from .utils import (
+    log_integration_error, ensure_fresh_token, cache_is_shared,
+    TOKEN_REFRESH_LEAD, TOKEN_LOCK_TIMEOUT, TOKEN_EXPIRY_FIELDS, TOKEN_REFRESH_FIELDS,
+)
+from .pipeline import sync_ml_orders, sync_shopee_orders, PipelineMetrics
+from .rollups import reconcile_daily_summaries
+from .recalculation import (
+    queue_recalculation, release_recalculation, pop_recalculation_scope, recalculate_margins,
+    empty_scope, merge_scope, RECALC_DEBOUNCE,
+)
+from .simulation_jobs import get_or_create_job, run_job, fail_job, purge_jobs
+from .rate_limit import rate_limit_wait
 import requests
+import httpx
 from django.utils import timezone
+from django.core.cache import cache
+from django.db.models import Q
 from datetime import timedelta
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 
-# ... (Previous tasks remain unchanged)
+TOKEN_SCHEDULE_INTERVAL = timedelta(minutes=10) # Must match the beat schedule of schedule_token_refreshes
 
-def refresh_shopee_token(profile):
+@shared_task
+def refresh_platform_token(profile_id, platform):
     """
-    Refreshes Shopee Access Token.
+    Refreshes one profile's token for a platform (scheduled by schedule_token_refreshes).
     """
-    path = "/auth/access_token/get"
-    body = {
-        "refresh_token": profile.shopee_refresh_token,
-        "partner_id": int(profile.shopee_partner_id),
-        "shop_id": int(profile.shopee_shop_id)
-    }
-    
-    try:
-        sign, timestamp = sign_shopee_request(path, int(profile.shopee_partner_id), profile.shopee_partner_key)
-        url = f"{SHOPEE_API_URL}{path}?partner_id={profile.shopee_partner_id}&timestamp={timestamp}&sign={sign}"
-        
-        resp = requests.post(url, json=body)
-        resp.raise_for_status()
-        data = resp.json()
-        
-        if data.get('error'):
-            error_msg = f"Shopee Refresh Error for {profile.organization.name}: {data.get('message')}"
-            logger.error(error_msg)
-            log = IntegrationErrorLog.objects.create(
-                organization=profile.organization,
-                platform='SHOPEE',
-                task_name='refresh_shopee_token',
-                error_message=error_msg
-            )
-            send_alert_email(log)
-            return
-
-        profile.shopee_access_token = data['access_token']
-        profile.shopee_refresh_token = data['refresh_token']
-        # Shopee tokens expire in 4 hours usually
-        expires_in = data.get('expire_in', 14400) 
-        profile.shopee_token_expiry_date = timezone.now() + timedelta(seconds=expires_in)
-        profile.save()
-        logger.info(f"Shopee Token Refreshed for {profile.organization.name}")
-        
-    except Exception as e:
-        error_msg = f"Error refreshing Shopee token: {e}"
-        logger.error(error_msg)
-        log = IntegrationErrorLog.objects.create(
-            organization=profile.organization,
-            platform='SHOPEE',
-            task_name='refresh_shopee_token',
-            error_message=error_msg
+    profile = IntegrationProfile.objects.select_related('organization').filter(id=profile_id).first()
+    if profile:
+        ensure_fresh_token(profile, platform)
+
+@shared_task
+def schedule_token_refreshes():
+    """
+    Periodic task: schedules a refresh, at expiry minus the lead time, for every token that
+    expires before the next sweep. Only profiles inside that window are loaded (indexed
+    expiry columns); tokens with an unknown expiry are refreshed right away.
+    """
+    now = timezone.now()
+    horizon = now + TOKEN_REFRESH_LEAD + TOKEN_SCHEDULE_INTERVAL
+    scheduled = 0
+
+    for platform, expiry_field in TOKEN_EXPIRY_FIELDS.items():
+        refresh_field = TOKEN_REFRESH_FIELDS[platform]
+        profiles = IntegrationProfile.objects.exclude(**{f'{refresh_field}__isnull': True}).exclude(**{refresh_field: ''}).filter(
+            Q(**{f'{expiry_field}__lte': horizon}) | Q(**{f'{expiry_field}__isnull': True})
         )
-        send_alert_email(log)
+        if platform == 'SHOPEE': # The Shopee refresh is signed for a shop: profiles without one cannot refresh
+            profiles = profiles.exclude(shopee_shop_id__isnull=True).exclude(shopee_shop_id='')
+        profiles = profiles.values_list('id', expiry_field)
+
+        for profile_id, expiry in profiles:
+            eta = max(now, expiry - TOKEN_REFRESH_LEAD) if expiry else now
+            # One pending refresh per profile/platform, even if sweeps overlap (a duplicate is
+            # harmless: ensure_fresh_token locks the profile row and re-checks the expiry)
+            pending_for = int((eta - now).total_seconds()) + TOKEN_LOCK_TIMEOUT
+            if cache.add(f'token_refresh_scheduled:{platform}:{profile_id}', 1, pending_for):
+                refresh_platform_token.apply_async((profile_id, platform), eta=eta)
+                scheduled += 1
+
+    logger.info(f"Scheduled {scheduled} token refreshes")
+    return scheduled
 
 @shared_task
 def renew_all_platform_tokens():
     """
-    Periodic task to renew tokens for all platforms.
-    """
-    logger.info("Starting Token Renewal Task...")
-    profiles = IntegrationProfile.objects.all()
-    
-    for profile in profiles:
-        # 1. Mercado Livre
-        if profile.ml_refresh_token:
-            # Check expiry or just force refresh if close? 
-            # utils.refresh_ml_token handles the check/refresh logic usually, 
-            # but let's assume we want to ensure it's fresh.
-            # The utils function checks expiry. We can just call it.
-            refresh_ml_token(profile)
-            
-        # 2. Shopee
-        if profile.shopee_refresh_token and profile.shopee_partner_id:
-            refresh_shopee_token(profile)
-            
-    logger.info("Token Renewal Task Completed.")
+    Kept for existing schedules: same as schedule_token_refreshes.
+    """
+    return schedule_token_refreshes()
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=60, soft_time_limit=600, time_limit=660)
+def fetch_orders_for_tenant(self, organization_id, platform):
+    """
+    Collects orders for a single (organization, platform).
+    Always returns an outcome dict so the collection chord callback runs even when a tenant fails.
+    """
+    started = time.monotonic()
+    waited = rate_limit_wait(platform)
+    outcome = {'organization_id': organization_id, 'platform': platform, 'orders': 0}
+
+    try:
+        profile = IntegrationProfile.objects.select_related('organization').get(organization_id=organization_id)
+    except IntegrationProfile.DoesNotExist:
+        outcome.update(status='skipped', error='IntegrationProfile not found', duration=0)
+        return outcome
+
+    metrics = PipelineMetrics()
+    try:
+        if platform == 'ML':
+            outcome['orders'] = sync_ml_orders(profile, metrics)
+        else:
+            outcome['orders'] = sync_shopee_orders(profile, metrics)
+        outcome['status'] = 'success'
+
+    except SoftTimeLimitExceeded:
+        error_msg = f"{platform} order collection exceeded its time limit"
+        log_integration_error(profile.organization, platform, 'fetch_orders_for_tenant', error_msg)
+        outcome.update(status='timeout', error=error_msg)
+
+    except (requests.RequestException, httpx.HTTPError) as e:
+        # Transient network/API failures: retry with exponential backoff before giving up
+        if self.request.retries < self.max_retries:
+            raise self.retry(exc=e, countdown=self.default_retry_delay * (2 ** self.request.retries))
+        error_msg = f"Error fetching {platform} orders: {e}"
+        log_integration_error(profile.organization, platform, 'fetch_orders_for_tenant', error_msg)
+        outcome.update(status='error', error=error_msg)
+
+    except Exception as e:
+        error_msg = f"Error fetching {platform} orders: {e}"
+        log_integration_error(profile.organization, platform, 'fetch_orders_for_tenant', error_msg)
+        outcome.update(status='error', error=error_msg)
+
+    outcome['duration'] = round(time.monotonic() - started, 3)
+    outcome['rate_limit_wait'] = round(rate_limit_wait(platform) - waited, 3) # Time spent throttled
+    outcome['stages'] = metrics.as_dict()['stages']
+    return outcome
+
+@shared_task
+def record_collection_run(results, run_id):
+    """
+    Chord callback: stores total duration and per-tenant outcomes of a collection run.
+    """
+    run = CollectionRun.objects.get(id=run_id)
+    run.finished_at = timezone.now()
+    run.duration_seconds = (run.finished_at - run.started_at).total_seconds()
+    run.results = results
+    run.failed_count = sum(1 for r in results if r.get('status') not in ('success', 'skipped'))
+    run.save()
+    logger.info(f"Order Collection Task Completed: {run.tenant_count} tenants, {run.failed_count} failed, {run.duration_seconds:.1f}s")
+    return run_id
 
 @shared_task
 def fetch_all_new_orders():
     """
     Periodic task to fetch new orders.
+    Dispatches one fetch_orders_for_tenant sub-task per (organization, platform), so a slow
+    tenant does not hold up the others, and records the run in a chord callback.
     """
     logger.info("Starting Order Collection Task...")
-    
-    # We can optimize this to fetch per profile inside the task or spawn sub-tasks.
-    # For now, sequential per profile.
-    
-    profiles = IntegrationProfile.objects.all()
-    for profile in profiles:
-        # ML
+
+    header = []
+    for profile in IntegrationProfile.objects.all():
         if profile.ml_access_token:
-            # We might want to refactor fetch_and_process_ml_orders to take a profile arg
-            # Currently it iterates all. 
-            # Let's call the bulk function if it iterates all, OR refactor.
-            # The existing fetch_and_process_ml_orders iterates ALL profiles.
-            pass
-
-    # Actually, the existing functions iterate ALL profiles. 
-    # So we just call them once.
-    fetch_and_process_ml_orders()
-    
-    # Shopee function also iterates all profiles?
-    # Let's check utils.py... 
-    # "fetch_and_process_shopee_orders(tenant_profile)" takes a profile!
-    # "fetch_and_process_ml_orders()" iterates all.
-    
-    # So:
-    # ML is bulk.
-    # Shopee needs iteration.
-    
-    for profile in profiles:
+            header.append(fetch_orders_for_tenant.s(profile.organization_id, 'ML'))
         if profile.shopee_access_token:
-            fetch_and_process_shopee_orders(profile)
-            
-    logger.info("Order Collection Task Completed.")
+            header.append(fetch_orders_for_tenant.s(profile.organization_id, 'SHOPEE'))
+
+    run = CollectionRun.objects.create(tenant_count=len(header))
+
+    if not header:
+        record_collection_run([], run.id)
+        return run.id
+
+    chord(header)(record_collection_run.s(run.id))
+    return run.id
 
-def refresh_shopee_token(profile):
+@shared_task
+def reconcile_daily_profit_summaries():
+    """
+    Nightly task: rebuilds DailyProfitSummary from SaleTransaction for every organization,
+    correcting any drift left by the incremental updates.
+    """
+    logger.info("Starting Daily Profit Summary Reconcile...")
+    for organization_id in Organization.objects.values_list('id', flat=True):
+        try:
+            reconcile_daily_summaries(organization_id)
+        except Exception as e:
+            logger.error(f"Error reconciling daily summaries for organization {organization_id}: {e}")
+    logger.info("Daily Profit Summary Reconcile Completed.")
+
+def request_margin_recalculation(organization_id, skus=(), shipping_methods=(), everything=False):
     """
-    Refreshes Shopee Access Token.
+    Schedules, after RECALC_DEBOUNCE, a recalculation job carrying the change in its arguments.
+    With a cache shared by the workers the change is also merged into the organization's pending
+    scope, and only the first change of a burst schedules a job (which applies the others too).
+    With the per-process LocMemCache every change gets its own job.
     """
-    path = "/auth/access_token/get"
-    body = {
-        "refresh_token": profile.shopee_refresh_token,
-        "partner_id": int(profile.shopee_partner_id),
-        "shop_id": int(profile.shopee_shop_id)
-    }
-    
+    scope = {'skus': sorted(skus), 'shipping_methods': [list(rule) for rule in shipping_methods], 'everything': everything}
+    coalesce = cache_is_shared()
+    if coalesce and not queue_recalculation(organization_id, skus, shipping_methods, everything):
+        return
     try:
-        sign, timestamp = sign_shopee_request(path, int(profile.shopee_partner_id), profile.shopee_partner_key)
-        url = f"{SHOPEE_API_URL}{path}?partner_id={profile.shopee_partner_id}&timestamp={timestamp}&sign={sign}"
-        
-        resp = requests.post(url, json=body)
-        resp.raise_for_status()
-        data = resp.json()
-        
-        if data.get('error'):
-            logger.error(f"Shopee Refresh Error for {profile.organization.name}: {data.get('message')}")
-            return
-
-        profile.shopee_access_token = data['access_token']
-        profile.shopee_refresh_token = data['refresh_token']
-        # Shopee tokens expire in 4 hours usually
-        expires_in = data.get('expire_in', 14400) 
-        profile.shopee_token_expiry_date = timezone.now() + timedelta(seconds=expires_in)
-        profile.save()
-        logger.info(f"Shopee Token Refreshed for {profile.organization.name}")
-        
+        recalculate_organization_margins.apply_async((organization_id, scope, coalesce), countdown=RECALC_DEBOUNCE)
     except Exception as e:
-        logger.error(f"Error refreshing Shopee token: {e}")
+        # The merged scope stays pending: the next change of the organization schedules a job that applies it
+        if coalesce:
+            release_recalculation(organization_id)
+        logger.error(f"Could not schedule margin recalculation for organization {organization_id}: {e}")
+
+@shared_task
+def recalculate_organization_margins(organization_id, scope=None, coalesced=False):
+    """
+    Applies a cost/tax change (scope: skus, shipping_methods, everything) to the stored margins.
+    A coalesced job also applies the organization's pending scope. When that scope is missing
+    although other changes were merged into it, everything is recalculated.
+    """
+    scope = merge_scope(empty_scope(), **(scope or {}))
+    if coalesced:
+        pending, changes = pop_recalculation_scope(organization_id)
+        if pending is not None:
+            merge_scope(scope, **pending)
+        elif changes and changes > 1:
+            scope['everything'] = True
+    if not (scope['skus'] or scope['shipping_methods'] or scope['everything']):
+        return 0
+    return recalculate_margins(organization_id, **scope)
+
+def submit_simulation_job(params):
+    """
+    Returns (job, created) for a normalized simulation request, scheduling run_simulation_job
+    for a new job. An identical pending, running or done job is returned instead.
+    """
+    job, created = get_or_create_job(params)
+    if created:
+        try:
+            run_simulation_job.delay(job.id)
+        except Exception as e:
+            fail_job(job.id, f"Could not schedule the simulation: {e}")
+            logger.error(f"Could not schedule simulation job {job.id}: {e}")
+            job.refresh_from_db()
+    return job, created
+
+@shared_task(soft_time_limit=1800, time_limit=1860)
+def run_simulation_job(job_id):
+    """
+    Computes a SimulationJob (pages of per-transaction results and monthly totals).
+    """
+    return run_job(job_id)
+
+@shared_task
+def purge_simulation_jobs():
+    """
+    Nightly task: deletes simulation jobs past their retention.
+    """
+    deleted = purge_jobs()
+    logger.info(f"Purged {deleted} simulation jobs and pages")
+    return deleted
@@ -0,0 +1,165 @@
+"""
+Tax rule engine.
+
+Compiles an organization's TaxProfile into an immutable rate table keyed by
+(destination UF, interstate), so the margin engine, the tax simulation and the
+backfills resolve the rates of a transaction with a single dict lookup and all
+share the same rules.
+"""
+import unicodedata
+from dataclasses import dataclass, field
+from decimal import Decimal
+from types import MappingProxyType
+
+ZERO = Decimal('0.00')
+
+# Rules per regime. All current regimes use the ICMS debit + non-cumulative PIS/COFINS model
+# that the margin engine has always applied; the table is where per-regime rates are configured.
+@dataclass(frozen=True)
+class RegimeRule:
+    pis_cofins: Decimal
+    intrastate_icms: Decimal
+
+REGIME_RULES = {
+    'LUCRO_REAL': RegimeRule(pis_cofins=Decimal('0.0925'), intrastate_icms=Decimal('0.18')),
+    'LUCRO_PRESUMIDO': RegimeRule(pis_cofins=Decimal('0.0925'), intrastate_icms=Decimal('0.18')),
+    'SIMPLES': RegimeRule(pis_cofins=Decimal('0.0925'), intrastate_icms=Decimal('0.18')),
+}
+DEFAULT_REGIME = 'LUCRO_REAL'
+
+# Interstate ICMS (Resolução do Senado 22/89): 7% from S/SE (except ES) to N/NE/CO/ES, 12% otherwise
+INTERSTATE_ICMS = Decimal('0.12')
+INTERSTATE_ICMS_REDUCED = Decimal('0.07')
+SOUTH_SOUTHEAST = {'PR', 'RS', 'SC', 'MG', 'RJ', 'SP'}
+
+BRAZIL_UFS = {
+    'AC': 'Acre', 'AL': 'Alagoas', 'AP': 'Amapá', 'AM': 'Amazonas', 'BA': 'Bahia',
+    'CE': 'Ceará', 'DF': 'Distrito Federal', 'ES': 'Espírito Santo', 'GO': 'Goiás',
+    'MA': 'Maranhão', 'MT': 'Mato Grosso', 'MS': 'Mato Grosso do Sul', 'MG': 'Minas Gerais',
+    'PA': 'Pará', 'PB': 'Paraíba', 'PR': 'Paraná', 'PE': 'Pernambuco', 'PI': 'Piauí',
+    'RJ': 'Rio de Janeiro', 'RN': 'Rio Grande do Norte', 'RS': 'Rio Grande do Sul',
+    'RO': 'Rondônia', 'RR': 'Roraima', 'SC': 'Santa Catarina', 'SP': 'São Paulo',
+    'SE': 'Sergipe', 'TO': 'Tocantins',
+}
+
+def _fold(value):
+    return unicodedata.normalize('NFKD', value).encode('ascii', 'ignore').decode().strip().upper()
+
+_UF_BY_NAME = {_fold(name): uf for uf, name in BRAZIL_UFS.items()}
+
+def normalize_uf(value):
+    """
+    Maps 'SP', 'BR-SP' or 'São Paulo' to 'SP'. Returns None when the state is unknown.
+    """
+    if not value:
+        return None
+    folded = _fold(str(value))
+    if folded.startswith('BR-'):
+        folded = folded[3:]
+    if folded in BRAZIL_UFS:
+        return folded
+    return _UF_BY_NAME.get(folded)
+
+@dataclass(frozen=True)
+class TaxRates:
+    """
+    Rates over revenue applied to one transaction.
+    """
+    icms: Decimal = ZERO
+    pis_cofins: Decimal = ZERO
+    unified: Decimal = ZERO # Single-rate regimes (e.g. Simples DAS)
+    deducts_credits: bool = False
+
+    @property
+    def total(self):
+        return self.icms + self.pis_cofins + self.unified
+
+NO_TAX = TaxRates()
+
+# Regimes offered by the tax simulation
+SIMULATION_REGIMES = MappingProxyType({
+    'SIMPLES': TaxRates(unified=Decimal('0.06')), # Simplified 6%
+    'PADRAO': TaxRates(icms=Decimal('0.18'), pis_cofins=Decimal('0.0925')), # Standard 27.25%
+    'EFETIVA_1': TaxRates(icms=Decimal('0.01'), pis_cofins=Decimal('0.0925')), # Effective 1% ICMS + 9.25% = 10.25%
+})
+
+@dataclass(frozen=True)
+class CompiledTaxProfile:
+    """
+    Immutable rate vector of a TaxProfile, keyed by (destination UF, interstate).
+    """
+    regime: str
+    icms_benefit: bool
+    origin_uf: str = None
+    default: TaxRates = NO_TAX
+    table: MappingProxyType = field(default_factory=lambda: MappingProxyType({}))
+
+    def rates_for(self, destination_uf=None):
+        interstate = bool(destination_uf and self.origin_uf and destination_uf != self.origin_uf)
+        return self.table.get((destination_uf, interstate), self.default)
+
+NO_TAX_PROFILE = CompiledTaxProfile(regime=None, icms_benefit=False)
+
+def _interstate_icms(origin_uf, destination_uf):
+    if origin_uf in SOUTH_SOUTHEAST and destination_uf not in SOUTH_SOUTHEAST:
+        return INTERSTATE_ICMS_REDUCED
+    return INTERSTATE_ICMS
+
+def _compile(regime, icms_benefit, effective_rate, effective_rate_interstate, origin_uf):
+    rule = REGIME_RULES.get(regime, REGIME_RULES[DEFAULT_REGIME])
+
+    if icms_benefit:
+        # Benefit (TTS/Corredor): effective ICMS rate replaces the debit/credit calculation
+        intrastate = TaxRates(icms=effective_rate / 100, pis_cofins=rule.pis_cofins)
+        interstate_rate = effective_rate_interstate if effective_rate_interstate is not None else effective_rate
+        interstate = lambda uf: TaxRates(icms=interstate_rate / 100, pis_cofins=rule.pis_cofins)
+    else:
+        intrastate = TaxRates(icms=rule.intrastate_icms, pis_cofins=rule.pis_cofins, deducts_credits=True)
+        interstate = lambda uf: TaxRates(icms=_interstate_icms(origin_uf, uf), pis_cofins=rule.pis_cofins, deducts_credits=True)
+
+    table = {(None, False): intrastate}
+    for uf in BRAZIL_UFS:
+        if origin_uf and uf != origin_uf:
+            table[(uf, True)] = interstate(uf)
+        else:
+            table[(uf, False)] = intrastate
+
+    return CompiledTaxProfile(
+        regime=regime,
+        icms_benefit=icms_benefit,
+        origin_uf=origin_uf,
+        default=intrastate,
+        table=MappingProxyType(table),
+    )
+
+# (profile id, profile fields) -> CompiledTaxProfile. Keyed by content as well, so a worker
+# process that missed an invalidation can never use rates of an older version of the profile.
+_compiled = {}
+
+def compile_tax_profile(tax_profile):
+    """
+    Returns the cached CompiledTaxProfile for a TaxProfile (or NO_TAX_PROFILE for None).
+    """
+    if tax_profile is None:
+        return NO_TAX_PROFILE
+
+    key = (
+        tax_profile.pk,
+        tax_profile.regime,
+        tax_profile.icms_benefit_flag,
+        Decimal(tax_profile.effective_tax_rate),
+        None if tax_profile.effective_rate_interstate is None else Decimal(tax_profile.effective_rate_interstate),
+        tax_profile.origin_uf or None,
+    )
+    compiled = _compiled.get(key)
+    if compiled is None:
+        compiled = _compile(*key[1:])
+        _compiled[key] = compiled
+    return compiled
+
+def invalidate_tax_profile(tax_profile_id):
+    """
+    Drops the compiled versions of a profile (connected to TaxProfile post_save/post_delete).
+    """
+    for key in [key for key in _compiled if key[0] == tax_profile_id]:
+        _compiled.pop(key, None)
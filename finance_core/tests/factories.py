@@ -0,0 +1,37 @@
+"""
+Test data shared by the ingestion, recalculation, rollup and cube tests.
+"""
+from decimal import Decimal
+from django.contrib.auth.models import User
+from finance_core.models import Organization, TaxProfile, ProductCost
+
+NOV_14 = 1700000000 # 2023-11-14T22:13:20Z
+
+def create_organization(icms_benefit=True):
+    """
+    Organization with a TaxProfile: TTS benefit (1.30% effective ICMS) or the default profile.
+    """
+    owner = User.objects.create(username='owner')
+    organization = Organization.objects.create(name='Loja', cnpj='00000000000001', owner=owner)
+    if icms_benefit:
+        TaxProfile.objects.create(organization=organization, icms_benefit_flag=True, effective_tax_rate=Decimal('1.30'))
+    else:
+        TaxProfile.objects.create(organization=organization)
+    return organization
+
+def shopee_order(order_sn, amount=None, create_time=NOV_14, carrier='Standard', fee=10, items=()):
+    """
+    Raw Shopee order detail. items are (sku, quantity, unit price); the total defaults to their sum.
+    """
+    if amount is None:
+        amount = sum(quantity * price for _, quantity, price in items)
+    return {
+        'order_sn': order_sn, 'total_amount': amount, 'create_time': create_time,
+        'shipping_carrier': carrier, 'actual_shipping_fee': fee,
+        'item_list': [{'item_id': i, 'model_sku': sku, 'model_quantity_purchased': quantity, 'model_discounted_price': price}
+                      for i, (sku, quantity, price) in enumerate(items)],
+    }
+
+def product_cost(organization, sku, gross_cost):
+    return ProductCost.objects.create(organization=organization, sku=sku, ncm='61091000', gross_cost=Decimal(gross_cost),
+                                      credit_icms=Decimal('0.00'), credit_pis=Decimal('0.00'), credit_cofins=Decimal('0.00'))
@@ -0,0 +1,101 @@
+from datetime import date
+from decimal import Decimal
+from unittest import mock
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from finance_core import cubes
+from finance_core.cubes import query_cube, deferred_cube_refresh, PROFIT_CUBE, SKU_CUBE, TRANSACTIONS, ITEMS
+from finance_core.models import ProfitCube, SkuProfitCube
+from finance_core.pipeline import ingest_orders, normalize_shopee_order, run_order_pipeline
+from finance_core.rollups import reconcile_daily_summaries
+from finance_core.tests.factories import create_organization, shopee_order, product_cost
+
+JAN_10 = 1704880800 # 2024-01-10T10:00:00Z
+FEB_10 = 1707559200 # 2024-02-10T10:00:00Z
+JAN, FEB = date(2024, 1, 1), date(2024, 2, 1)
+
+def order(order_sn, create_time, carrier, items):
+    return normalize_shopee_order(shopee_order(order_sn, create_time=create_time, carrier=carrier, items=items))
+
+class ProfitCubeTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.organization = create_organization()
+        product_cost(self.organization, 'CAM-P', '30.00')
+        ingest_orders(self.organization, 'SHOPEE', [
+            order('SN1', JAN_10, 'Coleta', [('CAM-P', 2, 60), ('BONE', 1, 40)]),
+            order('SN2', JAN_10, 'Standard', [('CAM-P', 1, 60)]),
+            order('SN3', FEB_10, 'Standard', [('BONE', 3, 40)]),
+        ])
+
+    def test_materialized_cubes_match_fact_tables(self):
+        for cube, fact, dimensions, measures in (
+            (PROFIT_CUBE, TRANSACTIONS, ['month', 'transaction_shipping_method'], ['order_count', 'revenue', 'net_margin', 'cogs']),
+            (PROFIT_CUBE, TRANSACTIONS, [], ['revenue', 'taxes', 'logistics']),
+            (SKU_CUBE, ITEMS, ['sku'], ['quantity', 'revenue', 'cogs', 'net_margin']),
+        ):
+            _, materialized = query_cube(self.organization.id, dimensions, measures, source=cube)
+            _, on_the_fly = query_cube(self.organization.id, dimensions, measures, source=fact)
+            self.assertEqual(materialized, on_the_fly)
+
+        _, skus = query_cube(self.organization.id, ['sku'], ['quantity', 'cogs'])
+        self.assertEqual(skus, [{'sku': 'BONE', 'quantity': 4, 'cogs': Decimal('0.00')},
+                                {'sku': 'CAM-P', 'quantity': 3, 'cogs': Decimal('90.00')}])
+
+    def test_reingestion_moves_orders_between_cells(self):
+        ingest_orders(self.organization, 'SHOPEE', [order('SN2', JAN_10, 'Coleta', [('CAM-P', 1, 60)])])
+
+        self.assertEqual(list(ProfitCube.objects.values_list('month', 'transaction_shipping_method', 'order_count').order_by('month')),
+                         [(JAN, 'Coleta', 2), (FEB, 'Standard', 1)])
+
+        ProfitCube.objects.update(order_count=0)
+        reconcile_daily_summaries(self.organization.id)
+        self.assertEqual(sum(ProfitCube.objects.values_list('order_count', flat=True)), 3)
+
+    def test_fact_tables_filter_raw_transaction_date(self):
+        for source in (TRANSACTIONS, ITEMS):
+            with CaptureQueriesContext(connection) as queries:
+                _, rows = query_cube(self.organization.id, [], ['revenue'], start_month=FEB, end_month=FEB, source=source)
+            self.assertEqual(rows, [{'revenue': Decimal('120.00')}])
+            where = queries[0]['sql'].split('WHERE')[1]
+            self.assertIn('"transaction_date" >=', where)
+            self.assertNotIn('cast_date', where)
+
+    def test_sync_run_refreshes_each_month_once(self):
+        orders = [order(f'SN{i}', FEB_10, 'Standard', [('BONE', 1, 40)]) for i in range(4, 10)]
+        with mock.patch.object(cubes, '_refresh', wraps=cubes._refresh) as refresh:
+            with deferred_cube_refresh():
+                run_order_pipeline(self.organization, 'SHOPEE', orders, lambda order: order, batch_size=2)
+                self.assertEqual(refresh.call_count, 0)
+                self.assertEqual(ProfitCube.objects.get(month=FEB).order_count, 1)
+
+        # One refresh per cube for the run, instead of one per batch
+        self.assertEqual(refresh.call_count, 2)
+        self.assertEqual(ProfitCube.objects.get(month=FEB).order_count, 7)
+
+    def test_rebuild_empties_months_left_only_in_sku_cube(self):
+        SkuProfitCube.objects.create(organization=self.organization, month=date(2023, 12, 1), platform='SHOPEE', sku='BONE', quantity=5)
+        reconcile_daily_summaries(self.organization.id)
+        self.assertEqual(sorted(set(SkuProfitCube.objects.values_list('month', flat=True))), [JAN, FEB])
+
+    def test_view_routes_to_cube_or_fact_table(self):
+        client = APIClient()
+        params = {'organization_id': self.organization.id, 'start_month': '2024-01', 'end_month': '2024-01'}
+
+        with self.assertNumQueries(1):
+            response = client.get('/api/v1/analytics/cube/', {**params, 'dimensions': 'month,is_fixed_cost_applied',
+                                                              'measures': 'order_count,revenue'}).json()
+        self.assertEqual(response['source'], 'profit_cube')
+        self.assertEqual(response['columns'], {'month': ['2024-01'], 'is_fixed_cost_applied': [False],
+                                               'order_count': [2], 'revenue': [220.0]})
+
+        response = client.get('/api/v1/analytics/cube/', {**params, 'dimensions': 'sku,transaction_shipping_method'}).json()
+        self.assertEqual(response['source'], 'items')
+        self.assertEqual(response['columns']['sku'], ['BONE', 'CAM-P', 'CAM-P'])
+        self.assertEqual(response['columns']['transaction_shipping_method'], ['Coleta', 'Coleta', 'Standard'])
+
+        self.assertEqual(client.get('/api/v1/analytics/cube/', {**params, 'dimensions': 'sku', 'measures': 'order_count'}).status_code, 400)
+        self.assertEqual(client.get('/api/v1/analytics/cube/', {**params, 'dimensions': 'color'}).status_code, 400)
@@ -0,0 +1,41 @@
+from django.contrib.auth.models import User
+from django.db import connection
+from django.db.models import Sum
+from django.test import TestCase
+from django.utils import timezone
+from finance_core.models import Organization, SaleTransaction
+
+class AnalyticsIndexTest(TestCase):
+    def setUp(self):
+        owner = User.objects.create(username='owner')
+        self.organization = Organization.objects.create(name='Loja', cnpj='00000000000001', owner=owner)
+
+    def _plan(self, queryset):
+        if connection.vendor == 'postgresql':
+            # Tiny test tables are always cheaper to scan sequentially
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        return queryset.explain()
+
+    def test_date_range_filter_uses_composite_index(self):
+        now = timezone.now()
+        queryset = SaleTransaction.objects.filter(
+            organization=self.organization,
+            transaction_date__gte=now - timezone.timedelta(days=30),
+            transaction_date__lte=now,
+        )
+
+        self.assertIn('sale_org_date_platform_idx', self._plan(queryset))
+
+    def test_platform_aggregate_uses_an_analytics_index(self):
+        queryset = SaleTransaction.objects.filter(
+            organization=self.organization,
+            platform='ML',
+            transaction_date__gte=timezone.now() - timezone.timedelta(days=30),
+        ).values('platform').annotate(revenue=Sum('amount'))
+
+        plan = self._plan(queryset)
+        if connection.vendor == 'postgresql':
+            self.assertIn('sale_org_platform_date_cover_idx', plan)
+        else:
+            self.assertIn('sale_org_date_platform_idx', plan)
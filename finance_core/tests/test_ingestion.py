@@ -0,0 +1,116 @@
+from decimal import Decimal
+from unittest import mock
+from django.core.cache import cache
+from django.test import TestCase
+from finance_core.models import SaleTransaction, LogisticsCostTable, ProductCost, SaleItem
+from finance_core.pipeline import ingest_orders, normalize_shopee_order, normalize_ml_order, run_order_pipeline, PipelineMetrics
+from finance_core.utils import calculate_net_margin
+from finance_core.logistics_cache import get_logistics_rules, logistics_cache_stats
+from finance_core.tasks import recalculate_organization_margins
+from finance_core.tests.factories import create_organization, shopee_order
+
+class IngestOrdersTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.organization = create_organization()
+        LogisticsCostTable.objects.create(organization=self.organization, platform='SHOPEE',
+                                          shipping_method='Coleta', fixed_cost_value=Decimal('6.00'))
+
+    def test_batch_upsert_uses_constant_queries(self):
+        orders = [normalize_shopee_order(shopee_order(f'SN{i}', 100.1 + i, carrier='Coleta' if i % 2 else 'Standard', fee=10.5))
+                  for i in range(50)]
+
+        # logistics rules (cache miss) + existing keys + tax profiles + INSERT ... ON CONFLICT + daily rollup (aggregate + upsert)
+        # + monthly cubes (aggregate + upsert + stale rows for ProfitCube, aggregate + stale rows for SkuProfitCube: no items)
+        with self.assertNumQueries(11):
+            result = ingest_orders(self.organization, 'SHOPEE', orders)
+
+        self.assertEqual(result, {'created': 50, 'updated': 0})
+        fixed = SaleTransaction.objects.get(external_id='SN1')
+        self.assertTrue(fixed.is_fixed_cost_applied)
+        self.assertEqual(fixed.calculated_fixed_cost, Decimal('6.00'))
+        self.assertFalse(SaleTransaction.objects.get(external_id='SN0').is_fixed_cost_applied)
+
+    def test_pipeline_batches_and_times_every_stage(self):
+        metrics = PipelineMetrics()
+        raw = [shopee_order(f'SN{i}', 100 + i) for i in range(5)]
+
+        processed = run_order_pipeline(self.organization, 'SHOPEE', raw, normalize_shopee_order, metrics, batch_size=2)
+
+        self.assertEqual(processed, 5)
+        self.assertEqual(metrics.as_dict()['created'], 5)
+        self.assertEqual(set(metrics.seconds), {'fetch', 'normalize', 'enrich', 'margin', 'upsert', 'rollup'})
+        self.assertTrue(all(seconds > 0 for seconds in metrics.seconds.values()))
+
+    def test_logistics_rules_are_cached_until_changed(self):
+        ingest_orders(self.organization, 'SHOPEE', [normalize_shopee_order(shopee_order('SN0', 100))])
+        before = logistics_cache_stats()
+
+        with self.assertNumQueries(0):
+            rules = get_logistics_rules(self.organization.id)
+        self.assertEqual(rules, {('SHOPEE', 'Coleta'): Decimal('6.00')})
+        self.assertEqual(logistics_cache_stats()['hits'], before['hits'] + 1)
+
+        with mock.patch.object(recalculate_organization_margins, 'apply_async') as apply_async:
+            with self.captureOnCommitCallbacks(execute=True):
+                LogisticsCostTable.objects.filter(shipping_method='Coleta').get().delete()
+                # Invalidated only once the deletion is committed
+                with self.assertNumQueries(0):
+                    self.assertEqual(get_logistics_rules(self.organization.id), rules)
+        scope = {'skus': [], 'shipping_methods': [['SHOPEE', 'Coleta']], 'everything': False}
+        apply_async.assert_called_once_with((self.organization.id, scope, False), countdown=30)
+        with self.assertNumQueries(1):
+            self.assertEqual(get_logistics_rules(self.organization.id), {})
+        self.assertEqual(logistics_cache_stats()['misses'], before['misses'] + 1)
+
+    def test_existing_orders_are_updated_and_margins_match(self):
+        ingest_orders(self.organization, 'SHOPEE', [normalize_shopee_order(shopee_order('SN1', 100.1))])
+        result = ingest_orders(self.organization, 'SHOPEE', [
+            normalize_shopee_order(shopee_order('SN1', 250.35)),
+            normalize_shopee_order(shopee_order('SN2', 80)),
+        ])
+
+        self.assertEqual(result, {'created': 1, 'updated': 1})
+        transaction = SaleTransaction.objects.get(external_id='SN1')
+        self.assertEqual(transaction.amount, Decimal('250.35'))
+
+        stored = transaction.net_margin
+        calculate_net_margin(transaction)
+        transaction.refresh_from_db()
+        self.assertEqual(transaction.net_margin, stored)
+
+    def test_cogs_resolved_per_sku(self):
+        ProductCost.objects.create(organization=self.organization, sku='CAM-P', ncm='61091000',
+                                   gross_cost=Decimal('35.00'), credit_icms=Decimal('5.00'),
+                                   credit_pis=Decimal('0.00'), credit_cofins=Decimal('0.00'))
+        raw = shopee_order('SN1', 150, items=[('CAM-P', 2, 60)])
+        # Item without a model: the SKU comes from the listing
+        raw['item_list'].append({'item_id': 2, 'item_sku': 'SEM-CUSTO', 'model_quantity_purchased': 1, 'model_discounted_price': 30})
+        metrics = PipelineMetrics()
+
+        ingest_orders(self.organization, 'SHOPEE', [normalize_shopee_order(raw)], metrics)
+        ingest_orders(self.organization, 'SHOPEE', [normalize_shopee_order(raw)])
+
+        transaction = SaleTransaction.objects.get(external_id='SN1')
+        self.assertEqual(transaction.cogs_amount, Decimal('60.00'))
+        self.assertEqual(metrics.unmatched_skus, 1)
+        # Re-ingesting replaces the line items instead of duplicating them
+        self.assertEqual(
+            sorted(SaleItem.objects.filter(transaction=transaction).values_list('sku', 'unit_cost')),
+            [('CAM-P', Decimal('30.00')), ('SEM-CUSTO', None)],
+        )
+
+        stored = transaction.net_margin
+        calculate_net_margin(transaction)
+        transaction.refresh_from_db()
+        self.assertEqual(transaction.net_margin, stored)
+
+    def test_normalize_ml_order(self):
+        order = normalize_ml_order({'id': 2000001, 'total_amount': 59.9, 'date_created': '2024-03-01T10:00:00.000-03:00',
+                                    'shipping': {'id': 1, 'logistic_type': 'fulfillment'}})
+        ingest_orders(self.organization, 'ML', [order])
+
+        transaction = SaleTransaction.objects.get(platform='ML')
+        self.assertEqual(transaction.external_id, '2000001')
+        self.assertEqual(transaction.amount, Decimal('59.90'))
+        self.assertEqual(transaction.transaction_shipping_method, 'fulfillment')
@@ -0,0 +1,75 @@
+from decimal import Decimal
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.utils import timezone
+from finance_core.models import Organization, TaxProfile, SaleTransaction
+from finance_core.utils import calculate_net_margin, compute_margins
+
+class ComputeMarginsTest(TestCase):
+    def setUp(self):
+        owner = User.objects.create(username='owner')
+        self.benefit_org = Organization.objects.create(name='TTS', cnpj='00000000000001', owner=owner)
+        TaxProfile.objects.create(organization=self.benefit_org, icms_benefit_flag=True, effective_tax_rate=Decimal('1.30'))
+        self.standard_org = Organization.objects.create(name='Padrao', cnpj='00000000000002', owner=owner)
+        TaxProfile.objects.create(organization=self.standard_org)
+        self.no_profile_org = Organization.objects.create(name='Sem Perfil', cnpj='00000000000003', owner=owner)
+
+        now = timezone.now()
+        for organization in (self.benefit_org, self.standard_org, self.no_profile_org):
+            for i, platform in enumerate(['ML', 'SHOPEE', 'ML', 'SHOPEE']):
+                SaleTransaction.objects.create(
+                    organization=organization,
+                    external_id=f'{organization.id}-{i}',
+                    platform=platform,
+                    amount=Decimal('133.33') * (i + 1),
+                    transaction_date=now,
+                    shipping_cost_platform=Decimal('19.99'),
+                    calculated_fixed_cost=Decimal('7.45') if i % 2 else Decimal('0.00'),
+                    is_fixed_cost_applied=bool(i % 2),
+                )
+
+    def test_matches_calculate_net_margin_to_the_cent(self):
+        for transaction in SaleTransaction.objects.all():
+            calculate_net_margin(transaction)
+        expected = dict(SaleTransaction.objects.values_list('id', 'net_margin'))
+        SaleTransaction.objects.update(net_margin=None)
+
+        compute_margins(SaleTransaction.objects.all())
+
+        self.assertEqual(dict(SaleTransaction.objects.values_list('id', 'net_margin')), expected)
+
+    def test_matches_baseline_formula(self):
+        # revenue - cogs - revenue * taxes - revenue * commission - logistics, rounded to the cent.
+        # Benefit: 1.30% ICMS + 9.25% PIS/COFINS; standard: 18% + 9.25%; no TaxProfile: no taxes.
+        # Commission: 16% ML, 14% Shopee. Odd rows carry a fixed cost (7.45) instead of the platform shipping (19.99).
+        SaleTransaction.objects.filter(external_id=f'{self.benefit_org.id}-2').update(cogs_amount=Decimal('50.00'))
+        expected = {
+            (self.benefit_org, 0): Decimal('77.94'), # 133.33 - 133.33 * 0.1055 - 133.33 * 0.16 - 19.99
+            (self.benefit_org, 1): Decimal('193.74'), # 266.66 - 266.66 * 0.1055 - 266.66 * 0.14 - 7.45
+            (self.benefit_org, 2): Decimal('223.80'), # 399.99 - 50.00 - 399.99 * 0.1055 - 399.99 * 0.16 - 19.99
+            (self.standard_org, 3): Decimal('305.88'), # 533.32 - 533.32 * 0.2725 - 533.32 * 0.14 - 7.45 (305.8755)
+            (self.no_profile_org, 0): Decimal('92.01'), # 133.33 - 133.33 * 0.16 - 19.99
+            (self.no_profile_org, 1): Decimal('221.88'), # 266.66 - 266.66 * 0.14 - 7.45
+        }
+
+        compute_margins(SaleTransaction.objects.all())
+
+        for (organization, i), margin in expected.items():
+            self.assertEqual(SaleTransaction.objects.get(external_id=f'{organization.id}-{i}').net_margin, margin, (organization.name, i))
+
+    def test_constant_number_of_queries(self):
+        transactions = list(SaleTransaction.objects.all())
+        # 1 query for tax profiles + 1 bulk UPDATE
+        with self.assertNumQueries(2):
+            compute_margins(transactions)
+
+    def test_breakdown_columns_are_persisted(self):
+        compute_margins(SaleTransaction.objects.all())
+
+        for transaction in SaleTransaction.objects.all():
+            costs = transaction.tax_amount + transaction.commission_amount + transaction.cogs_amount + transaction.total_logistics
+            # The net margin is rounded once from the exact result, so it can differ from the
+            # rounded components by at most one cent
+            self.assertLessEqual(abs(transaction.amount - costs - transaction.net_margin), Decimal('0.01'))
+            if transaction.is_fixed_cost_applied:
+                self.assertEqual(transaction.total_logistics, transaction.calculated_fixed_cost)
@@ -0,0 +1,43 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from django.test import SimpleTestCase
+from finance_core.marketplace_http import get_session
+
+class FlakyHandler(BaseHTTPRequestHandler):
+    responses = []
+    calls = 0
+
+    def do_GET(self):
+        type(self).calls += 1
+        status, headers = self.responses.pop(0) if self.responses else (200, {})
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'{}')
+
+    def log_message(self, *args):
+        pass
+
+class MarketplaceSessionTest(SimpleTestCase):
+    def setUp(self):
+        FlakyHandler.calls = 0
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), FlakyHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f'http://127.0.0.1:{self.server.server_port}/api'
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_retries_throttled_and_server_errors(self):
+        FlakyHandler.responses = [(429, {'Retry-After': '0'}), (503, {'Retry-After': '0'})]
+
+        response = get_session().get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(FlakyHandler.calls, 3)
+
+    def test_session_is_shared_in_the_process(self):
+        self.assertIs(get_session(), get_session())
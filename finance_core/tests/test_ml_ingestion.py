@@ -0,0 +1,67 @@
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock
+import requests
+from django.contrib.auth.models import User
+from django.test import TestCase
+from finance_core.ml_api import MLClient, ORDERS_SEARCH_MAX_LIMIT
+from finance_core.ml_fixtures import RecordedMLApi
+from finance_core.models import Organization, IntegrationProfile, SaleTransaction, SyncCursor
+from finance_core.pipeline import sync_ml_orders
+
+class SyncMLOrdersTest(TestCase):
+    def setUp(self):
+        owner = User.objects.create(username='owner')
+        self.organization = Organization.objects.create(name='Loja', cnpj='00000000000001', owner=owner)
+        self.profile = IntegrationProfile.objects.create(
+            organization=self.organization, ml_client_id='app', ml_client_secret='secret', ml_access_token='token'
+        )
+
+    def _sync(self, api):
+        with mock.patch.object(MLClient, '_get', side_effect=api), mock.patch('finance_core.utils.refresh_ml_token'):
+            return sync_ml_orders(self.profile)
+
+    def test_pages_through_every_order_with_shipment_costs(self):
+        api = RecordedMLApi(120)
+
+        self.assertEqual(self._sync(api), 120)
+
+        self.assertEqual([count for count in api.searches if count], [51, 51, 18]) # Other windows are empty
+        self.assertEqual(SaleTransaction.objects.filter(platform='ML').count(), 120)
+        self.assertEqual(self.profile.ml_user_id, '123456789')
+        self.assertTrue(SyncCursor.objects.filter(organization=self.organization, platform='ML').exists())
+
+        first = SaleTransaction.objects.get(external_id=str(api.orders[0]['id']))
+        self.assertEqual(first.transaction_shipping_method, 'cross_docking')
+        self.assertEqual(first.shipping_cost_platform, Decimal('21.45'))
+        self.assertEqual(first.destination_uf, 'SP')
+        without_shipment = SaleTransaction.objects.get(external_id=str(api.orders[3]['id']))
+        self.assertEqual(without_shipment.shipping_cost_platform, Decimal('0.00'))
+
+    def test_resync_updates_instead_of_duplicating(self):
+        self._sync(RecordedMLApi(ORDERS_SEARCH_MAX_LIMIT))
+        api = RecordedMLApi(ORDERS_SEARCH_MAX_LIMIT)
+        api.orders[0]['total_amount'] = 150.0
+
+        SyncCursor.objects.all().delete() # Full re-sync
+        self._sync(api)
+
+        self.assertEqual(SaleTransaction.objects.filter(platform='ML').count(), ORDERS_SEARCH_MAX_LIMIT)
+        self.assertEqual(SaleTransaction.objects.get(external_id=str(api.orders[0]['id'])).amount, Decimal('150.00'))
+
+    def test_failure_keeps_committed_windows(self):
+        api = RecordedMLApi(60)
+
+        def fail_after_march_2024(path, params=None):
+            if path == '/orders/search' and params['order.date_last_updated.from'] >= '2024-05':
+                raise requests.ConnectionError('reset')
+            return api(path, params)
+
+        with self.assertRaises(requests.ConnectionError):
+            self._sync(fail_after_march_2024)
+
+        # Orders of March 2024 are committed and the next run resumes after their window
+        self.assertEqual(SaleTransaction.objects.filter(platform='ML').count(), 60)
+        cursor = SyncCursor.objects.get(organization=self.organization, platform='ML')
+        self.assertGreater(cursor.last_synced_at, datetime(2024, 3, 2, 12, tzinfo=dt_timezone.utc))
+        self.assertLess(cursor.last_synced_at, datetime(2024, 7, 1, tzinfo=dt_timezone.utc))
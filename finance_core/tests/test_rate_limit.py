@@ -0,0 +1,56 @@
+from unittest import mock
+from django.test import SimpleTestCase
+from finance_core import rate_limit
+from finance_core.rate_limit import MemoryTokenBucket, RedisTokenBucket, acquire, rate_limit_stats, REDIS_RETRY_AFTER
+
+class TokenBucketTest(SimpleTestCase):
+    def test_burst_then_reservations_queue_up(self):
+        bucket = MemoryTokenBucket()
+
+        waits = [bucket.reserve('SHOPEE:1', rate=10, burst=3) for _ in range(5)]
+
+        self.assertEqual(waits[:3], [0.0, 0.0, 0.0])
+        # Each reservation beyond the burst waits one more token interval
+        self.assertAlmostEqual(waits[3], 0.1, delta=0.01)
+        self.assertAlmostEqual(waits[4], 0.2, delta=0.01)
+        # Buckets are independent per app
+        self.assertEqual(bucket.reserve('SHOPEE:2', rate=10, burst=3), 0.0)
+
+    def test_acquire_sleeps_and_records_wait(self):
+        bucket = MemoryTokenBucket()
+        before = rate_limit_stats().get('ML', {'throttled': 0, 'wait_seconds': 0.0})
+
+        with mock.patch('finance_core.rate_limit._get_backend', return_value=bucket), \
+             self.settings(MARKETPLACE_RATE_LIMITS={'ML': (100, 1)}), \
+             mock.patch('finance_core.rate_limit.time.sleep') as sleep:
+            acquire('ML', 'app')
+            waited = acquire('ML', 'app')
+
+        self.assertGreater(waited, 0)
+        sleep.assert_called_once_with(waited)
+        stats = rate_limit_stats()['ML']
+        self.assertEqual(stats['throttled'], before['throttled'] + 1)
+        self.assertAlmostEqual(stats['wait_seconds'], before['wait_seconds'] + waited)
+
+    def test_redis_is_retried_after_an_outage(self):
+        client = mock.Mock()
+        client.register_script.return_value = lambda keys, args: '0'
+        self.addCleanup(setattr, rate_limit, '_backend', None)
+        rate_limit._backend = None
+
+        with self.settings(MARKETPLACE_RATE_LIMIT_URL='redis://localhost:6379/1'), \
+             mock.patch('redis.Redis.from_url', side_effect=[ConnectionError('down'), client]) as from_url, \
+             mock.patch('finance_core.rate_limit.time.monotonic', return_value=1000.0) as monotonic:
+            self.assertIs(rate_limit._get_backend(), rate_limit._fallback)
+            self.assertIs(rate_limit._get_backend(), rate_limit._fallback) # Cooling down
+            self.assertEqual(from_url.call_count, 1)
+
+            monotonic.return_value = 1000.0 + REDIS_RETRY_AFTER
+            self.assertIsInstance(rate_limit._get_backend(), RedisTokenBucket)
+
+            # An error while reserving falls back until the next retry
+            client.register_script.return_value = mock.Mock(side_effect=ConnectionError('reset'))
+            rate_limit._backend = RedisTokenBucket(client)
+            with self.settings(MARKETPLACE_RATE_LIMITS={'ML': (100, 5)}):
+                self.assertEqual(acquire('ML', 'app'), 0.0)
+            self.assertIs(rate_limit._get_backend(), rate_limit._fallback)
@@ -0,0 +1,118 @@
+from decimal import Decimal
+from unittest import mock
+from django.core.cache import cache
+from django.test import TestCase
+from ecommerce_tax_saas.celery import app
+from finance_core.models import SaleTransaction, LogisticsCostTable, DailyProfitSummary
+from finance_core.pipeline import ingest_orders, normalize_shopee_order
+from finance_core.recalculation import recalculate_margins
+from finance_core.tasks import recalculate_organization_margins, request_margin_recalculation
+from finance_core.utils import calculate_net_margin
+from finance_core.tests.factories import create_organization, shopee_order, product_cost
+
+class MarginRecalculationTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        app.conf.task_always_eager = True
+        self.addCleanup(setattr, app.conf, 'task_always_eager', False)
+
+        self.organization = create_organization()
+        self.camiseta = product_cost(self.organization, 'CAM-P', '30.00')
+        ingest_orders(self.organization, 'SHOPEE', [
+            normalize_shopee_order(shopee_order('SN1', 100, items=[('CAM-P', 2, 100)])),
+            normalize_shopee_order(shopee_order('SN2', 100, carrier='Coleta', items=[('BONE', 1, 100)])),
+            normalize_shopee_order(shopee_order('SN3', 100, carrier='Coleta', items=[('CAM-P', 1, 100)])),
+        ])
+
+    def assertMarginConsistent(self, external_id):
+        transaction = SaleTransaction.objects.get(external_id=external_id)
+        stored = transaction.net_margin
+        calculate_net_margin(transaction)
+        transaction.refresh_from_db()
+        self.assertEqual(transaction.net_margin, stored)
+
+    def test_product_cost_change_recalculates_only_its_skus(self):
+        untouched = SaleTransaction.objects.get(external_id='SN2').net_margin
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.camiseta.gross_cost = Decimal('40.00')
+            self.camiseta.save()
+
+        self.assertEqual(SaleTransaction.objects.get(external_id='SN1').cogs_amount, Decimal('80.00'))
+        self.assertEqual(SaleTransaction.objects.get(external_id='SN3').cogs_amount, Decimal('40.00'))
+        self.assertEqual(SaleTransaction.objects.get(external_id='SN2').net_margin, untouched)
+        self.assertMarginConsistent('SN1')
+
+        summary = DailyProfitSummary.objects.get(organization=self.organization, platform='SHOPEE')
+        self.assertEqual(summary.cogs_amount, Decimal('120.00'))
+
+    @mock.patch('finance_core.tasks.cache_is_shared', return_value=True)
+    def test_burst_of_changes_is_coalesced_into_one_job(self, cache_is_shared):
+        with mock.patch.object(recalculate_organization_margins, 'apply_async') as apply_async:
+            with self.captureOnCommitCallbacks(execute=True):
+                product_cost(self.organization, 'BONE', '12.00')
+                LogisticsCostTable.objects.create(organization=self.organization, platform='SHOPEE',
+                                                  shipping_method='Coleta', fixed_cost_value=Decimal('6.00'))
+                self.camiseta.delete()
+        scope = {'skus': ['BONE'], 'shipping_methods': [], 'everything': False}
+        apply_async.assert_called_once_with((self.organization.id, scope, True), countdown=30)
+
+        self.assertEqual(recalculate_organization_margins(self.organization.id, scope, True), 3)
+
+        coleta = SaleTransaction.objects.get(external_id='SN2')
+        self.assertEqual(coleta.cogs_amount, Decimal('12.00'))
+        self.assertTrue(coleta.is_fixed_cost_applied)
+        self.assertEqual(SaleTransaction.objects.get(external_id='SN1').cogs_amount, Decimal('0.00'))
+        self.assertMarginConsistent('SN2')
+
+        # Scope consumed: nothing left for another job
+        self.assertEqual(recalculate_organization_margins(self.organization.id, None, True), 0)
+
+    @mock.patch('finance_core.tasks.cache_is_shared', return_value=True)
+    def test_lost_scope_falls_back_to_everything_only_for_merged_changes(self, cache_is_shared):
+        scopes = []
+        for skus in (['BONE'], ['CAM-P']):
+            with mock.patch.object(recalculate_organization_margins, 'apply_async') as apply_async:
+                request_margin_recalculation(self.organization.id, skus=skus)
+            scopes.append(apply_async.call_args)
+
+        # The second change was merged into the first job's scope, which is then evicted
+        self.assertIsNone(scopes[1])
+        cache.delete(f'margin_recalc:{self.organization.id}:scope')
+        with mock.patch('finance_core.tasks.recalculate_margins', return_value=3) as recalculate:
+            recalculate_organization_margins(*scopes[0].args[0])
+        recalculate.assert_called_once_with(self.organization.id, skus={'BONE'}, shipping_methods=set(), everything=True)
+
+        # A job whose scope was taken by an earlier job (no other change merged) applies its own change
+        with mock.patch.object(recalculate_organization_margins, 'apply_async') as apply_async:
+            request_margin_recalculation(self.organization.id, skus=['BONE'])
+        cache.delete(f'margin_recalc:{self.organization.id}:scope')
+        with mock.patch('finance_core.tasks.recalculate_margins', return_value=1) as recalculate:
+            recalculate_organization_margins(*apply_async.call_args.args[0])
+        recalculate.assert_called_once_with(self.organization.id, skus={'BONE'}, shipping_methods=set(), everything=False)
+
+    def test_renamed_keys_recalculate_old_transactions(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.camiseta.sku = 'CAM-M'
+            self.camiseta.save()
+        self.assertEqual(SaleTransaction.objects.get(external_id='SN3').cogs_amount, Decimal('0.00'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            rule = LogisticsCostTable.objects.create(organization=self.organization, platform='SHOPEE',
+                                                     shipping_method='Coleta', fixed_cost_value=Decimal('6.00'))
+        self.assertEqual(SaleTransaction.objects.filter(is_fixed_cost_applied=True).count(), 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            rule.shipping_method = 'Retirada'
+            rule.save()
+        self.assertEqual(SaleTransaction.objects.filter(is_fixed_cost_applied=True).count(), 0)
+        self.assertMarginConsistent('SN3')
+
+    def test_chunks_walk_every_affected_row(self):
+        with mock.patch.object(recalculate_organization_margins, 'apply_async'), self.captureOnCommitCallbacks(execute=True):
+            LogisticsCostTable.objects.create(organization=self.organization, platform='SHOPEE',
+                                              shipping_method='Coleta', fixed_cost_value=Decimal('6.00'))
+
+        recalculated = recalculate_margins(self.organization.id, everything=True, chunk_size=2)
+
+        self.assertEqual(recalculated, 3)
+        self.assertEqual(SaleTransaction.objects.filter(is_fixed_cost_applied=True).count(), 2)
@@ -0,0 +1,143 @@
+from datetime import date
+from decimal import Decimal
+from django.core.cache import cache
+from django.db import connection, transaction as db_transaction
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from finance_core.models import SaleTransaction, DailyProfitSummary
+from finance_core.rollups import reconcile_daily_summaries, refresh_daily_summaries
+from finance_core.analytics_queries import bucket_count, choose_granularity
+from finance_core.pipeline import ingest_orders, normalize_shopee_order
+from finance_core.tests.factories import create_organization, shopee_order
+
+DAY = 24 * 3600
+JAN_1 = 1704067200 # 2024-01-01T00:00:00Z
+
+def order(order_sn, amount, create_time):
+    return normalize_shopee_order(shopee_order(order_sn, amount, create_time, fee=5))
+
+class DailyProfitSummaryTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.organization = create_organization(icms_benefit=False)
+        ingest_orders(self.organization, 'SHOPEE', [
+            order('A', 100, JAN_1 + 3600),
+            order('B', 50.5, JAN_1 + 7200),
+            order('C', 80, JAN_1 + DAY + 3600),
+        ])
+
+    def test_ingestion_updates_rollup_incrementally(self):
+        jan_1 = DailyProfitSummary.objects.get(date='2024-01-01')
+        self.assertEqual(jan_1.order_count, 2)
+        self.assertEqual(jan_1.revenue, Decimal('150.50'))
+
+        ingest_orders(self.organization, 'SHOPEE', [order('B', 10, JAN_1 + 7200)])
+
+        jan_1.refresh_from_db()
+        self.assertEqual(jan_1.revenue, Decimal('110.00'))
+        self.assertEqual(jan_1.net_margin, sum(
+            SaleTransaction.objects.filter(external_id__in=['A', 'B']).values_list('net_margin', flat=True)
+        ))
+
+    def test_refresh_filters_raw_transaction_date(self):
+        DailyProfitSummary.objects.update(revenue=0)
+        with CaptureQueriesContext(connection) as queries:
+            refresh_daily_summaries(self.organization.id, 'SHOPEE', {date(2024, 1, 1), date(2024, 1, 2), date(2024, 1, 5)})
+
+        aggregate = next(query['sql'] for query in queries if 'GROUP BY' in query['sql'])
+        where = aggregate.split('WHERE')[1].split('GROUP BY')[0]
+        # Jan 1-2 merged into one range, Jan 5 on its own; no cast of the indexed column
+        self.assertEqual(where.count('"transaction_date" >='), 2)
+        self.assertNotIn('cast_date', where)
+        self.assertEqual(DailyProfitSummary.objects.get(date='2024-01-01').revenue, Decimal('150.50'))
+        self.assertEqual(DailyProfitSummary.objects.get(date='2024-01-02').revenue, Decimal('80.00'))
+
+    def test_reconcile_fixes_drift(self):
+        DailyProfitSummary.objects.update(revenue=0)
+        DailyProfitSummary.objects.create(organization=self.organization, platform='ML', date='2023-12-31')
+
+        reconcile_daily_summaries(self.organization.id)
+
+        self.assertEqual(DailyProfitSummary.objects.count(), 2)
+        self.assertEqual(DailyProfitSummary.objects.get(date='2024-01-02').revenue, Decimal('80.00'))
+
+    def test_view_reads_rollup_for_whole_days(self):
+        client = APIClient()
+        params = {'organization_id': self.organization.id, 'start_date': '2024-01-01', 'end_date': '2024-01-02'}
+
+        # KPIs, per-platform KPIs and chart in one query
+        with self.assertNumQueries(1):
+            rollup = client.get('/api/v1/analytics/net-margin/', params).json()
+
+        raw = client.get('/api/v1/analytics/net-margin/', {
+            **params, 'start_date': '2024-01-01T00:00:00Z', 'end_date': '2024-01-02T23:59:59Z'
+        }).json()
+        self.assertEqual(rollup, raw)
+        self.assertEqual(rollup['chart']['granularity'], 'day')
+        self.assertEqual(rollup['chart']['dates'], ['2024-01-01', '2024-01-02'])
+        self.assertEqual(rollup['chart']['series']['SHOPEE']['revenue'], [150.5, 80])
+        self.assertEqual(rollup['platform_kpis']['SHOPEE']['revenue'], rollup['kpis']['revenue'])
+
+    def test_view_response_cached_until_data_changes(self):
+        client = APIClient()
+        params = {'organization_id': self.organization.id, 'start_date': '2024-01-01', 'end_date': '2024-01-02'}
+        first = client.get('/api/v1/analytics/net-margin/', params)
+        etag = first['ETag']
+
+        with self.assertNumQueries(0):
+            self.assertEqual(client.get('/api/v1/analytics/net-margin/', params).json(), first.json())
+            not_modified = client.get('/api/v1/analytics/net-margin/', params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(not_modified.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ingest_orders(self.organization, 'SHOPEE', [order('D', 20, JAN_1 + 3600)])
+
+        changed = client.get('/api/v1/analytics/net-margin/', params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], etag)
+        self.assertEqual(changed.json()['kpis']['revenue'], 250.5)
+
+    def test_request_during_write_does_not_cache_uncommitted_generation(self):
+        client = APIClient()
+        params = {'organization_id': self.organization.id, 'start_date': '2024-01-01', 'end_date': '2024-01-02'}
+        etag = client.get('/api/v1/analytics/net-margin/', params)['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            with db_transaction.atomic():
+                ingest_orders(self.organization, 'SHOPEE', [order('D', 20, JAN_1 + 3600)])
+                # Another request before COMMIT still sees (and caches) the previous generation
+                self.assertEqual(client.get('/api/v1/analytics/net-margin/', params, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        changed = client.get('/api/v1/analytics/net-margin/', params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(changed.json()['kpis']['revenue'], 250.5)
+
+    def test_granularity_counts_calendar_buckets(self):
+        # 31 days spanning three months and five ISO weeks
+        start, end = date(2024, 1, 31), date(2024, 3, 2)
+        self.assertEqual([bucket_count(start, end, granularity) for granularity in ('day', 'week', 'month')], [32, 5, 3])
+        # Sunday to the Monday after next: three weeks in nine days
+        with self.settings(ANALYTICS_CHART_MAX_POINTS=2):
+            self.assertEqual(choose_granularity('auto', (date(2024, 1, 7), date(2024, 1, 15)), 1), 'month')
+        with self.settings(ANALYTICS_CHART_MAX_POINTS=3):
+            self.assertEqual(choose_granularity('auto', (date(2024, 1, 7), date(2024, 1, 15)), 1), 'week')
+
+    def test_view_buckets_chart_to_point_budget(self):
+        client = APIClient()
+        params = {'organization_id': self.organization.id, 'start_date': '2021-01-01', 'end_date': '2024-01-31'}
+
+        with self.settings(ANALYTICS_CHART_MAX_POINTS=200):
+            chart = client.get('/api/v1/analytics/net-margin/', params).json()['chart']
+            weekly = client.get('/api/v1/analytics/net-margin/', {**params, 'granularity': 'week'}).json()['chart']
+
+        # ~1125 days x 2 platforms: daily (2252) and weekly (322) points exceed the budget
+        self.assertEqual(chart['granularity'], 'month')
+        self.assertEqual(chart['dates'], ['2024-01-01'])
+        self.assertEqual(chart['series']['SHOPEE']['revenue'], [230.5])
+        self.assertEqual(weekly['dates'], ['2024-01-01']) # Monday
+        raw_weekly = client.get('/api/v1/analytics/net-margin/', {
+            **params, 'start_date': '2021-01-01T00:00:00Z', 'end_date': '2024-01-31T23:59:59Z', 'granularity': 'week'
+        }).json()['chart']
+        self.assertEqual(raw_weekly, weekly)
+        self.assertEqual(client.get('/api/v1/analytics/net-margin/', {**params, 'granularity': 'year'}).status_code, 400)
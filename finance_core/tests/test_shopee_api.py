@@ -0,0 +1,35 @@
+from unittest import mock
+from django.test import SimpleTestCase
+from finance_core.shopee_api import ShopeeClient, ShopeeAPIError, ORDER_DETAIL_MAX_SNS
+
+class ShopeeOrderPaginationTest(SimpleTestCase):
+    def setUp(self):
+        self.client = ShopeeClient(partner_id=1, partner_key='key', access_token='token', shop_id=2)
+        self.order_sns = [f'SN{i:04d}' for i in range(120)]
+
+    def _fake_request(self, path, params=None):
+        if path == '/order/get_order_list':
+            start = int(params['cursor'] or 0)
+            end = start + params['page_size']
+            page = self.order_sns[start:end]
+            return {'response': {
+                'order_list': [{'order_sn': sn} for sn in page],
+                'more': end < len(self.order_sns),
+                'next_cursor': str(end) if end < len(self.order_sns) else '',
+            }}
+        order_sn_list = params['order_sn_list'].split(',')
+        self.detail_sizes.append(len(order_sn_list))
+        return {'response': {'order_list': [{'order_sn': sn} for sn in order_sn_list]}}
+
+    def test_iter_orders_follows_cursor_and_chunks_details(self):
+        self.detail_sizes = []
+        with mock.patch.object(ShopeeClient, '_make_request', side_effect=self._fake_request):
+            orders = list(self.client.iter_orders(0, 100))
+
+        self.assertEqual([o['order_sn'] for o in orders], self.order_sns)
+        self.assertEqual(self.detail_sizes, [ORDER_DETAIL_MAX_SNS, ORDER_DETAIL_MAX_SNS, 20])
+
+    def test_api_error_is_raised(self):
+        with mock.patch.object(ShopeeClient, '_make_request', return_value={'error': 'error_auth', 'message': 'Invalid token'}):
+            with self.assertRaises(ShopeeAPIError):
+                list(self.client.iter_orders(0, 100))
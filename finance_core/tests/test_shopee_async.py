@@ -0,0 +1,131 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+from django.test import SimpleTestCase
+from finance_core.shopee_api import ShopeeAPIError
+from finance_core.shopee_async import AsyncShopeeClient
+
+class FakeShopeeHandler(BaseHTTPRequestHandler):
+    """
+    Minimal get_order_list / get_order_detail with a cursor and a bit of latency.
+    """
+    order_sns = [f'SN{i:04d}' for i in range(230)]
+    error = None
+    throttled = 0 # Next detail requests answered with 429
+    lock = threading.Lock()
+    in_flight = 0
+    max_in_flight = 0
+    requests = {'list': 0, 'detail': 0}
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        assert params['sign'] and params['partner_id'] == '1' and params['shop_id'] == '2'
+
+        cls = type(self)
+        with cls.lock:
+            cls.requests['list' if url.path.endswith('/order/get_order_list') else 'detail'] += 1
+            throttle = cls.throttled > 0 and not url.path.endswith('/order/get_order_list')
+            if throttle:
+                cls.throttled -= 1
+        if throttle:
+            self.send_response(429)
+            self.send_header('Retry-After', '0')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        if self.error:
+            body = {'error': self.error, 'message': 'Invalid token'}
+        elif url.path.endswith('/order/get_order_list'):
+            start = int(params.get('cursor') or 0)
+            end = start + int(params['page_size'])
+            more = end < len(self.order_sns)
+            body = {'response': {
+                'order_list': [{'order_sn': sn} for sn in self.order_sns[start:end]],
+                'more': more,
+                'next_cursor': str(end) if more else '',
+            }}
+        else:
+            with cls.lock:
+                cls.in_flight += 1
+                cls.max_in_flight = max(cls.max_in_flight, cls.in_flight)
+            time.sleep(0.05)
+            with cls.lock:
+                cls.in_flight -= 1
+            body = {'response': {'order_list': [{'order_sn': sn} for sn in params['order_sn_list'].split(',')]}}
+
+        payload = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+class AsyncShopeeClientTest(SimpleTestCase):
+    def setUp(self):
+        FakeShopeeHandler.error = None
+        FakeShopeeHandler.throttled = 0
+        FakeShopeeHandler.max_in_flight = 0
+        FakeShopeeHandler.requests = {'list': 0, 'detail': 0}
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeShopeeHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.client = AsyncShopeeClient(
+            partner_id=1, partner_key='key', access_token='token', shop_id=2,
+            concurrency=3, base_url=f'http://127.0.0.1:{self.server.server_port}/api/v2',
+        )
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_fetches_every_order_with_bounded_concurrency(self):
+        orders = list(self.client.iter_orders(0, 100, time_range_field='update_time'))
+
+        self.assertEqual(sorted(order['order_sn'] for order in orders), FakeShopeeHandler.order_sns)
+        self.assertGreater(FakeShopeeHandler.max_in_flight, 1)
+        self.assertLessEqual(FakeShopeeHandler.max_in_flight, 3)
+
+    def test_api_error_is_raised_in_the_caller(self):
+        FakeShopeeHandler.error = 'error_auth'
+
+        with self.assertRaises(ShopeeAPIError):
+            list(self.client.iter_orders(0, 100))
+
+    def test_consumer_can_stop_early(self):
+        orders = self.client.iter_orders(0, 100)
+        next(orders)
+        orders.close()
+
+        self.assertFalse(any(thread.name == 'shopee-order-details' for thread in threading.enumerate()))
+
+    def test_rate_limited_detail_pages_are_retried(self):
+        FakeShopeeHandler.throttled = 3
+
+        orders = list(self.client.iter_orders(0, 100))
+
+        self.assertEqual(len(orders), len(FakeShopeeHandler.order_sns))
+        self.assertEqual(FakeShopeeHandler.requests['detail'], 5 + 3)
+
+    def test_stalled_consumer_pauses_fetching(self):
+        FakeShopeeHandler.order_sns = [f'SN{i:04d}' for i in range(2000)]
+        self.addCleanup(setattr, FakeShopeeHandler, 'order_sns', [f'SN{i:04d}' for i in range(230)])
+
+        async def run():
+            never = asyncio.Event()
+            async def emit(orders):
+                await never.wait()
+            fetcher = asyncio.ensure_future(self.client.fetch_orders(0, 100, emit))
+            await asyncio.sleep(0.5)
+            fetcher.cancel()
+            await asyncio.gather(fetcher, return_exceptions=True)
+
+        asyncio.run(run())
+        # One detail page per slot (3), and the list cursor stops at the page that filled them
+        self.assertEqual(FakeShopeeHandler.requests, {'list': 2, 'detail': 3})
@@ -0,0 +1,158 @@
+import random
+from decimal import Decimal
+from unittest import mock
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase
+from rest_framework.test import APIClient
+from finance_core.models import Organization, TaxProfile, SaleTransaction, SimulationJob
+from finance_core.pipeline import ingest_orders, normalize_shopee_order
+from finance_core.simulation import (
+    Scenario, build_scenarios, simulate_monthly, simulated_margin_centavos, simulated_margin_decimal, RATE_SCALE
+)
+from finance_core.simulation_jobs import run_job
+
+JAN_10 = 1704880800 # 2024-01-10T10:00:00Z
+DAY = 86400
+
+class SimulatedMarginTest(TestCase):
+    def assertMatchesDecimal(self, amounts, bases, rates):
+        simulated = simulated_margin_centavos(np.array(amounts, dtype=np.int64), np.array(bases, dtype=np.int64),
+                                              np.array([Scenario('SIMPLES', rate).scaled_rate for rate in rates], dtype=np.int64))
+        for i, (amount, base) in enumerate(zip(amounts, bases)):
+            for j, rate in enumerate(rates):
+                expected = simulated_margin_decimal(Decimal(amount) / 100, Decimal(base) / 100, Decimal(0), rate)
+                self.assertEqual(Decimal(int(simulated[i, j])) / 100, expected, (amount, base, rate))
+
+    def test_half_cents_and_negative_margins(self):
+        # 0.5 cent ties in both directions, exact values and margins turned negative by the tax
+        self.assertMatchesDecimal([1, 25, 125, 99990, 100], [0, 0, -1, 500, 3],
+                                  [Decimal('0.5'), Decimal('0.02'), Decimal('0.06'), Decimal('0.123456'), Decimal('0.035')])
+
+    def test_random_transactions(self):
+        generator = random.Random(7)
+        amounts = [generator.randint(0, 10 ** 7) for _ in range(300)]
+        bases = [generator.randint(-10 ** 6, 10 ** 6) for _ in range(300)]
+        rates = [Decimal(generator.randint(0, RATE_SCALE)) / RATE_SCALE for _ in range(5)]
+        self.assertMatchesDecimal(amounts, bases, rates)
+
+    def test_rate_precision_and_regimes(self):
+        with self.assertRaises(ValueError):
+            Scenario('SIMPLES', Decimal('0.0000001')).scaled_rate
+        with self.assertRaises(ValueError):
+            build_scenarios(['LUCRO_REAL'])
+
+        scenarios = build_scenarios(['SIMPLES', 'EFETIVA_1'], {'SIMPLES': ['0.04', '0.08']})
+        self.assertEqual([(s.regime, s.rate) for s in scenarios],
+                         [('SIMPLES', Decimal('0.04')), ('SIMPLES', Decimal('0.08')), ('EFETIVA_1', Decimal('0.1025'))])
+
+class MonthlySimulationTest(TestCase):
+    def setUp(self):
+        owner = User.objects.create(username='owner')
+        self.organization = Organization.objects.create(name='Loja', cnpj='00000000000001', owner=owner)
+        TaxProfile.objects.create(organization=self.organization)
+        # 3 orders in January, 2 in February, 1 in April
+        ingest_orders(self.organization, 'SHOPEE', [
+            normalize_shopee_order({'order_sn': f'SN{i}', 'total_amount': 99.95 + i * 13.33, 'create_time': JAN_10 + day * DAY})
+            for i, day in enumerate([0, 5, 15, 25, 40, 95])
+        ])
+
+    def expected(self, scenarios):
+        months = {}
+        for transaction in SaleTransaction.objects.order_by('transaction_date'):
+            totals = months.setdefault(transaction.transaction_date.strftime('%Y-%m'), [0] * len(scenarios))
+            for i, scenario in enumerate(scenarios):
+                totals[i] += simulated_margin_decimal(transaction.amount, transaction.net_margin, transaction.tax_amount, scenario.rate)
+        return months
+
+    def test_chunks_match_decimal_reference(self):
+        scenarios = build_scenarios(['SIMPLES', 'PADRAO', 'EFETIVA_1'], {'SIMPLES': ['0.04', '0.06']})
+        expected = self.expected(scenarios)
+        queryset = SaleTransaction.objects.filter(organization=self.organization)
+
+        for chunk_size in (2, 4, 1000): # Months split across chunks
+            result = simulate_monthly(queryset, scenarios, chunk_size=chunk_size)
+            self.assertEqual(result['months'], ['2024-01', '2024-02', '2024-04'])
+            self.assertEqual(result['transaction_count'], [3, 2, 1])
+            for i in range(len(scenarios)):
+                self.assertEqual(result['simulated_margin'][i], [expected[month][i] for month in result['months']])
+
+    def test_view(self):
+        client = APIClient()
+        response = client.post('/api/v1/analytics/simulate-tax/', {
+            'mode': 'monthly', 'organization_id': self.organization.id, 'regimes': ['SIMPLES', 'EFETIVA_1'],
+            'rate_scenarios': {'SIMPLES': ['0.04', '0.06']}, 'start_date': '2024-02-01', 'platform': 'SHOPEE',
+        }, format='json')
+
+        data = response.json()
+        self.assertEqual(data['months'], ['2024-02', '2024-04'])
+        self.assertEqual([scenario['regime'] for scenario in data['scenarios']], ['SIMPLES', 'SIMPLES', 'EFETIVA_1'])
+        self.assertEqual(len(data['simulated_margin']), 3)
+        expected = self.expected(build_scenarios(['SIMPLES'], {'SIMPLES': ['0.06']}))
+        self.assertEqual(Decimal(str(data['simulated_margin'][1][1])), expected['2024-04'][0])
+
+        for body in ({'regimes': ['LUCRO_REAL']}, {'rate_scenarios': {'SIMPLES': ['0.0000001']}}, {'organization_id': None}):
+            response = client.post('/api/v1/analytics/simulate-tax/', {
+                'mode': 'monthly', 'organization_id': self.organization.id, **body
+            }, format='json')
+            self.assertEqual(response.status_code, 400)
+
+class SimulationJobTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        owner = User.objects.create(username='owner')
+        self.organization = Organization.objects.create(name='Loja', cnpj='00000000000001', owner=owner)
+        TaxProfile.objects.create(organization=self.organization)
+        self.ingest([f'SN{i}' for i in range(5)])
+        self.client = APIClient()
+        self.body = {'organization_id': self.organization.id, 'regimes': ['SIMPLES', 'PADRAO'], 'start_date': '2024-01-01'}
+
+    def ingest(self, order_sns):
+        ingest_orders(self.organization, 'SHOPEE', [
+            normalize_shopee_order({'order_sn': order_sn, 'total_amount': 80.15 + i, 'create_time': JAN_10 + i * 20 * DAY})
+            for i, order_sn in enumerate(order_sns)
+        ])
+
+    @mock.patch('finance_core.tasks.run_simulation_job.delay')
+    def test_job_pages_and_deduplication(self, delay):
+        response = self.client.post('/api/v1/analytics/simulation-jobs/', self.body, format='json')
+        self.assertEqual(response.status_code, 202)
+        job_id = response.json()['id']
+        delay.assert_called_once_with(job_id)
+        self.assertEqual(run_job(job_id, page_size=2), 'DONE')
+        self.assertIsNone(run_job(job_id)) # Already claimed
+
+        data = self.client.get(f'/api/v1/analytics/simulation-jobs/{job_id}/', {'page': 3}).json()
+        self.assertEqual((data['status'], data['processed_count'], data['total_count'], data['page_count']), ('DONE', 5, 5, 3))
+        scenarios = build_scenarios(['SIMPLES', 'PADRAO'])
+        expected = simulate_monthly(SaleTransaction.objects.all(), scenarios)
+        self.assertEqual(data['result']['months'], expected['months'])
+        self.assertEqual([[Decimal(str(value)) for value in margins] for margins in data['result']['simulated_margin']],
+                         expected['simulated_margin'])
+
+        last = SaleTransaction.objects.order_by('transaction_date').last()
+        self.assertEqual(data['transactions']['transaction_id'], [last.id])
+        self.assertEqual(Decimal(str(data['transactions']['simulated_margin'][1][0])),
+                         simulated_margin_decimal(last.amount, last.net_margin, last.tax_amount, scenarios[1].rate))
+        self.assertEqual(self.client.get(f'/api/v1/analytics/simulation-jobs/{job_id}/', {'page': 4}).status_code, 404)
+
+        # Identical request: served from the stored job
+        response = self.client.post('/api/v1/analytics/simulation-jobs/', self.body, format='json')
+        self.assertEqual((response.status_code, response.json()['id']), (200, job_id))
+
+        # New data: new generation, new job
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ingest(['SN9'])
+        response = self.client.post('/api/v1/analytics/simulation-jobs/', self.body, format='json')
+        self.assertEqual(response.status_code, 202)
+        self.assertNotEqual(response.json()['id'], job_id)
+
+    @mock.patch('finance_core.tasks.run_simulation_job.delay', side_effect=ConnectionError('broker down'))
+    def test_schedule_failure_is_not_reused(self, delay):
+        response = self.client.post('/api/v1/analytics/simulation-jobs/', self.body, format='json')
+        self.assertEqual(response.json()['status'], 'FAILED')
+
+        response = self.client.post('/api/v1/analytics/simulation-jobs/', self.body, format='json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(SimulationJob.objects.count(), 2)
@@ -0,0 +1,63 @@
+from datetime import timedelta
+from unittest import mock
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+from finance_core.models import Organization, IntegrationProfile, SyncCursor, SaleTransaction
+from finance_core.shopee_async import AsyncShopeeClient
+from finance_core.pipeline import fetch_and_process_shopee_orders, INGESTION_BATCH_SIZE
+from finance_core.tests.factories import shopee_order
+from finance_core.utils import SYNC_OVERLAP
+
+class ShopeeSyncCursorTest(TestCase):
+    def setUp(self):
+        owner = User.objects.create(username='owner')
+        self.organization = Organization.objects.create(name='Loja', cnpj='00000000000001', owner=owner)
+        self.profile = IntegrationProfile.objects.create(
+            organization=self.organization,
+            ml_client_id='x', ml_client_secret='y',
+            shopee_partner_id='1', shopee_partner_key='key',
+            shopee_access_token='token', shopee_shop_id='2'
+        )
+
+    def test_cursor_advances_and_next_run_fetches_delta(self):
+        with mock.patch.object(AsyncShopeeClient, 'iter_orders', return_value=iter([])) as iter_orders:
+            fetch_and_process_shopee_orders(self.profile)
+
+        cursor = SyncCursor.objects.get(organization=self.organization, platform='SHOPEE')
+        self.assertEqual(iter_orders.call_args.kwargs['time_range_field'], 'update_time')
+        self.assertAlmostEqual(cursor.last_synced_at.timestamp(), timezone.now().timestamp(), delta=5)
+
+        with mock.patch.object(AsyncShopeeClient, 'iter_orders', return_value=iter([])) as iter_orders:
+            fetch_and_process_shopee_orders(self.profile)
+
+        time_from = iter_orders.call_args.args[0]
+        self.assertEqual(time_from, int((cursor.last_synced_at - SYNC_OVERLAP).timestamp()))
+
+    def test_cursor_not_advanced_when_batch_fails(self):
+        with mock.patch.object(AsyncShopeeClient, 'iter_orders', side_effect=RuntimeError('boom')):
+            fetch_and_process_shopee_orders(self.profile)
+
+        self.assertFalse(SyncCursor.objects.filter(organization=self.organization).exists())
+
+    def test_failure_keeps_committed_batches(self):
+        def orders(*args, **kwargs):
+            for i in range(INGESTION_BATCH_SIZE + 10):
+                yield shopee_order(f'SN{i}', 100)
+            raise RuntimeError('soft time limit')
+
+        with mock.patch.object(AsyncShopeeClient, 'iter_orders', side_effect=orders):
+            fetch_and_process_shopee_orders(self.profile)
+
+        # The first batch was committed on its own; the window stays open for the next run
+        self.assertEqual(SaleTransaction.objects.count(), INGESTION_BATCH_SIZE)
+        self.assertFalse(SyncCursor.objects.filter(organization=self.organization).exists())
+
+    def test_reset_command_backfills_and_clears(self):
+        call_command('reset_sync_cursor', organization=self.organization.id, platform='ML', since='2024-01-01', stdout=mock.Mock())
+        cursor = SyncCursor.objects.get(organization=self.organization, platform='ML')
+        self.assertEqual(cursor.last_synced_at.date().isoformat(), '2024-01-01')
+
+        call_command('reset_sync_cursor', organization=self.organization.id, stdout=mock.Mock())
+        self.assertFalse(SyncCursor.objects.exists())
@@ -0,0 +1,51 @@
+from unittest import mock
+import requests
+from django.contrib.auth.models import User
+from django.test import TestCase
+from ecommerce_tax_saas.celery import app
+from finance_core.models import Organization, IntegrationProfile, CollectionRun, IntegrationErrorLog
+from finance_core.tasks import fetch_all_new_orders
+
+class FetchAllNewOrdersFanOutTest(TestCase):
+    def setUp(self):
+        app.conf.task_always_eager = True
+        self.addCleanup(setattr, app.conf, 'task_always_eager', False)
+
+        owner = User.objects.create(username='owner')
+        self.org_a = Organization.objects.create(name='A', cnpj='00000000000001', owner=owner)
+        self.org_b = Organization.objects.create(name='B', cnpj='00000000000002', owner=owner)
+        IntegrationProfile.objects.create(organization=self.org_a, ml_client_id='x', ml_client_secret='y',
+                                          ml_access_token='ml', shopee_access_token='sp')
+        IntegrationProfile.objects.create(organization=self.org_b, ml_client_id='x', ml_client_secret='y',
+                                          shopee_access_token='sp')
+
+    @mock.patch('finance_core.tasks.sync_ml_orders', return_value=3)
+    @mock.patch('finance_core.tasks.sync_shopee_orders')
+    def test_one_subtask_per_tenant_platform_and_run_recorded(self, sync_shopee, sync_ml):
+        def shopee(profile, metrics):
+            if profile.organization_id == self.org_b.id:
+                raise ValueError('bad payload')
+            return 5
+        sync_shopee.side_effect = shopee
+
+        run_id = fetch_all_new_orders()
+
+        run = CollectionRun.objects.get(id=run_id)
+        self.assertEqual(run.tenant_count, 3)
+        self.assertEqual(run.failed_count, 1)
+        self.assertIsNotNone(run.duration_seconds)
+        outcomes = {(r['organization_id'], r['platform']): r for r in run.results}
+        self.assertEqual(outcomes[(self.org_a.id, 'ML')]['orders'], 3)
+        self.assertEqual(outcomes[(self.org_a.id, 'SHOPEE')]['orders'], 5)
+        self.assertEqual(outcomes[(self.org_b.id, 'SHOPEE')]['status'], 'error')
+        self.assertTrue(IntegrationErrorLog.objects.filter(organization=self.org_b).exists())
+
+    @mock.patch('finance_core.tasks.sync_ml_orders', side_effect=requests.ConnectionError('reset'))
+    @mock.patch('finance_core.tasks.sync_shopee_orders', return_value=0)
+    def test_transient_errors_are_retried(self, sync_shopee, sync_ml):
+        run_id = fetch_all_new_orders()
+
+        run = CollectionRun.objects.get(id=run_id)
+        outcome = next(r for r in run.results if r['platform'] == 'ML')
+        self.assertEqual(outcome['status'], 'error')
+        self.assertEqual(sync_ml.call_count, 4) # 1 attempt + 3 retries
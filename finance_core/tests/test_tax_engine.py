@@ -0,0 +1,49 @@
+from decimal import Decimal
+from django.contrib.auth.models import User
+from django.test import TestCase
+from finance_core.models import Organization, TaxProfile
+from finance_core.tax_engine import compile_tax_profile, normalize_uf, NO_TAX
+
+class TaxEngineTest(TestCase):
+    def setUp(self):
+        owner = User.objects.create(username='owner')
+        self.organization = Organization.objects.create(name='TTS', cnpj='00000000000001', owner=owner)
+        self.profile = TaxProfile.objects.create(organization=self.organization, origin_uf='MG')
+
+    def test_standard_rates_by_destination(self):
+        compiled = compile_tax_profile(self.profile)
+
+        self.assertEqual(compiled.rates_for(None).total, Decimal('0.2725'))
+        self.assertEqual(compiled.rates_for('MG').total, Decimal('0.2725'))
+        self.assertEqual(compiled.rates_for('SP').icms, Decimal('0.12'))
+        self.assertEqual(compiled.rates_for('BA').icms, Decimal('0.07'))
+        self.assertTrue(compiled.rates_for('BA').deducts_credits)
+        self.assertIs(compile_tax_profile(None).rates_for('SP'), NO_TAX)
+
+    def test_benefit_uses_effective_rates(self):
+        self.profile.icms_benefit_flag = True
+        self.profile.effective_tax_rate = Decimal('1.30')
+        self.profile.effective_rate_interstate = Decimal('3.00')
+        self.profile.save()
+        compiled = compile_tax_profile(self.profile)
+
+        self.assertEqual(compiled.rates_for('MG').total, Decimal('0.1055'))
+        self.assertEqual(compiled.rates_for('SP').total, Decimal('0.1225'))
+        self.assertFalse(compiled.rates_for('SP').deducts_credits)
+
+    def test_compiled_once_and_invalidated_on_save(self):
+        compiled = compile_tax_profile(self.profile)
+        self.assertIs(compile_tax_profile(TaxProfile.objects.get(pk=self.profile.pk)), compiled)
+
+        self.profile.origin_uf = 'SP'
+        self.profile.save()
+
+        recompiled = compile_tax_profile(self.profile)
+        self.assertIsNot(recompiled, compiled)
+        self.assertEqual(recompiled.rates_for('MG').icms, Decimal('0.12'))
+
+    def test_normalize_uf(self):
+        self.assertEqual(normalize_uf('BR-SP'), 'SP')
+        self.assertEqual(normalize_uf('Sao Paulo'), 'SP')
+        self.assertEqual(normalize_uf('Espírito Santo'), 'ES')
+        self.assertIsNone(normalize_uf('Atlantis'))
@@ -0,0 +1,58 @@
+from decimal import Decimal, ROUND_HALF_UP
+from django.contrib.auth.models import User
+from django.test import TestCase
+from rest_framework.test import APIClient
+from finance_core.models import Organization, TaxProfile, SaleTransaction
+from finance_core.pipeline import ingest_orders, normalize_shopee_order
+
+JAN_1 = 1704067200 # 2024-01-01T00:00:00Z
+CENTS = Decimal('0.01')
+
+class TaxSimulationViewTest(TestCase):
+    def setUp(self):
+        owner = User.objects.create(username='owner')
+        self.organization = Organization.objects.create(name='Loja', cnpj='00000000000001', owner=owner)
+        TaxProfile.objects.create(organization=self.organization)
+        ingest_orders(self.organization, 'SHOPEE', [
+            normalize_shopee_order({'order_sn': f'SN{i}', 'total_amount': 99.9 + i, 'create_time': JAN_1 + i * 86400})
+            for i in range(5)
+        ])
+        self.client = APIClient()
+
+    def expected_margin(self, transaction, rate):
+        return (transaction.net_margin + transaction.tax_amount - transaction.amount * rate).quantize(CENTS, rounding=ROUND_HALF_UP)
+
+    def test_per_transaction_results_and_totals_in_one_query(self):
+        ids = list(SaleTransaction.objects.values_list('id', flat=True))
+
+        with self.assertNumQueries(1):
+            response = self.client.post('/api/v1/analytics/simulate-tax/', {
+                'transaction_ids': ids, 'simulated_regime': 'SIMPLES'
+            }, format='json')
+
+        data = response.json()
+        self.assertEqual(len(data['transactions']), 5)
+        expected_total = Decimal(0)
+        for row in data['transactions']:
+            transaction = SaleTransaction.objects.get(id=row['transaction_id'])
+            expected = self.expected_margin(transaction, Decimal('0.06'))
+            self.assertEqual(Decimal(str(row['simulated_margin'])), expected)
+            expected_total += expected
+        self.assertEqual(Decimal(str(data['totals']['simulated_margin'])), expected_total)
+        self.assertEqual(data['totals']['transaction_count'], 5)
+
+    def test_aggregate_only_over_date_range(self):
+        response = self.client.post('/api/v1/analytics/simulate-tax/', {
+            'organization_id': self.organization.id, 'simulated_regime': 'EFETIVA_1',
+            'start_date': '2024-01-02', 'end_date': '2024-01-03', 'aggregate_only': True
+        }, format='json')
+
+        data = response.json()
+        self.assertNotIn('transactions', data)
+        self.assertEqual(data['totals']['transaction_count'], 2)
+        expected = sum(self.expected_margin(t, Decimal('0.1025')) for t in SaleTransaction.objects.filter(external_id__in=['SN1', 'SN2']))
+        self.assertEqual(Decimal(str(data['totals']['simulated_margin'])), expected)
+
+    def test_missing_params(self):
+        response = self.client.post('/api/v1/analytics/simulate-tax/', {'simulated_regime': 'SIMPLES'}, format='json')
+        self.assertEqual(response.status_code, 400)
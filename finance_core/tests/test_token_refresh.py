@@ -0,0 +1,86 @@
+from datetime import timedelta
+from unittest import mock
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase
+from django.utils import timezone
+from finance_core.models import Organization, IntegrationProfile, IntegrationErrorLog
+from finance_core.tasks import schedule_token_refreshes, refresh_platform_token
+from finance_core.utils import ensure_fresh_token, TOKEN_REFRESH_LEAD
+
+class TokenRefreshSchedulerTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        owner = User.objects.create(username='owner')
+        now = timezone.now()
+        self.profiles = {}
+        for name, ml_expiry, shopee_expiry in [
+            ('soon', now + timedelta(minutes=15), now + timedelta(hours=3)),
+            ('later', now + timedelta(hours=5), now + timedelta(minutes=5)),
+            ('fresh', now + timedelta(hours=5), now + timedelta(hours=3)),
+        ]:
+            organization = Organization.objects.create(name=name, cnpj=name.zfill(14), owner=owner)
+            self.profiles[name] = IntegrationProfile.objects.create(
+                organization=organization, ml_client_id='x', ml_client_secret='y',
+                ml_refresh_token='ml-refresh', ml_token_expiry_date=ml_expiry,
+                shopee_partner_id='1', shopee_partner_key='key', shopee_shop_id='2',
+                shopee_refresh_token='sp-refresh', shopee_token_expiry_date=shopee_expiry,
+            )
+
+    def test_schedules_only_expiring_tokens_at_expiry_minus_lead(self):
+        with mock.patch.object(refresh_platform_token, 'apply_async') as apply_async:
+            self.assertEqual(schedule_token_refreshes(), 2)
+            # A second sweep does not schedule the same refreshes again
+            self.assertEqual(schedule_token_refreshes(), 0)
+
+        scheduled = {call.args[0]: call.kwargs['eta'] for call in apply_async.call_args_list}
+        soon, later = self.profiles['soon'], self.profiles['later']
+        self.assertEqual(set(scheduled), {(soon.id, 'ML'), (later.id, 'SHOPEE')})
+        self.assertEqual(scheduled[(soon.id, 'ML')], soon.ml_token_expiry_date - TOKEN_REFRESH_LEAD)
+        # Already inside the lead window: refresh now
+        self.assertLessEqual(scheduled[(later.id, 'SHOPEE')], timezone.now())
+
+    def test_shopee_profiles_without_shop_are_skipped(self):
+        IntegrationProfile.objects.filter(id=self.profiles['later'].id).update(shopee_shop_id='')
+        with mock.patch.object(refresh_platform_token, 'apply_async') as apply_async:
+            self.assertEqual(schedule_token_refreshes(), 1)
+        apply_async.assert_called_once()
+        self.assertEqual(apply_async.call_args.args[0], (self.profiles['soon'].id, 'ML'))
+
+        profile = IntegrationProfile.objects.get(id=self.profiles['later'].id)
+        profile.shopee_shop_id = 'not-a-number'
+        with mock.patch('finance_core.utils.get_session') as get_session:
+            refresh_platform_token(profile.id, 'SHOPEE') # Missing shop id: nothing to do
+            profile.save(update_fields=['shopee_shop_id'])
+            refresh_platform_token(profile.id, 'SHOPEE')
+        get_session.assert_not_called()
+        self.assertEqual(IntegrationErrorLog.objects.filter(task_name='refresh_shopee_token').count(), 1)
+
+    @mock.patch('finance_core.utils.refresh_shopee_token')
+    def test_concurrent_callers_do_not_refresh_twice(self, refresh_shopee):
+        profile = self.profiles['later']
+        # Another worker refreshed the token while this one waited for the row lock
+        IntegrationProfile.objects.filter(id=profile.id).update(
+            shopee_access_token='new', shopee_token_expiry_date=timezone.now() + timedelta(hours=4)
+        )
+
+        ensure_fresh_token(profile, 'SHOPEE')
+        refresh_shopee.assert_not_called()
+        self.assertEqual(profile.shopee_access_token, 'new')
+
+        IntegrationProfile.objects.filter(id=profile.id).update(shopee_token_expiry_date=timezone.now())
+        profile.refresh_from_db()
+        ensure_fresh_token(profile, 'SHOPEE')
+        refresh_shopee.assert_called_once()
+
+    def test_shopee_refresh_stores_expiry(self):
+        profile = self.profiles['later']
+        response = mock.Mock(**{'json.return_value': {'access_token': 'new', 'refresh_token': 'new-refresh', 'expire_in': 14400}})
+
+        with mock.patch('finance_core.utils.get_session') as get_session:
+            get_session.return_value.post.return_value = response
+            refresh_platform_token(profile.id, 'SHOPEE')
+
+        profile.refresh_from_db()
+        self.assertEqual(profile.shopee_access_token, 'new')
+        self.assertGreater(profile.shopee_token_expiry_date, timezone.now() + timedelta(hours=3))
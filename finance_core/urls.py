@@ -1,7 +1,7 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import OrganizationViewSet, TaxProfileViewSet, ProductCostViewSet, MLAuthStartView, MLAuthCallbackView, ShopeeAuthStartView, ShopeeAuthCallbackView
-from .analytics_views import NetMarginAnalyticsView, TaxSimulationView
+from .analytics_views import NetMarginAnalyticsView, ProfitCubeView, TaxSimulationView, SimulationJobView, SimulationJobDetailView
 
 router = DefaultRouter()
 router.register(r'organizations', OrganizationViewSet)
@@ -15,5 +15,8 @@ urlpatterns = [
     path('shopee/auth/start/', ShopeeAuthStartView.as_view(), name='shopee-auth-start'),
     path('integrations/shopee/callback/', ShopeeAuthCallbackView.as_view(), name='shopee-auth-callback'),
     path('analytics/net-margin/', NetMarginAnalyticsView.as_view(), name='analytics-net-margin'),
+    path('analytics/cube/', ProfitCubeView.as_view(), name='analytics-cube'),
     path('analytics/simulate-tax/', TaxSimulationView.as_view(), name='analytics-simulate-tax'),
+    path('analytics/simulation-jobs/', SimulationJobView.as_view(), name='analytics-simulation-jobs'),
+    path('analytics/simulation-jobs/<int:job_id>/', SimulationJobDetailView.as_view(), name='analytics-simulation-job'),
 ]
@@ -1,55 +1,65 @@
-import requests
 from django.utils import timezone
 from datetime import timedelta
 from django.utils import timezone
-from datetime import timedelta
-from decimal import Decimal
+from datetime import timedelta, timezone as dt_timezone
+from decimal import Decimal, ROUND_HALF_UP
 import logging
-import time
 from django.core.mail import send_mail
 from django.conf import settings
-from .models import IntegrationProfile, SaleTransaction, ProductCost, LogisticsCostTable, IntegrationErrorLog
-from .shopee_api import ShopeeClient
+from django.db import transaction as db_transaction
+from .models import IntegrationProfile, SaleTransaction, ProductCost, IntegrationErrorLog, TaxProfile, SyncCursor
+from .shopee_api import ShopeeClient, SHOPEE_API_URL
+from .tax_engine import compile_tax_profile, NO_TAX_PROFILE
+from .marketplace_http import get_session
 
 logger = logging.getLogger(__name__)
 
 ML_AUTH_URL = "https://auth.mercadolivre.com.br/authorization"
 ML_TOKEN_URL = "https://api.mercadolibre.com/oauth/token"
-ML_API_BASE = "https://api.mercadolibre.com"
 
-# ... (Previous ML functions remain here: refresh_ml_token, fetch_and_process_ml_orders, process_single_order)
+# Incremental sync
+ML_INITIAL_SYNC_FROM = timezone.datetime(2023, 1, 1, tzinfo=dt_timezone.utc)
+ML_SYNC_WINDOW = timedelta(days=30) # The ML watermark moves after each committed window
+SHOPEE_INITIAL_LOOKBACK = timedelta(days=15)
+SYNC_OVERLAP = timedelta(minutes=5) # Re-read a small overlap to tolerate clock skew between us and the platform
 
-def calculate_net_margin(transaction: SaleTransaction):
+# Token refresh
+TOKEN_REFRESH_LEAD = timedelta(minutes=10) # Refresh this long before the token expires
+TOKEN_LOCK_TIMEOUT = 60 # seconds; slack added to the scheduled refresh marker
+TOKEN_EXPIRY_FIELDS = {'ML': 'ml_token_expiry_date', 'SHOPEE': 'shopee_token_expiry_date'}
+TOKEN_REFRESH_FIELDS = {'ML': 'ml_refresh_token', 'SHOPEE': 'shopee_refresh_token'}
+
+# Commission rates per platform
+DEFAULT_COMMISSION_RATE = Decimal('0.16') # Default ML
+PLATFORM_COMMISSION_RATES = {
+    'SHOPEE': Decimal('0.14'), # Example Shopee rate
+}
+
+MARGIN_BULK_UPDATE_BATCH_SIZE = 1000
+
+CENTS = Decimal('0.01')
+
+# Columns written by the margin engine
+MARGIN_FIELDS = ['net_margin', 'tax_amount', 'commission_amount', 'cogs_amount', 'total_logistics']
+
+def _apply_margin(transaction: SaleTransaction, tax_rates, commission_rate):
     """
-    Calculates the Net Margin (Lucro Líquido) for a given transaction.
     Formula: Revenue - Adjusted COGS - Taxes - Commissions - Total Logistics
+    Sets net_margin and its breakdown columns on the transaction and returns net_margin.
+    tax_rates is the tax_engine.TaxRates resolved for the transaction.
     """
     revenue = transaction.amount
-    organization = transaction.organization
-    
-    # Placeholder COGS/Credits logic (as per previous steps)
-    cogs = Decimal('0.00')
+
+    # COGS is resolved from the line items at ingestion (ProductCost.net_cost, already net of
+    # the input tax credits, so no credits are deducted from the taxes again)
+    cogs = transaction.cogs_amount or Decimal('0.00')
     credits = Decimal('0.00')
-    
-    # Taxes
-    tax_profile = getattr(organization, 'tax_profile', None)
-    taxes = Decimal('0.00')
-    
-    if tax_profile:
-        if tax_profile.icms_benefit_flag:
-            taxes += revenue * (tax_profile.effective_tax_rate / 100)
-            taxes += revenue * Decimal('0.0925')
-        else:
-            standard_rate = Decimal('0.18') + Decimal('0.0925')
-            tax_liability = revenue * standard_rate
-            taxes = tax_liability - credits
-            if taxes < 0: taxes = 0
-
-    # Commissions (Platform)
-    commission_rate = Decimal('0.16') # Default ML
-    if transaction.platform == 'SHOPEE':
-        commission_rate = Decimal('0.14') # Example Shopee rate
-        
+
+    taxes = revenue * tax_rates.total
+    if tax_rates.deducts_credits:
+        taxes = taxes - credits
+        if taxes < 0: taxes = 0
+
     commission = revenue * commission_rate
 
     # Logistics
@@ -57,14 +67,58 @@ def calculate_net_margin(transaction: SaleTransaction):
         total_logistics = transaction.calculated_fixed_cost
     else:
         total_logistics = transaction.shipping_cost_platform + transaction.calculated_fixed_cost
-    
-    # Final Calculation
-    net_margin = revenue - cogs - taxes - commission - total_logistics
-    
-    transaction.net_margin = net_margin
+
+    # Rounded to the cent here (half away from zero, like a numeric(12,2) column), so the
+    # stored value and any in-memory aggregation are identical on every database backend.
+    # The net margin is rounded from the exact result, not from the rounded components.
+    transaction.tax_amount = Decimal(taxes).quantize(CENTS, rounding=ROUND_HALF_UP)
+    transaction.commission_amount = commission.quantize(CENTS, rounding=ROUND_HALF_UP)
+    transaction.cogs_amount = cogs.quantize(CENTS, rounding=ROUND_HALF_UP)
+    transaction.total_logistics = total_logistics
+    transaction.net_margin = (revenue - cogs - taxes - commission - total_logistics).quantize(CENTS, rounding=ROUND_HALF_UP)
+    return transaction.net_margin
+
+def calculate_net_margin(transaction: SaleTransaction):
+    """
+    Calculates the Net Margin (Lucro Líquido) for a given transaction.
+    Formula: Revenue - Adjusted COGS - Taxes - Commissions - Total Logistics
+    """
+    tax_profile = getattr(transaction.organization, 'tax_profile', None)
+    commission_rate = PLATFORM_COMMISSION_RATES.get(transaction.platform, DEFAULT_COMMISSION_RATE)
+
+    tax_rates = compile_tax_profile(tax_profile).rates_for(transaction.destination_uf)
+
+    net_margin = _apply_margin(transaction, tax_rates, commission_rate)
+
     transaction.save()
     return net_margin
 
+def compute_margins(transactions, save=True):
+    """
+    Batch version of calculate_net_margin.
+    Tax profiles are loaded once per organization (single query) and compiled by the tax
+    engine, so resolving the rates of a row is a dict lookup and the rest is plain Decimal math.
+    Results are written back with a single bulk_update when save=True.
+    """
+    transactions = list(transactions)
+    if not transactions:
+        return transactions
+
+    organization_ids = {t.organization_id for t in transactions}
+    compiled = {
+        profile.organization_id: compile_tax_profile(profile)
+        for profile in TaxProfile.objects.filter(organization_id__in=organization_ids)
+    }
+
+    for transaction in transactions:
+        tax_rates = compiled.get(transaction.organization_id, NO_TAX_PROFILE).rates_for(transaction.destination_uf)
+        commission_rate = PLATFORM_COMMISSION_RATES.get(transaction.platform, DEFAULT_COMMISSION_RATE)
+        _apply_margin(transaction, tax_rates, commission_rate)
+
+    if save:
+        SaleTransaction.objects.bulk_update(transactions, MARGIN_FIELDS, batch_size=MARGIN_BULK_UPDATE_BATCH_SIZE)
+    return transactions
+
 def send_alert_email(log_entry):
     """
     Sends an email alert for critical integration errors.
@@ -104,12 +158,14 @@ def refresh_ml_token(profile: IntegrationProfile):
     }
 
     try:
-        response = requests.post(ML_TOKEN_URL, data=data)
+        response = get_session().post(ML_TOKEN_URL, data=data)
         response.raise_for_status()
         token_data = response.json()
 
         profile.ml_access_token = token_data['access_token']
         profile.ml_refresh_token = token_data['refresh_token']
+        if token_data.get('user_id'):
+            profile.ml_user_id = str(token_data['user_id'])
         profile.ml_token_expiry_date = timezone.now() + timedelta(seconds=token_data['expires_in'])
         profile.save()
         logger.info(f"Token refreshed for {profile.organization.name}")
@@ -129,147 +185,99 @@ def refresh_ml_token(profile: IntegrationProfile):
         )
         send_alert_email(log)
 
-def fetch_and_process_ml_orders():
-    """
-    Fetches orders from Mercado Livre for all active profiles and processes them.
+def refresh_shopee_token(profile: IntegrationProfile):
     """
-    profiles = IntegrationProfile.objects.filter(ml_access_token__isnull=False)
-
-    for profile in profiles:
-        try:
-            refresh_ml_token(profile) # Ensure token is valid
-
-            headers = {'Authorization': f'Bearer {profile.ml_access_token}'}
-            
-            # 1. Search for orders (last 30 days for example, or since last sync)
-            # Simplified: Fetch recent orders
-            search_url = f"{ML_API_BASE}/orders/search?seller={profile.ml_client_id}&order.date_created.from=2023-01-01T00:00:00.000-00:00" 
-            # In prod, manage 'from' date dynamically
-            
-            response = requests.get(search_url, headers=headers)
-            response.raise_for_status()
-            orders_data = response.json()
-
-            for order in orders_data.get('results', []):
-                process_single_order(profile.organization, order)
-                
-        except Exception as e:
-            error_msg = f"Error fetching ML orders: {str(e)}"
-            logger.error(error_msg)
-            log = IntegrationErrorLog.objects.create(
-                organization=profile.organization,
-                platform='ML',
-                task_name='fetch_and_process_ml_orders',
-                error_message=error_msg
-            )
-            send_alert_email(log)
-
-# --- Shopee Processing ---
-
-def fetch_and_process_shopee_orders(tenant_profile: IntegrationProfile):
+    Refreshes the Shopee Access Token (valid for 4 hours).
     """
-    Fetches and processes Shopee orders for a specific tenant using ShopeeClient.
-    """
-    if not tenant_profile.shopee_access_token or not tenant_profile.shopee_shop_id:
-        logger.warning(f"Shopee credentials missing for {tenant_profile.organization.name}")
+    if not profile.shopee_refresh_token or not profile.shopee_partner_id or not profile.shopee_shop_id:
         return
 
-    client = ShopeeClient(
-        partner_id=tenant_profile.shopee_partner_id,
-        partner_key=tenant_profile.shopee_partner_key,
-        access_token=tenant_profile.shopee_access_token,
-        shop_id=tenant_profile.shopee_shop_id
-    )
-
-    # Time range: Last 15 days
-    time_to = int(time.time())
-    time_from = time_to - (15 * 24 * 3600)
+    path = "/auth/access_token/get"
 
     try:
-        # 1. Get Order List
-        resp = client.get_order_list(time_from, time_to)
-        if resp.get('error'):
-            error_msg = f"Shopee API Error: {resp.get('message')}"
-            logger.error(error_msg)
-            log = IntegrationErrorLog.objects.create(
-                organization=tenant_profile.organization,
-                platform='SHOPEE',
-                task_name='fetch_and_process_shopee_orders',
-                error_message=error_msg
-            )
-            send_alert_email(log)
-            return
+        body = {
+            "refresh_token": profile.shopee_refresh_token,
+            "partner_id": int(profile.shopee_partner_id),
+            "shop_id": int(profile.shopee_shop_id)
+        }
+        client = ShopeeClient(profile.shopee_partner_id, profile.shopee_partner_key)
+        sign, timestamp = client._generate_signature(path)
+        url = f"{SHOPEE_API_URL}{path}?partner_id={profile.shopee_partner_id}&timestamp={timestamp}&sign={sign}"
 
-        order_list = resp.get('response', {}).get('order_list', [])
-        order_sn_list = [o['order_sn'] for o in order_list]
+        resp = get_session().post(url, json=body)
+        resp.raise_for_status()
+        data = resp.json()
 
-        if not order_sn_list:
+        if data.get('error'):
+            error_msg = f"Shopee Refresh Error for {profile.organization.name}: {data.get('message')}"
+            log_integration_error(profile.organization, 'SHOPEE', 'refresh_shopee_token', error_msg)
             return
 
-        # 2. Get Order Details (Batch)
-        details_resp = client.get_order_detail(order_sn_list)
-        orders_details = details_resp.get('response', {}).get('order_list', [])
-
-        for order_data in orders_details:
-            process_shopee_single_order(tenant_profile.organization, order_data)
+        profile.shopee_access_token = data['access_token']
+        profile.shopee_refresh_token = data['refresh_token']
+        profile.shopee_token_expiry_date = timezone.now() + timedelta(seconds=data.get('expire_in', 14400))
+        profile.save()
+        logger.info(f"Shopee Token Refreshed for {profile.organization.name}")
 
     except Exception as e:
-        error_msg = f"Error processing Shopee orders: {e}"
-        logger.error(error_msg)
-        log = IntegrationErrorLog.objects.create(
-            organization=tenant_profile.organization,
-            platform='SHOPEE',
-            task_name='fetch_and_process_shopee_orders',
-            error_message=error_msg
-        )
-        send_alert_email(log)
+        log_integration_error(profile.organization, 'SHOPEE', 'refresh_shopee_token', f"Error refreshing Shopee token: {e}")
+
+def token_expiring(profile, platform, lead=TOKEN_REFRESH_LEAD):
+    expiry = getattr(profile, TOKEN_EXPIRY_FIELDS[platform])
+    return expiry is None or expiry <= timezone.now() + lead
 
-def process_shopee_single_order(organization, order_data):
+def ensure_fresh_token(profile: IntegrationProfile, platform):
     """
-    Maps Shopee order data to SaleTransaction and applies logic.
+    Refreshes the platform token if it is about to expire, once across all workers:
+    the IntegrationProfile row is locked (SELECT ... FOR UPDATE) while refreshing, so concurrent
+    callers wait for the first one and then see the new token instead of spending the
+    single-use refresh token again.
     """
-    order_sn = order_data['order_sn']
-    amount = Decimal(order_data['total_amount'])
-    create_time = timezone.datetime.fromtimestamp(order_data['create_time'], tz=timezone.utc)
-    
-    # Logistics Mapping
-    shipping_carrier = order_data.get('shipping_carrier', 'Standard')
-    actual_shipping_fee = Decimal(order_data.get('actual_shipping_fee', 0))
-    
-    # Logic: Check Fixed Cost
-    fixed_cost = Decimal('0.00')
-    is_fixed_applied = False
-    
-    try:
-        cost_rule = LogisticsCostTable.objects.get(
-            organization=organization, 
-            platform='SHOPEE', 
-            shipping_method=shipping_carrier
-        )
-        fixed_cost = cost_rule.fixed_cost_value
-        # If we found a rule, we assume it applies. 
-        # Prompt 11B: "zerando o shipping_cost_platform ... quando o is_fixed_cost_applied for TRUE"
-        # This logic is handled in calculate_net_margin, but we must set the flag here.
-        if fixed_cost > 0: # Or just if rule exists? Prompt says "applying... calculated_fixed_cost... when... TRUE"
-            is_fixed_applied = True
-            
-    except LogisticsCostTable.DoesNotExist:
-        pass
-
-    # Save Transaction
-    transaction, created = SaleTransaction.objects.get_or_create(
+    if not getattr(profile, TOKEN_REFRESH_FIELDS[platform]) or not token_expiring(profile, platform):
+        return
+
+    with db_transaction.atomic():
+        locked = IntegrationProfile.objects.select_for_update().select_related('organization').get(pk=profile.pk)
+        if token_expiring(locked, platform): # Another worker may have refreshed it while we waited
+            refresh = refresh_ml_token if platform == 'ML' else refresh_shopee_token
+            refresh(locked)
+    profile.refresh_from_db()
+
+def get_sync_since(organization, platform, default):
+    """
+    Returns the datetime the next collection run should start from.
+    """
+    cursor = SyncCursor.objects.filter(organization=organization, platform=platform).first()
+    if cursor is None or cursor.last_synced_at is None:
+        return default
+    return cursor.last_synced_at - SYNC_OVERLAP
+
+def advance_sync_cursor(organization, platform, synced_at):
+    """
+    Moves the sync watermark forward. Must be called only after the batch up to 'synced_at' is committed.
+    """
+    cursor, created = SyncCursor.objects.get_or_create(organization=organization, platform=platform)
+    if cursor.last_synced_at is None or synced_at > cursor.last_synced_at:
+        cursor.last_synced_at = synced_at
+        cursor.save(update_fields=['last_synced_at', 'updated_at'])
+
+def cache_is_shared():
+    """
+    False for the per-process LocMemCache (the default without CACHE_URL), whose entries other
+    processes (Celery workers) never see.
+    """
+    return 'locmem' not in settings.CACHES['default']['BACKEND'].lower()
+
+def log_integration_error(organization, platform, task_name, error_msg):
+    """
+    Logs an integration failure to IntegrationErrorLog and alerts the admins.
+    """
+    logger.error(error_msg)
+    log = IntegrationErrorLog.objects.create(
         organization=organization,
-        external_id=order_sn,
-        platform='SHOPEE',
-        defaults={
-            'amount': amount,
-            'transaction_date': create_time,
-            'transaction_shipping_method': shipping_carrier,
-            'shipping_cost_platform': actual_shipping_fee,
-            'calculated_fixed_cost': fixed_cost,
-            'is_fixed_cost_applied': is_fixed_applied
-        }
+        platform=platform,
+        task_name=task_name,
+        error_message=error_msg
     )
-    
-    # Calculate Margin
-    calculate_net_margin(transaction)
+    send_alert_email(log)
+    return log
@@ -5,11 +5,11 @@ from django.shortcuts import redirect
 from django.conf import settings
 from django.utils import timezone
 from datetime import timedelta
-import requests
 from .models import Organization, TaxProfile, ProductCost, IntegrationProfile
 from .serializers import OrganizationSerializer, TaxProfileSerializer, ProductCostSerializer
 from .utils import ML_AUTH_URL, ML_TOKEN_URL
 from .shopee_utils import sign_shopee_request, SHOPEE_API_URL
+from .marketplace_http import get_session
 
 class OrganizationViewSet(viewsets.ModelViewSet):
     queryset = Organization.objects.all()
@@ -92,12 +92,14 @@ class MLAuthCallbackView(APIView):
         }
         
         try:
-            response = requests.post(ML_TOKEN_URL, data=payload)
+            response = get_session().post(ML_TOKEN_URL, data=payload)
             response.raise_for_status()
             data = response.json()
             
             profile.ml_access_token = data['access_token']
             profile.ml_refresh_token = data['refresh_token']
+            if data.get('user_id'):
+                profile.ml_user_id = str(data['user_id'])
             expires_in = data.get('expires_in', 21600)
             profile.ml_token_expiry_date = timezone.now() + timedelta(seconds=expires_in)
             profile.save()
@@ -163,7 +165,7 @@ class ShopeeAuthCallbackView(APIView):
         url = f"{SHOPEE_API_URL}{path}?partner_id={profile.shopee_partner_id}&timestamp={timestamp}&sign={sign}"
         
         try:
-            resp = requests.post(url, json=body)
+            resp = get_session().post(url, json=body)
             resp.raise_for_status()
             data = resp.json()
             
@@ -173,6 +175,7 @@ class ShopeeAuthCallbackView(APIView):
             profile.shopee_access_token = data['access_token']
             profile.shopee_refresh_token = data['refresh_token']
             profile.shopee_shop_id = str(shop_id)
+            profile.shopee_token_expiry_date = timezone.now() + timedelta(seconds=data.get('expire_in', 14400))
             profile.save()
             
             return Response({"message": "Shopee Auth Successful!"})
@@ -5,7 +5,8 @@ const ProfitabilityDashboard = ({ organizationId }) => {
     const [filters, setFilters] = useState({
         startDate: '2023-01-01',
         endDate: '2023-12-31',
-        platform: 'ALL'
+        platform: 'ALL',
+        granularity: 'auto'
     });
     const [data, setData] = useState(null);
     const [loading, setLoading] = useState(false);
@@ -21,10 +22,12 @@ const ProfitabilityDashboard = ({ organizationId }) => {
                 organization_id: organizationId,
                 start_date: filters.startDate,
                 end_date: filters.endDate,
-                platform: filters.platform
+                platform: filters.platform,
+                granularity: filters.granularity
             }).toString();
 
-            const response = await fetch(`/api/v1/analytics/net-margin/?${query}`);
+            // Revalidates with If-None-Match; unchanged data comes back as a 304 served from the browser cache
+            const response = await fetch(`/api/v1/analytics/net-margin/?${query}`, { cache: 'no-cache' });
             const result = await response.json();
             setData(result);
         } catch (error) {
@@ -41,6 +44,19 @@ const ProfitabilityDashboard = ({ organizationId }) => {
     if (loading) return <div>Loading Analytics...</div>;
     if (!data) return <div>No Data</div>;
 
+    // The chart arrives as parallel arrays: dates[i] with series[platform].net_margin[i]
+    const platforms = Object.keys(data.chart.series);
+    const chartData = data.chart.dates.map((date, i) => {
+        const point = { date, net_margin: 0 };
+        platforms.forEach((platform) => {
+            point[platform] = data.chart.series[platform].net_margin[i];
+            point.net_margin += data.chart.series[platform].net_margin[i];
+        });
+        return point;
+    });
+    const platformColors = { ML: '#f5b400', SHOPEE: '#ee4d2d' };
+    const chartTitles = { day: 'Daily', week: 'Weekly', month: 'Monthly' };
+
     return (
         <div className="p-6 bg-gray-50 min-h-screen">
             <h1 className="text-2xl font-bold mb-6">Profitability Dashboard</h1>
@@ -71,33 +87,42 @@ const ProfitabilityDashboard = ({ organizationId }) => {
                     <option value="ML">Mercado Livre</option>
                     <option value="SHOPEE">Shopee</option>
                 </select>
+                <select
+                    name="granularity"
+                    value={filters.granularity}
+                    onChange={handleFilterChange}
+                    className="border p-2 rounded"
+                >
+                    <option value="auto">Auto</option>
+                    <option value="day">Day</option>
+                    <option value="week">Week</option>
+                    <option value="month">Month</option>
+                </select>
             </div>
 
             {/* KPIs */}
             <div className="grid grid-cols-1 md:grid-cols-4 gap-6 mb-8">
                 <KpiCard title="Total Revenue" value={data.kpis.revenue} prefix="R$" />
-                <KpiCard title="Total Costs (Est.)" value={data.kpis.total_costs} prefix="R$" />
+                <KpiCard title="Total Costs" value={data.kpis.total_costs} prefix="R$" />
                 <KpiCard title="Net Margin" value={data.kpis.net_margin} prefix="R$" color="text-green-600" />
                 <KpiCard title="Margin %" value={data.kpis.margin_percentage} suffix="%" />
             </div>
 
             {/* Chart */}
             <div className="bg-white p-6 rounded shadow">
-                <h2 className="text-xl font-semibold mb-4">Daily Net Margin Evolution</h2>
+                <h2 className="text-xl font-semibold mb-4">{chartTitles[data.chart.granularity]} Net Margin Evolution</h2>
                 <div className="h-96">
                     <ResponsiveContainer width="100%" height="100%">
-                        <LineChart data={data.daily_chart}>
+                        <LineChart data={chartData}>
                             <CartesianGrid strokeDasharray="3 3" />
                             <XAxis dataKey="date" />
                             <YAxis />
                             <Tooltip />
                             <Legend />
                             <Line type="monotone" dataKey="net_margin" stroke="#8884d8" name="Net Margin" />
-                            {/* Note: If we want multiple lines for platforms, we'd need to restructure data or use multiple Lines filtering by payload, 
-                  but for now a single line or simple aggregation is fine for the prompt's 'comparison' requirement 
-                  we might need to pivot the data in backend or frontend. 
-                  For simplicity, this plots the total margin per day. 
-              */}
+                            {platforms.length > 1 && platforms.map((platform) => (
+                                <Line key={platform} type="monotone" dataKey={platform} stroke={platformColors[platform]} name={platform} />
+                            ))}
                         </LineChart>
                     </ResponsiveContainer>
                 </div>
@@ -71,10 +71,16 @@ const TaxSimulationPanel = ({ transactionIds }) => {
 
                     {results && (
                         <div className="space-y-2">
-                            <h4 className="font-semibold text-sm">Results ({results.length} items)</h4>
+                            <h4 className="font-semibold text-sm">Results ({results.totals.transaction_count} items)</h4>
                             <div className="text-xs text-gray-600">
                                 Comparing Current vs {regime}
                             </div>
+                            <div className="text-sm">
+                                Total: R$ {parseFloat(results.totals.current_margin).toFixed(2)} → R$ {parseFloat(results.totals.simulated_margin).toFixed(2)}
+                                <span className={`ml-2 font-bold ${results.totals.diff >= 0 ? 'text-green-600' : 'text-red-600'}`}>
+                                    ({results.totals.diff >= 0 ? '+' : ''}{parseFloat(results.totals.diff).toFixed(2)})
+                                </span>
+                            </div>
                             <div className="max-h-60 overflow-y-auto">
                                 <table className="w-full text-xs text-left">
                                     <thead>
@@ -86,7 +92,7 @@ const TaxSimulationPanel = ({ transactionIds }) => {
                                         </tr>
                                     </thead>
                                     <tbody>
-                                        {results.map((res) => (
+                                        {results.transactions.map((res) => (
                                             <tr key={res.transaction_id} className="border-b">
                                                 <td className="py-1">{res.external_id}</td>
                                                 <td className="py-1">R$ {parseFloat(res.current_margin).toFixed(2)}</td>
@@ -14,7 +14,7 @@ python manage.py migrate
 
 # 2. Start Celery Worker (Background)
 echo "Starting Celery Worker..."
-celery -A ecommerce_tax_saas worker -l info --detach --pidfile=worker.pid --logfile=worker.log
+celery -A ecommerce_tax_saas worker -Q celery,ingestion,simulation -l info --detach --pidfile=worker.pid --logfile=worker.log
 
 # 3. Start Celery Beat (Background)
 echo "Starting Celery Beat..."